@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Times the hillshade kernels, precisions and backends on a large synthetic DEM.
+
+The fast_hillshade extension has to be built for the cython timings
+(pip install cython numpy; pip install --no-build-isolation .)
+
+Usage:
+    python benchmarks/benchmark_hillshade.py -n 8000 -repeats 3
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from lsdviztools.lsdplottingtools import lsdmap_hillshade as LSDMap_HS
+
+
+def make_dem(n_rows, n_cols, resolution):
+    """A smooth, hilly synthetic DEM with some noise on it."""
+    x = np.arange(n_cols)*resolution
+    y = np.arange(n_rows)*resolution
+    X, Y = np.meshgrid(x, y)
+    dem = 500 + 200*np.sin(X/3000.0)*np.cos(Y/2000.0) + 50*np.sin(X/300.0 + Y/500.0)
+    dem += np.random.RandomState(42).normal(0, 1, dem.shape)
+    return dem
+
+
+def time_it(function, repeats):
+    """Returns the fastest of a number of runs, in seconds."""
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--n_pixels", type=int, default=8000, help="The DEM is n by n pixels")
+    parser.add_argument("-res", "--resolution", type=float, default=1.0, help="The pixel size")
+    parser.add_argument("-repeats", "--repeats", type=int, default=3, help="The number of runs of each backend (the fastest is reported)")
+    args = parser.parse_args()
+
+    n_threads = multiprocessing.cpu_count()
+    print("Making a "+str(args.n_pixels)+" x "+str(args.n_pixels)+" DEM")
+    dem = make_dem(args.n_pixels, args.n_pixels, args.resolution)
+
+    timings = []
+    for method in ["zevenbergen_thorne", "horn"]:
+        for dtype in [np.float64, np.float32]:
+            timings.append(("numpy "+method+" "+np.dtype(dtype).name,
+                            time_it(lambda: LSDMap_HS.HillshadeArray(dem, args.resolution, method=method, dtype=dtype), args.repeats)))
+    timings.append(("numpy multidirectional float64",
+                    time_it(lambda: LSDMap_HS.HillshadeArray(dem, args.resolution, multidirectional=True), args.repeats)))
+
+    if LSDMap_HS.fast_hillshade is None:
+        print("The fast_hillshade extension is not built, so I can only time the numpy backend.")
+    else:
+        for method in ["zevenbergen_thorne", "horn"]:
+            timings.append(("cython "+method+", 1 thread",
+                            time_it(lambda: LSDMap_HS.fast_hillshade.Hillshade(dem, args.resolution, num_threads=1, method=method), args.repeats)))
+            timings.append(("cython "+method+", "+str(n_threads)+" threads",
+                            time_it(lambda: LSDMap_HS.fast_hillshade.Hillshade(dem, args.resolution, num_threads=n_threads, method=method), args.repeats)))
+
+            # the two backends should agree
+            hs_numpy = LSDMap_HS.HillshadeArray(dem, args.resolution, method=method)
+            hs_cython = LSDMap_HS.HillshadeArray(dem, args.resolution, method=method, backend="cython")
+            print("Largest difference between numpy and cython "+method+" hillshades: " +
+                  str(np.nanmax(np.abs(hs_numpy - hs_cython))))
+
+    baseline = timings[0][1]
+    print("")
+    print("%-36s %10s %10s" % ("backend", "seconds", "speedup"))
+    for name, seconds in timings:
+        print("%-36s %10.3f %10.2f" % (name, seconds, baseline/seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ import cartopy.feature as cfeature
 from cartopy.feature import ShapelyFeature
 import cartopy.io.shapereader as shpreader
 from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMGDAL
+from lsdviztools.lsdplottingtools import lsdmap_hillshade as LSDMHS
 from cartopy.mpl.ticker import (LongitudeFormatter, LatitudeFormatter,
                                 LatitudeLocator, LongitudeLocator)
 import matplotlib.pyplot as plt
@@ -35,16 +36,26 @@ from osgeo import gdal
 from lsdviztools.lsdbasemaptools import lsdmap_otgrabber as otg
 
 
-def zevenbergen_thorne_hillshade(dem_dataset, azimuth=315, angle_altitude=45, vert_exag=1):
+def zevenbergen_thorne_hillshade(dem_dataset, azimuth=315, angle_altitude=45, vert_exag=1, backend="numpy", multidirectional=False):
+    """
+    Makes a hillshade GeoTIFF (hillshade_zevenbergen_thorne.tif) of a gdal dataset.
+
+    Args:
+        dem_dataset (gdal dataset): the DEM
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        vert_exag (float): vertical exaggeration
+        backend (str): "numpy" or "cython". cython does the same hillshade in the multithreaded fast_hillshade
+            extension, and falls back to numpy if the extension isn't built.
+        multidirectional (bool): If True blend the hillshades from several azimuths
+
+    Returns: the hillshade gdal dataset
+    """
     dem = dem_dataset.ReadAsArray() * vert_exag
     dem[dem < 0] = -10  # Below sea level gets a flat plane
-    x, y = np.gradient(dem)
-    slope = np.pi/2. - np.arctan(np.sqrt(x*x + y*y))
-    aspect = np.arctan2(-x, y)
-    azimuthrad = azimuth * np.pi / 180.
-    altituderad = angle_altitude * np.pi / 180.
-    shaded = np.sin(altituderad) * np.sin(slope) + np.cos(altituderad) * np.cos(slope) * np.cos(azimuthrad - aspect)
-    hillshade = 255 * (shaded + 1) / 2
+    hillshade = LSDMHS.HillshadeArray(dem, 1.0, azimuth=azimuth, angle_altitude=angle_altitude, backend=backend,
+                                      multidirectional=multidirectional, NoDataValue=None, mask_negative=False)
+    hillshade[np.isnan(hillshade)] = 0
 
     # Create an output dataset
     driver = gdal.GetDriverByName('GTiff')
@@ -391,6 +402,7 @@ def GenerateBasemapImageHillshade(DataDirectory, RasterFile, your_OT_api_key_fil
     fname,f_path,f_without_path = basemap_DEM.download_pythonic()
     
     #fname = "/home/smudd/SMMDataStore/Git_projects/lsdviztools/basemap_SRTM15Plus.tif"
+    LSDMGDAL.RecordFileRead(fname)
     dem_dataset = gdal.Open(fname)   
    
     hillshade_DEM = zevenbergen_thorne_hillshade(dem_dataset, azimuth=315, angle_altitude=45, vert_exag = 0.01)
@@ -8,4 +8,5 @@ Created on Fri Oct 30 10:37:16 2015
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from .plottinghelpers import *
-from .plottingraster import *
\ No newline at end of file
+from .plottingraster import *
+from .webtiles import *
\ No newline at end of file
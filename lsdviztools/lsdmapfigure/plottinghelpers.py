@@ -370,6 +370,39 @@ def GetTicksForUTMNoInversion(FileName,x_max,x_min,y_max,y_min,n_target_tics):
     return new_xlocs,new_ylocs,x_labels,y_labels
 #==============================================================================
 
+#==============================================================================
+# The attributes of the matplotlib normalisations (as well as the limits) that change what they do
+_NormParameters = ["gamma", "vcenter", "halfrange", "linthresh", "linscale", "base", "boundaries", "ncolors", "extend"]
+
+def GetNormKey(norm):
+    """
+    Gets a key that describes a matplotlib normalisation by its class and its parameters: the limits and
+    clipping, and the gamma of a PowerNorm, the centre of a TwoSlopeNorm, the boundaries of a BoundaryNorm, etc.
+    Two normalisations with the same key colour a raster the same way, so it is used to key cached images.
+
+    Args:
+        norm (matplotlib.colors.Normalize): The normalisation
+
+    Returns:
+        tuple: the key, which can be hashed
+    """
+    def hashable(value):
+        # numpy arrays and scalars are turned into python lists and numbers
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        if isinstance(value, list):
+            value = tuple(hashable(item) for item in value)
+        return value
+
+    parameters = [type(norm).__module__+"."+type(norm).__qualname__, hashable(norm.vmin), hashable(norm.vmax), norm.clip]
+    for name in _NormParameters:
+        try:
+            parameters.append((name, hashable(getattr(norm, name))))
+        except AttributeError:
+            pass
+    return tuple(parameters)
+#==============================================================================
+
 
 #=============================================================================
 # CSV READERS
@@ -1069,7 +1102,11 @@ def read_terrace_shapefile(DataDirectory, shapefile_name):
 
     Author: FJC
     """
+    # imported here since lsdplottingtools imports this module
+    from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+
     Polygons = {}
+    LSDMap_IO.RecordFileRead(DataDirectory+shapefile_name)
     with fiona.open(DataDirectory+shapefile_name, 'r') as input:
         for f in input:
             this_shape = Polygon(shape(f['geometry']))
@@ -1091,7 +1128,11 @@ def read_terrace_centrelines(DataDirectory, shapefile_name):
 
     Author: FJC
     """
+    # imported here since lsdplottingtools imports this module
+    from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+
     Lines = {}
+    LSDMap_IO.RecordFileRead(DataDirectory+shapefile_name)
     with fiona.open(DataDirectory+shapefile_name, 'r') as input:
         for f in input:
             this_line = LineString(shape(f['geometry']))
@@ -18,6 +18,7 @@ This software is released under the Artistic Licence v2.0
 # LSDPlottingTools must be in your pythonpath
 from lsdviztools import lsdplottingtools as LSDP
 from . import plottinghelpers as phelp
+from . import webtiles
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.cm as _cm
@@ -26,6 +27,9 @@ import matplotlib.lines as mlines
 from matplotlib import colors
 import matplotlib.axes
 import numpy as np
+import copy
+import itertools
+import os
 from matplotlib import ticker
 from matplotlib import rcParams
 from matplotlib.path import Path
@@ -33,6 +37,136 @@ from matplotlib.patches import PathPatch
 import geopandas as gpd
 
 
+# If this is True, ENVI .bil rasters are read with numpy.memmap. The parallel figure jobs switch it on so the
+# processes share the rasters through the page cache. Unlike NFF_opti, you get exactly what gdal would read:
+# there is no nodata if the header doesn't give one, and rasters with a .aux.xml file are left to gdal.
+_MemmapBilRasters = False
+
+def SetMemmapRasters(use_memmap = True):
+    """
+    Sets whether every BaseRaster of an ENVI .bil file is memory mapped. The arrays are the same as the ones gdal reads.
+
+    Args:
+        use_memmap (bool): If true, memory map the .bil rasters
+    """
+    global _MemmapBilRasters
+    _MemmapBilRasters = use_memmap
+
+
+# Gives a unique number to every array that is set directly on a BaseRaster
+_ArrayVersions = itertools.count()
+
+
+class RasterStats(object):
+    """
+    The statistics of a raster array. The minimum, maximum, mean and number of valid (not nan)
+    pixels are worked out in one pass over the array, a block of rows at a time. The histogram,
+    unique values and percentiles are only worked out if they are asked for, and are then kept.
+    Get these from BaseRaster.stats, which makes a new one when the array changes.
+
+    Args:
+        array (numpy.array): The raster array
+        block_pixels (int): About how many pixels to look at at once
+        sample_size (int): The number of pixels sampled for the percentiles
+    """
+    def __init__(self, array, block_pixels = 2**20, sample_size = 2**20):
+        self._array = array
+        self._block_rows = max(1, block_pixels // max(1, array.shape[-1]))
+        self._sample_size = sample_size
+        self._unique = None
+        self._sample = None
+        self._histograms = {}
+
+        zmin = None
+        zmax = None
+        total = 0.0
+        count = 0
+        for valid in self._valid_blocks():
+            if zmin is None:
+                zmin = valid.min()
+                zmax = valid.max()
+            else:
+                zmin = min(zmin, valid.min())
+                zmax = max(zmax, valid.max())
+            total += valid.sum(dtype = np.float64)
+            count += valid.size
+
+        self.count = count
+        if count == 0:
+            self.min = np.nan
+            self.max = np.nan
+            self.mean = np.nan
+        else:
+            self.min = zmin
+            self.max = zmax
+            self.mean = total/count
+
+    def _valid_blocks(self):
+        """
+        Goes through the array a block of rows at a time, giving the values that aren't nan.
+        """
+        for row in range(0, self._array.shape[0], self._block_rows):
+            block = self._array[row:row+self._block_rows]
+            valid = block[~np.isnan(block)]
+            if valid.size > 0:
+                yield valid
+
+    @property
+    def unique(self):
+        """
+        The unique values in the raster, not counting nan.
+        """
+        if self._unique is None:
+            if self.count == 0:
+                self._unique = np.array([], dtype = self._array.dtype)
+            else:
+                self._unique = np.unique(np.concatenate([np.unique(valid) for valid in self._valid_blocks()]))
+        return self._unique
+
+    def histogram(self, bins = 256):
+        """
+        The histogram of the raster between its minimum and maximum.
+
+        Args:
+            bins (int): The number of bins
+
+        Returns:
+            counts (numpy.array): The number of pixels in each bin
+            edges (numpy.array): The edges of the bins
+        """
+        if bins not in self._histograms:
+            if self.count == 0:
+                edges = np.linspace(0, 1, bins+1)
+            else:
+                edges = np.histogram_bin_edges([self.min, self.max], bins = bins)
+            counts = np.zeros(bins, dtype = np.int64)
+            for valid in self._valid_blocks():
+                counts += np.histogram(valid, bins = edges)[0]
+            self._histograms[bins] = (counts, edges)
+        return self._histograms[bins]
+
+    def percentile(self, q):
+        """
+        The percentile(s) of the raster. For big rasters these are estimated from an
+        evenly spaced sample of sample_size pixels, which is plenty for a colour stretch.
+
+        Args:
+            q (float or list): The percentile(s), from 0 to 100
+
+        Returns:
+            The percentile(s)
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)
+        if self._sample is None:
+            step = max(1, int(np.sqrt(self._array.size / self._sample_size)))
+            sample = self._array[::step,::step]
+            self._sample = sample[~np.isnan(sample)]
+            if self._sample.size == 0:
+                self._sample = np.array([self.min, self.max])
+        return np.percentile(self._sample, q)
+
+
 class BaseRaster(object):
     """
     Class BaseRaster represents the data associated with the basic rasters
@@ -42,24 +176,74 @@ class BaseRaster(object):
     Args:
         RasterName (str): The name of the rasters (with extension). It is read by gdal so should cope with mulitple formats
         Directory (str): The path to the raster. Needs to have the trailing slash
-        NFF_opti (bool): experimental test of reading raster using numpy.fromfile() which a super efficient binary reader
+        NFF_opti (bool): read ENVI .bil rasters with numpy.memmap. The raster is only converted to floats when the array is first used.
+            Decimated rasters (see pixel_budget) are read with gdal.
+        alpha (float): The transparency of the raster
+        custom_extent (list): [xmin,xmax,ymin,ymax]. If given, only the part of the raster inside this box is read
+        pixel_budget (int): The number of pixels across the final image (figure width in inches x dpi). If the raster is
+            much wider than this a decimated version is read. None reads the full resolution.
+        resample (str): How to decimate: "nearest" (safe for categorical data) or "average"
 
     Author: DAV and SMM
     """
-    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1):
+    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1, custom_extent = None, pixel_budget = None, resample = "nearest"):
 
         self._RasterFileName = RasterName
         self._RasterDirectory = Directory
         self._FullPathRaster = self._RasterDirectory + self._RasterFileName
 
+        # A record of the changes made to the array. Copies of the raster share the cache of
+        # colour mapped images, which are looked up by this history so modified copies don't get the wrong image.
+        self._ArrayHistory = ()
+        self._RGBACache = {}
+        self._Stats = None
+        # NFF_opti has always used -9999 as the nodata value if the header doesn't give one, gdal uses none
+        default_nodata = -9999
+        if (_MemmapBilRasters and self._FullPathRaster.endswith(".bil")
+                and not os.path.exists(self._FullPathRaster+".aux.xml")):
+            NFF_opti = True
+            default_nodata = None
+
         # I think the BaseRaster should contain a numpy array of the Raster
+        # With NFF_opti the file is only mapped here; the float array is made the first time it is needed
+        self._RasterMemmap = None
+        self._NoDataValue = None
+        self._LoadedArray = None
+
+        # If there is a custom extent we only read the window of the raster that overlaps it
+        if custom_extent is None:
+            self._RasterWindow = None
+            self._RasterExtents = LSDP.GetRasterExtent(self._FullPathRaster)
+        else:
+            self._RasterWindow, self._RasterExtents = LSDP.GetRasterWindowFromExtent(self._FullPathRaster, custom_extent)
+
         if(NFF_opti):
-            self._RasterArray = LSDP.ReadRasterArrayBlocks_numpy(self._FullPathRaster)
+            self._RasterMemmap, self._NoDataValue = LSDP.ReadRasterArrayMemmap(self._FullPathRaster, default_nodata = default_nodata)
+            n_rows,n_cols = self._RasterMemmap.shape
+        else:
+            NDV, n_cols, n_rows, GeoT, Projection, DataType = LSDP.GetGeoInfo(self._FullPathRaster)
+        if self._RasterWindow is not None:
+            n_cols = self._RasterWindow[2]
+            n_rows = self._RasterWindow[3]
+
+        # If there are many more pixels than will be drawn, we read a decimated raster
+        self._Decimation, out_shape = LSDP.GetDecimationForPixelBudget(n_cols, n_rows, pixel_budget)
+        if self._Decimation > 1:
+            print("I am reading a version of the raster decimated by a factor of "+str(self._Decimation))
+            # gdal only reads the rows it needs for this, and picks the pixels its own way, so decimated
+            # rasters are read by gdal even if they are memory mapped
+            self._RasterMemmap = None
+            self._NoDataValue = None
         else:
-            self._RasterArray = LSDP.ReadRasterArrayBlocks(self._FullPathRaster)
+            out_shape = None
 
-        # Get the extents as a list
-        self._RasterExtents = LSDP.GetRasterExtent(self._FullPathRaster)
+        if self._RasterMemmap is None:
+            # This is read-only (it may be shared through the raster cache); it is copied the first time it is changed
+            self._LoadedArray = LSDP.ReadRasterArrayBlocks(self._FullPathRaster, window = self._RasterWindow,
+                                                           out_shape = out_shape, resample = resample,
+                                                           dtype = np.float32, read_only = True)
+
+        # Get the aspect ratio from the extents
         self._RasterAspectRatio = (self._RasterExtents[1]-self._RasterExtents[0])/(self._RasterExtents[3]-self._RasterExtents[2])
 
         # set the default colourmap
@@ -72,10 +256,97 @@ class BaseRaster(object):
         self._EPSGString = LSDP.LSDMap_IO.GetUTMEPSG(self._FullPathRaster)
         print("The EPSGString is: "+ self._EPSGString)
 
+    @property
+    def _RasterArray(self):
+        if self._LoadedArray is None and self._RasterMemmap is not None:
+            self._LoadedArray = LSDP.MemmapWindowToArray(self._RasterMemmap, self._NoDataValue, window = self._RasterWindow)
+        return self._LoadedArray
+
+    @_RasterArray.setter
+    def _RasterArray(self, value):
+        self._LoadedArray = value
+        self._record_change("set", next(_ArrayVersions))
+
+    def _writeable_array(self):
+        """
+        Gets the raster array so you can change it. The array may be read-only (shared with the
+        raster cache or with copies of this raster), in which case it is copied the first time.
+        """
+        A = self._RasterArray
+        if A is not None and not A.flags.writeable:
+            A = A.copy()
+            self._LoadedArray = A
+        return A
+
+    def _record_change(self, *change):
+        """
+        Records a change to the raster array. Call this whenever the array is modified.
+        """
+        self._ArrayHistory = self._ArrayHistory + (change,)
+
+    def _can_replay_changes(self):
+        """
+        Checks if the changes made to the array can be made again to another array
+        (they can't if the array has been set directly).
+        """
+        return all(change[0] != "set" for change in self._ArrayHistory)
+
+    def _replay_changes(self, array):
+        """
+        Makes the changes that have been made to the raster array to another array of the
+        same raster, e.g., a window of it read at a different resolution for a web tile.
+
+        Args:
+            array (numpy.array): A float array. It is modified in place.
+
+        Returns:
+            The changed array
+        """
+        for change in self._ArrayHistory:
+            kind = change[0]
+            if kind == "mask_low":
+                array[array < change[1]] = np.nan
+            elif kind == "mask_high":
+                # the same test as mask_high_values
+                array[array < change[1]] = np.nan
+            elif kind == "mask_middle":
+                array[np.logical_and(array > change[1][0], array < change[1][1])] = np.nan
+            elif kind == "replace":
+                LSDP.RemapRasterValues(array, change[1], change[2])
+            elif kind == "clip":
+                array[array < change[1]] = change[1]
+                array[array > change[2]] = change[2]
+            elif kind == "purge":
+                array[array < change[1]] = np.nan
+                array[array > change[2]] = np.nan
+            else:
+                raise Exception("I can't repeat the change "+str(kind)+" on another array")
+        return array
+
+    @property
+    def stats(self):
+        """
+        The RasterStats of the raster array. They are only worked out again if the array has changed.
+        """
+        if self._Stats is None or self._Stats[0] != self._ArrayHistory:
+            self._Stats = (self._ArrayHistory, RasterStats(self._RasterArray))
+        return self._Stats[1]
+
     @property
     def extents(self):
         return self._RasterExtents
 
+    def copy(self):
+        """
+        Returns a new BaseRaster of the same raster without reading it again.
+        The two share the array until one of them changes it (see _writeable_array),
+        so you can modify one without changing the other and copies cost no memory until then.
+        """
+        new_raster = copy.copy(self)
+        if self._LoadedArray is not None:
+            self._LoadedArray.setflags(write = False)
+        return new_raster
+
     @property
     def fullpath_to_raster(self):
         return self._FullPathRaster
@@ -86,19 +357,19 @@ class BaseRaster(object):
 
     @property
     def xmin(self):
-        self.x_min = self._RasterExtents[0]
+        return self._RasterExtents[0]
 
     @property
     def ymin(self):
-        self.y_min = self._RasterExtents[2]
+        return self._RasterExtents[2]
 
     @property
     def xmax(self):
-        self.x_max = self._RasterExtents[1]
+        return self._RasterExtents[1]
 
     @property
     def ymax(self):
-        self.x_max = self._RasterExtents[3]
+        return self._RasterExtents[3]
 
     # The default colormap is gray
     @property
@@ -168,7 +439,8 @@ class BaseRaster(object):
         Author: DAV
         """
         low_values_index = self._RasterArray < self._drapeminthreshold
-        self._RasterArray[low_values_index] = np.nan
+        self._writeable_array()[low_values_index] = np.nan
+        self._record_change("mask_low", self._drapeminthreshold)
 
     def mask_high_values(self):
         """
@@ -177,7 +449,8 @@ class BaseRaster(object):
         Author: DAV
         """
         high_values_index = self._RasterArray < self._drapemaxthreshold
-        self._RasterArray[high_values_index] = np.nan
+        self._writeable_array()[high_values_index] = np.nan
+        self._record_change("mask_high", self._drapemaxthreshold)
 
     def mask_middle_values(self):
         """
@@ -187,7 +460,8 @@ class BaseRaster(object):
         """
         masked_mid_values_index = (np.logical_and(self._RasterArray > self._middlemaskrange[0],
                                    self._RasterArray < self._middlemaskrange[1]))
-        self._RasterArray[masked_mid_values_index] = np.nan
+        self._writeable_array()[masked_mid_values_index] = np.nan
+        self._record_change("mask_middle", tuple(self._middlemaskrange))
 
     def show_raster(self):
         """
@@ -205,7 +479,9 @@ class BaseRaster(object):
         """
         Function to take a list of raster values and replace it with
         a new list. Can be used to overwrite basin junction IDs with other
-        information about the basin, for example.
+        information about the basin, for example. All the values are replaced
+        in one pass (see RemapRasterValues), so the replacements don't feed
+        into each other.
 
         Args:
             old_values (list): The old values in the raster
@@ -216,11 +492,75 @@ class BaseRaster(object):
 
         Date: 17/06/17
         """
-        for idx, value in enumerate(old_values):
-            old_values_index = self._RasterArray == value
-            self._RasterArray[old_values_index] = new_values[idx]
+        LSDP.RemapRasterValues(self._writeable_array(), old_values, new_values)
+        self._record_change("replace", tuple(old_values), tuple(new_values))
         #print self._RasterArray
 
+    def clip_raster_values(self, minimum_value, maximum_value):
+        """
+        Recasts the raster so values below the minimum are the minimum and
+        values above the maximum are the maximum.
+
+        Args:
+            minimum_value (float): The minimum value
+            maximum_value (float): The maximum value
+        """
+        A = self._writeable_array()
+        A[A<minimum_value] = minimum_value
+        A[A>maximum_value] = maximum_value
+        self._record_change("clip", minimum_value, maximum_value)
+
+    def get_rgba(self, colourmap = None, norm = None, alpha = 1, pixel_budget = None):
+        """
+        Colour maps the raster to an RGBA image, at no more than about the resolution it will be drawn at.
+        The colour map, normalisation, transparency and nodata (nan) masking are done once
+        and the image is cached, so redrawing it (e.g., saving in several formats) is cheap.
+
+        Args:
+            colourmap (string or colourmap): The colourmap. If None, the raster's colourmap
+            norm (matplotlib.colors.Normalize): The normalisation. If None, a linear normalisation between the
+                minimum and maximum of the raster. Any limits not set in the normalisation are set from the raster.
+            alpha (float): The transparency (1 is opaque, 0 totally transparent)
+            pixel_budget (int): The number of pixels across the final image. If the raster is at least twice as wide,
+                every nth pixel is used. None keeps the full resolution.
+
+        Returns:
+            rgba (numpy.array): the image, a uint8 array with shape (rows, columns, 4)
+            norm (matplotlib.colors.Normalize): the normalisation used. You need this for the colourbar.
+        """
+        if colourmap is None:
+            colourmap = self._colourmap
+        if type(colourmap) == str:
+            colourmap = plt.get_cmap(colourmap)
+
+        step = 1
+        if pixel_budget is not None and pixel_budget > 0:
+            step = max(1, self._RasterArray.shape[1] // pixel_budget)
+
+        # The limits are set on a copy, so the normalisation you pass in isn't changed
+        if norm is None:
+            norm = colors.Normalize()
+        else:
+            norm = copy.copy(norm)
+        if norm.vmin is None:
+            norm.vmin = self.stats.min
+        if norm.vmax is None:
+            norm.vmax = self.stats.max
+
+        # The colourmap is identified by its colours, since discretised colourmaps are made anew each time
+        cmap_key = hash(colourmap(np.linspace(0, 1, colourmap.N), bytes = True).tobytes())
+        cache_key = (self._ArrayHistory, cmap_key, phelp.GetNormKey(norm), alpha, step)
+        if cache_key in self._RGBACache:
+            return self._RGBACache[cache_key], norm
+
+        A = np.ma.masked_invalid(self._RasterArray[::step,::step])
+        rgba = colourmap(norm(A), bytes = True)
+        rgba[...,3] = (rgba[...,3]*alpha).astype(np.uint8)
+        rgba[np.ma.getmaskarray(A),3] = 0
+
+        self._RGBACache[cache_key] = rgba
+        return rgba, norm
+
 
     def get_min_max(self):
         """
@@ -231,10 +571,7 @@ class BaseRaster(object):
         Date: 17/03/19
         """
 
-        zmin = np.nanmin(self._RasterArray)
-        zmax = np.nanmax(self._RasterArray)
-
-        return([zmin,zmax])
+        return([self.stats.min,self.stats.max])
 
     def get_unique(self):
         """
@@ -245,8 +582,7 @@ class BaseRaster(object):
         Date: 23/03/2020
         """
 
-        vals = np.unique(self._RasterArray)
-        vals = vals[~np.isnan(vals)]
+        vals = self.stats.unique
         vals = vals[ (vals >-9999)]
 
         return(vals)
@@ -264,20 +600,41 @@ class BaseRaster(object):
         Date: 31/08/2021
         """    
 
-        #print("Before and after minimums:")
-        #print(np.nanmin(self._RasterArray))
+        # If nothing is out of range we don't need to touch the array
+        if not (self.stats.min < minimum_value or self.stats.max > maximum_value):
+            return
 
         #print("Purging, minimum value is: "+str(minimum_value))
-        A = self._RasterArray
+        A = self._writeable_array()
         #np.where(A <= minimum_value,A,-999)
 
         A[A < minimum_value] = float("nan")
         A[A > maximum_value] = float("nan")
+        self._record_change("purge", minimum_value, maximum_value)
+
 
+def PolygonToPath(polygon):
+    """
+    Makes a matplotlib path of a shapely polygon or multipolygon, holes and all.
 
-        print(np.nanmin(A))
+    Args:
+        polygon: the shapely polygon
 
-        self._RasterArray = A
+    Returns:
+        matplotlib.path.Path
+    """
+    # cribbed from
+    # https://stackoverflow.com/questions/55522395/how-do-i-plot-shapely-polygons-and-objects-using-matplotlib
+    parts = polygon.geoms if hasattr(polygon, "geoms") else [polygon]
+    rings = []
+    for part in parts:
+        if part.is_empty:
+            continue
+        rings.append(Path(np.asarray(part.exterior.coords)[:, :2]))
+        rings.extend(Path(np.asarray(ring.coords)[:, :2]) for ring in part.interiors)
+    if len(rings) == 0:
+        return Path(np.zeros((0,2)))
+    return Path.make_compound_path(*rings)
 
 
 class MapFigure(object):
@@ -288,7 +645,8 @@ class MapFigure(object):
     etc.
     """
     def __init__(self, BaseRasterName, Directory,
-                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1,*args, **kwargs):
+                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1,
+                 custom_extent = None, fig_width_inches = None, dpi = None, prerender_drapes = False, *args, **kwargs):
         """
         Initiates the object.
 
@@ -300,39 +658,26 @@ class MapFigure(object):
             basemap_colourmap (string or colormap): The colourmap of the base raster.
             plot_title (string): The title of the plot, if "None" then will not be plotted.
             NFF_opti (bool): If true, use a fast python native file loading. Much faster but not completely tested.
+            alpha (float): The transparency of the base raster.
+            custom_extent (list): [xmin,xmax,ymin,ymax]. If given, the base raster and every drape only read the window inside this box.
+                Use this instead of SetCustomExtent when you are zooming in on a big raster.
+            fig_width_inches (float): The width of the figure you will save. If this and dpi are given, rasters that have
+                many more pixels than the figure are read decimated. Use the same values when you call save_fig.
+            dpi (int): The dpi of the figure you will save.
+            prerender_drapes (bool): If true, the base raster and drapes are colour mapped once to RGBA images (at about the
+                resolution set by fig_width_inches and dpi) rather than being colour mapped by matplotlib every time the figure is drawn.
 
         Author: SMM and DAV
 
         """
         fig = plt.figure()
+        self.fig = fig
         self.ax_list = []
         ax = fig.add_axes([0,0,1,1])
         self.ax_list.append(ax)
 
         # check the colourbar location
-        if colourbar_location == "Top" or colourbar_location == "TOP":
-            colourbar_location = "top"
-        if colourbar_location == "Bottom" or colourbar_location == "BOTTOM":
-            colourbar_location = "bottom"
-        if colourbar_location == "Left" or colourbar_location == "LEFT":
-            colourbar_location = "left"
-        if colourbar_location == "Right" or colourbar_location == "RIGHT":
-            colourbar_location = "right"
-
-        print("Your colourbar will be located: "+ colourbar_location)
-        if colourbar_location == "top" or colourbar_location == "bottom":
-            self.colourbar_location = colourbar_location
-            self.colourbar_orientation = "horizontal"
-        elif colourbar_location == "left" or colourbar_location == "right":
-            self.colourbar_location = colourbar_location
-            self.colourbar_orientation = "vertical"
-        elif colourbar_location == "None":
-            self.colourbar_location = "None"
-            self.colourbar_orientation = "None"
-        else:
-            print("You did not choose a valid colourbar location. Options are top, left, right, bottom and None. Defaulting to None.")
-            self.colourbar_location = "None"
-            self.colourbar_orientation = "None"
+        self._set_colourbar_location(colourbar_location)
 
         # Names of the directory and the base raster
         self._Directory = Directory
@@ -349,10 +694,24 @@ class MapFigure(object):
         # plot that get appended into a list. Each one has its own colourmap
         # and properties
         self._RasterList = []
+        self._custom_extent = custom_extent
+        if fig_width_inches is not None and dpi is not None:
+            self._pixel_budget = int(fig_width_inches*dpi)
+        else:
+            self._pixel_budget = None
+
+        # Every raster file is only read once per figure. The registry keeps the
+        # layers by path and the drapes get copies of them.
+        self._LayerRegistry = {}
+        self._prerender_drapes = prerender_drapes
+        # The raster layers in the order they are drawn, with how they are drawn (for the web tiles)
+        self._DrawnLayers = []
         if basemap_colourmap == "gray":
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(self._get_raster_layer(BaseRasterName,Directory, NFF_opti = NFF_opti, copy_layer = False))
+            self._RasterList[-1]._alpha = alpha
         else:
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(self._get_raster_layer(BaseRasterName,Directory, NFF_opti = NFF_opti, copy_layer = False))
+            self._RasterList[-1]._alpha = alpha
             self._RasterList[-1].set_colourmap(basemap_colourmap)
 
         # The coordinate type. UTM and UTM with tick in km are supported at the moment
@@ -381,9 +740,98 @@ class MapFigure(object):
         # set up a list of legend handles for building the legend if needed
         self.legend_handles_list = []
 
+    def _set_colourbar_location(self, colourbar_location):
+        """
+        Sets the colourbar location and orientation.
+
+        Args:
+            colourbar_location (string): Can be None, top, bottom, left or right.
+        """
+        if colourbar_location == "Top" or colourbar_location == "TOP":
+            colourbar_location = "top"
+        if colourbar_location == "Bottom" or colourbar_location == "BOTTOM":
+            colourbar_location = "bottom"
+        if colourbar_location == "Left" or colourbar_location == "LEFT":
+            colourbar_location = "left"
+        if colourbar_location == "Right" or colourbar_location == "RIGHT":
+            colourbar_location = "right"
+
+        print("Your colourbar will be located: "+ colourbar_location)
+        if colourbar_location == "top" or colourbar_location == "bottom":
+            self.colourbar_location = colourbar_location
+            self.colourbar_orientation = "horizontal"
+        elif colourbar_location == "left" or colourbar_location == "right":
+            self.colourbar_location = colourbar_location
+            self.colourbar_orientation = "vertical"
+        elif colourbar_location == "None":
+            self.colourbar_location = "None"
+            self.colourbar_orientation = "None"
+        else:
+            print("You did not choose a valid colourbar location. Options are top, left, right, bottom and None. Defaulting to None.")
+            self.colourbar_location = "None"
+            self.colourbar_orientation = "None"
+
+    def _imshow_layer(self, Raster, alpha = 1, norm = None, zorder = None):
+        """
+        Draws a raster layer on the map.
+
+        Args:
+            Raster (BaseRaster): the layer
+            alpha (float): The transparency of the layer (1 is opaque, 0 totally transparent)
+            norm (matplotlib.colors.Normalize): The normalisation. None is linear between the minimum and maximum.
+            zorder (float): the zorder of the layer. None for the matplotlib default.
+
+        Returns:
+            The image, or if the drapes are prerendered a ScalarMappable with the colourmap
+            and normalisation of the layer (which is what the colourbar needs).
+        """
+        imshow_kwargs = {"extent": self._RasterList[0].extents, "interpolation": "nearest"}
+        if zorder is not None:
+            imshow_kwargs["zorder"] = zorder
+        self._DrawnLayers.append([Raster, alpha, norm, zorder])
+
+        if not self._prerender_drapes:
+            return self.ax_list[0].imshow(Raster._RasterArray, Raster._colourmap, alpha = alpha, norm = norm, **imshow_kwargs)
+
+        rgba, norm = Raster.get_rgba(norm = norm, alpha = alpha, pixel_budget = self._pixel_budget)
+        self.ax_list[0].imshow(rgba, **imshow_kwargs)
+        im = _cm.ScalarMappable(norm = norm, cmap = Raster._colourmap)
+        im.set_array(np.array([]))
+        return im
+
+    def _get_raster_layer(self, RasterName, Directory, NFF_opti = False, copy_layer = True):
+        """
+        Gets a BaseRaster for a file from the layer registry, loading it (with the figure's
+        custom extent and pixel budget) if this is the first time it has been asked for.
+        The array, extents and EPSG are all reused so a file is only read once per figure.
+
+        Args:
+            RasterName (string): The name of the raster (no directory, but need extension)
+            Directory (string): directory of the data
+            NFF_opti (bool): If true, uses the numpy memmap reader the first time the file is loaded
+            copy_layer (bool): If true you get a copy you are free to modify (this is what the drapes use). It shares
+                the array of the layer in the registry until it is changed, so this costs no memory. If false you get the layer in the registry.
+
+        Returns:
+            BaseRaster: the layer
+        """
+        FullPath = os.path.abspath(Directory+RasterName)
+        if FullPath not in self._LayerRegistry:
+            self._LayerRegistry[FullPath] = BaseRaster(RasterName, Directory, NFF_opti = NFF_opti,
+                                                       custom_extent = self._custom_extent, pixel_budget = self._pixel_budget)
+        else:
+            print("I've already loaded "+RasterName+", so I'm reusing it")
+
+        if copy_layer:
+            return self._LayerRegistry[FullPath].copy()
+        else:
+            return self._LayerRegistry[FullPath]
+
     def SetCustomExtent(self,xmin,xmax,ymin,ymax):
         """
-        This function sets the plot extent in map coordinates and remakes the axis ticks
+        This function sets the plot extent in map coordinates and remakes the axis ticks.
+        The rasters have already been read by this point so this doesn't save any memory:
+        pass custom_extent when you create the MapFigure if you want windowed reads.
 
         Args:
           xmin: the minimum extent in easting
@@ -542,7 +990,7 @@ class MapFigure(object):
         #self.ax = self.fig.add_axes([0.1,0.1,0.7,0.7])
 
         print("This colourmap is: "+ self._RasterList[0]._colourmap)
-        im = self.ax_list[0].imshow(self._RasterList[0]._RasterArray, self._RasterList[0]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest", alpha = self._RasterList[0]._alpha)
+        im = self._imshow_layer(self._RasterList[0], alpha = self._RasterList[0]._alpha)
 
         # This affects all axes because we set share_all = True.
         #ax.set_xlim(self._xmin,self._xmax)
@@ -614,7 +1062,7 @@ class MapFigure(object):
 
         Date: 18/03/21
         """
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = self._get_raster_layer(RasterName,Directory, NFF_opti = NFF_opti)
         Raster._drapeminthreshold = 0.1
         Raster._drapemaxthreshold = None
         Raster._middlemaskrange = None
@@ -623,7 +1071,7 @@ class MapFigure(object):
         self._RasterList.append(Raster)
         self._RasterList[-1].set_colourmap(colourmap)
 
-        im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest", alpha = alpha, zorder=zorder)
+        im = self._imshow_layer(self._RasterList[-1], alpha = alpha, zorder = zorder)
 
 
         self.ax_list[0] = self.add_ticks_to_axis(self.ax_list[0])
@@ -664,7 +1112,7 @@ class MapFigure(object):
         
         from matplotlib.colors import ListedColormap, BoundaryNorm
 
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = self._get_raster_layer(RasterName,Directory, NFF_opti = NFF_opti)
 
         print("This min an max are:")
         print(Raster.get_min_max())
@@ -707,7 +1155,6 @@ class MapFigure(object):
 
         # Replace the raster values with integers
         Raster.replace_raster_values(unique_val, replace_ints)
-        Raster.replace_raster_values(unique_val, replace_ints)
 
         # Make a listed colourmap
         #colourmap = ListedColourmap()
@@ -742,8 +1189,7 @@ class MapFigure(object):
         if len(custom_min_max)!=0:
             if len(custom_min_max)== 2:
                 print("I am setting customisable minimum and maximum values: "+str(custom_min_max[0])+", "+str(custom_min_max[1]))
-                self._RasterList[-1]._RasterArray[self._RasterList[-1]._RasterArray<custom_min_max[0]] = custom_min_max[0]
-                self._RasterList[-1]._RasterArray[self._RasterList[-1]._RasterArray>custom_min_max[1]] = custom_min_max[1]
+                self._RasterList[-1].clip_raster_values(custom_min_max[0], custom_min_max[1])
             else:
                 print("I cannot customize your minimum and maximum because I don't understand your input. It should be [min,max] with min max as integers or floats")
         else:
@@ -751,6 +1197,7 @@ class MapFigure(object):
 
         # We need to initiate with a figure
         #self.ax = self.fig.add_axes([0.1,0.1,0.7,0.7])
+        this_norm = None
         if len(colour_min_max)!=0:
             if len(colour_min_max)== 2:
                 print("custom min and max are:")
@@ -758,20 +1205,19 @@ class MapFigure(object):
                 print(colour_min_max[1])
                 print("I am setting customisable colourbar minimum and maximum values: "+str(colour_min_max[0])+","+str(colour_min_max[1]))
                 if(norm == "LogNorm"):
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.LogNorm(vmin=colour_min_max[0], vmax=colour_min_max[1]),zorder=zorder)
+                    this_norm = mpl.colors.LogNorm(vmin=colour_min_max[0], vmax=colour_min_max[1])
                 elif(norm == "PowerNorm"):
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.PowerNorm(gamma=1. / 2.),zorder=zorder)
+                    this_norm = mpl.colors.PowerNorm(gamma=1. / 2.)
                 else:
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.Normalize(vmin=colour_min_max[0], vmax=colour_min_max[1]),zorder=zorder)
+                    this_norm = mpl.colors.Normalize(vmin=colour_min_max[0], vmax=colour_min_max[1])
             else:
                 print("I cannot customize your colour minimum and maximum because I don't understand your input. It should be [min,max] with min max as integers or floats")
         else:
             if(norm == "LogNorm"):
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents,interpolation="nearest",alpha = alpha, norm=colors.LogNorm(vmin=rmin, vmax=rmax), zorder=zorder)
+                this_norm = colors.LogNorm(vmin=rmin, vmax=rmax)
             elif(norm == "PowerNorm"):
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents,interpolation="nearest",alpha = alpha, norm=colors.PowerNorm(gamma=1. / 2.), zorder=zorder)
-            else:
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap,extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, zorder=zorder)
+                this_norm = colors.PowerNorm(gamma=1. / 2.)
+        im = self._imshow_layer(self._RasterList[-1], alpha = alpha, norm = this_norm, zorder = zorder)
 
 
         # This affects all axes because we set share_all = True.
@@ -827,7 +1273,7 @@ class MapFigure(object):
 
         Author: SMM
         """
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = self._get_raster_layer(RasterName,Directory, NFF_opti = NFF_opti)
         if modify_raster_values == True:
             Raster.replace_raster_values(old_values, new_values)
 
@@ -858,8 +1304,7 @@ class MapFigure(object):
         if len(custom_min_max)!=0:
             if len(custom_min_max)== 2:
                 print("I am setting customisable minimum and maximum values: "+str(custom_min_max[0])+", "+str(custom_min_max[1]))
-                self._RasterList[-1]._RasterArray[self._RasterList[-1]._RasterArray<custom_min_max[0]] = custom_min_max[0]
-                self._RasterList[-1]._RasterArray[self._RasterList[-1]._RasterArray>custom_min_max[1]] = custom_min_max[1]
+                self._RasterList[-1].clip_raster_values(custom_min_max[0], custom_min_max[1])
             else:
                 print("I cannot customize your minimum and maximum because I don't understand your input. It should be [min,max] with min max as integers or floats")
         else:
@@ -867,6 +1312,7 @@ class MapFigure(object):
 
         # We need to initiate with a figure
         #self.ax = self.fig.add_axes([0.1,0.1,0.7,0.7])
+        this_norm = None
         if len(colour_min_max)!=0:
             if len(colour_min_max)== 2:
                 print("custom min and max are:")
@@ -874,20 +1320,19 @@ class MapFigure(object):
                 print(colour_min_max[1])
                 print("I am setting customisable colourbar minimum and maximum values: "+str(colour_min_max[0])+","+str(colour_min_max[1]))
                 if(nroma == "LogNorm"):
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.LogNorm(vmin=colour_min_max[0], vmax=colour_min_max[1]),zorder=zorder)
+                    this_norm = mpl.colors.LogNorm(vmin=colour_min_max[0], vmax=colour_min_max[1])
                 elif(nroma == "PowerNorm"):
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.PowerNorm(gamma=1. / 2.),zorder=zorder)
+                    this_norm = mpl.colors.PowerNorm(gamma=1. / 2.)
                 else:
-                    im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, norm = mpl.colors.Normalize(vmin=colour_min_max[0], vmax=colour_min_max[1]),zorder=zorder)
+                    this_norm = mpl.colors.Normalize(vmin=colour_min_max[0], vmax=colour_min_max[1])
             else:
                 print("I cannot customize your colour minimum and maximum because I don't understand your input. It should be [min,max] with min max as integers or floats")
         else:
             if(nroma == "LogNorm"):
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents,interpolation="nearest",alpha = alpha, norm=colors.LogNorm(vmin=rmin, vmax=rmax), zorder=zorder)
+                this_norm = colors.LogNorm(vmin=rmin, vmax=rmax)
             elif(nroma == "PowerNorm"):
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap, extent = self._RasterList[0].extents,interpolation="nearest",alpha = alpha, norm=colors.PowerNorm(gamma=1. / 2.), zorder=zorder)
-            else:
-                im = self.ax_list[0].imshow(self._RasterList[-1]._RasterArray, self._RasterList[-1]._colourmap,extent = self._RasterList[0].extents, interpolation="nearest",alpha = alpha, zorder=zorder)
+                this_norm = colors.PowerNorm(gamma=1. / 2.)
+        im = self._imshow_layer(self._RasterList[-1], alpha = alpha, norm = this_norm, zorder = zorder)
 
 
         # This affects all axes because we set share_all = True.
@@ -916,10 +1361,11 @@ class MapFigure(object):
                          label_basins = True, adjust_text = False, rename_dict = {},
                          value_dict = {}, mask_list = [],
                          edgecolour='black', linewidth=1, cbar_dict = {}, colorbartickthinfactor=1, parallel=False,
-                         outlines_only = False,zorder = 1):
+                         outlines_only = False,zorder = 1, simplify_tolerance = None, n_jobs = 1):
         """
         This is a basin plotting routine. It plots basins as polygons which
-        can be coloured and labelled in various ways.
+        can be coloured and labelled in various ways. All of the basins are drawn
+        as one collection, simplified to the size of a pixel of the figure.
 
         Args:
             RasterName (string): The name of the raster (no directory, but need extension)
@@ -946,14 +1392,20 @@ class MapFigure(object):
             colorbartickthinfactor(int): a factor to reduce the number of ticks and labels displayed on the colour bar. Value of 2 would display every 2nd tick.
             parallel (bool): option flag for processing multiple basin raster files triggered by parallel chi mapping tool.
             outlines_only (bool): If true, only plot the outlines.
+            zorder (int): priority for plotting
+            simplify_tolerance (float): If this is given the basins are simplified with this tolerance (in map units) before they
+                are drawn, which makes pdf and svg figures of many basins much smaller. Each basin is simplified on its own, so
+                neighbouring basins can open thin gaps along their shared edges: keep it below a pixel of the saved figure
+                (e.g. 0.5*get_output_pixel_size() if the MapFigure knows its dpi). None (the default) draws every pixel edge.
+            n_jobs (int): If parallel is true, the number of processes used to polygonise the basin rasters. If the figure
+                is itself made in a pool of figure jobs each of them starts its own pool, so divide the processes between them.
 
         Author: SMM
         """
 
         print("Welcome to the basin plotting subroutine. I will plot some basins for you")
         print("This version does not rely on descartes")
-        from shapely.geometry import Polygon, Point
-        from matplotlib.collections import PatchCollection
+        from matplotlib.collections import PathCollection
 
         # Get the basin outlines
         # Basins referes to a dict where the key is the junction index and the
@@ -961,7 +1413,7 @@ class MapFigure(object):
         if not parallel:
           Basins = LSDP.GetBasinOutlines(Directory, RasterName)
         else:
-          Basins = LSDP.GetMultipleBasinOutlines(Directory)
+          Basins = LSDP.GetMultipleBasinOutlines(Directory, n_jobs = n_jobs)
 
         # Now check if you want to mask the basins
         # get the basin IDs to make a discrete colourmap for each ID
@@ -1000,16 +1452,18 @@ class MapFigure(object):
                 else:
                     print("I'm trying to mask a basin, " +str(basin)+ " that isn't there.")
 
+        # The basins go in a GeoDataFrame so the label points, colours and simplified outlines are all worked out at once
+        basin_junctions_plotted = list(Basins.keys())
+        BasinsGDF = gpd.GeoDataFrame({"junction": basin_junctions_plotted}, geometry = list(Basins.values()))
+
         # Now label the basins
         if label_basins:
             # This will hold the labels. Need to initiate here to ensure it lives outside control statements
             texts = []
 
             # First get the points
-            Points = {}
             print("The number of basins are: "+str(len(Basins)))
-            for basin_key, basin in Basins.items():
-                Points[basin_key] = Point(basin.representative_point())
+            Points = dict(zip(basin_junctions_plotted, BasinsGDF.geometry.representative_point()))
             print("The number of points are: "+str(len(Points)))
 
             # Now check if there is a renaming dictionary
@@ -1089,26 +1543,10 @@ class MapFigure(object):
             cNorm  = colors.Normalize(min_value, max_value)
             new_colours = plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
 
-            # now plot the polygons
-            print('Plotting the polygons, colouring by basin...I am using the geopandas version')
-            for key, poly in Basins.items():
-                print(key, int(key))
-                colourkey = int(key) % n_colours
-                # We need two patches since we don't want the edges transparent
-
-                # This is the direct version
-                # cribbed from 
-                # https://stackoverflow.com/questions/55522395/how-do-i-plot-shapely-polygons-and-objects-using-matplotlib
-                path = Path.make_compound_path(
-                        Path(np.asarray(poly.exterior.coords)[:, :2]),
-                        *[Path(np.asarray(ring.coords)[:, :2]) for ring in poly.interiors])
-                if not outlines_only:
-                    this_patch = PathPatch(path, fc=new_colours.to_rgba(colourkey), ec="none", alpha=alpha,zorder = zorder)                                           
-                    self.ax_list[0].add_patch(this_patch)
-                this_patch = PathPatch(path, fc="none", ec=edgecolour, alpha=1,zorder = zorder)
-                self.ax_list[0].add_patch(this_patch)
-
-
+            # The colour of each basin comes from its raster value (usually the junction)
+            print('Plotting the polygons, colouring by basin...')
+            colour_keys = np.mod(np.asarray(basin_junctions_plotted, dtype = float).astype(np.int64), n_colours)
+            face_colours = new_colours.to_rgba(colour_keys)
 
         else:
             if discrete_cmap:
@@ -1131,56 +1569,37 @@ class MapFigure(object):
             # we need a grayed out value for basins that don't have a value
             gray_colour = "#a9a9a9"
 
-            # now plot the polygons
-            print(Basins)
-            print(junction_to_key_dict)
+            # If we are using keys, the value dict refers to the key of the basin of each junction.
+            # Otherwise the junction indices link directly in to the polygon keys
             print('Plotting the polygons, colouring by value...')
-            for junc, poly in Basins.items():
-
-                # If we are using keys, we need to check to see if the key referred to by
-                # this junction is in the value dict
-
-                path = Path.make_compound_path(
-                        Path(np.asarray(poly.exterior.coords)[:, :2]),
-                        *[Path(np.asarray(ring.coords)[:, :2]) for ring in poly.interiors])
-                if not outlines_only:
-                    if use_keys_not_junctions:
-                        print(junc)
-                        this_key = junction_to_key_dict[int(junc)]
-                        #print ("This key is: "+str(this_key)+", and this value is: "+str(value_dict[this_key]))
-                        if this_key in value_dict:
-
-                            # This is the direct version
-                            this_patch = PathPatch(path, fc="none", ec=edgecolour, alpha=1,zorder = zorder)
-                            
-                            self.ax_list[0].add_patch(this_patch)
-                        else:
-
-                            # This is the direct version
-                            this_patch = PathPatch(path, facecolor=gray_colour, edgecolor="none", alpha=alpha, zorder = zorder)
-                           
-                            self.ax_list[0].add_patch(this_patch)
-                    else:
-                        # We are using junction indices so these link directly in to the polygon keys
-                        if junc in value_dict:
-                            
-                            # new direct version
-                            this_patch = PathPatch(path, facecolor=new_colours.to_rgba( value_dict[junc] ), edgecolor="none", alpha=alpha, zorder = zorder)
-                                                        
-                            self.ax_list[0].add_patch(this_patch)
-                        else:
-                            # new direct version
-                            this_patch = PathPatch(path, facecolor=gray_colour, edgecolor="none", alpha=alpha, zorder = zorder)
-                           
-                            self.ax_list[0].add_patch(this_patch)
-
-                # We need to add the outline seperately because we don't want it to be transparent
-                # new direct version
-                this_patch = PathPatch(path, facecolor="none", edgecolor=edgecolour, alpha=1, zorder = zorder)
-                
-                self.ax_list[0].add_patch(this_patch)
+            if use_keys_not_junctions:
+                value_keys = [junction_to_key_dict.get(int(junc)) for junc in basin_junctions_plotted]
+            else:
+                value_keys = basin_junctions_plotted
+            basin_values = np.array([value_dict[k] if k in value_dict else np.nan for k in value_keys], dtype = float)
+            has_value = np.array([k in value_dict for k in value_keys], dtype = bool)
+
+            face_colours = np.tile(colors.to_rgba(gray_colour), (len(basin_values),1))
+            if np.any(has_value):
+                face_colours[has_value] = new_colours.to_rgba(basin_values[has_value])
+
+        # The faces are transparent but we don't want the edges transparent,
+        # so the alpha goes on the face colours rather than the collection
+        if outlines_only:
+            face_colours = "none"
+        else:
+            face_colours = np.asarray(face_colours, dtype = float).reshape(-1,4).copy()
+            face_colours[:,3] = alpha
 
+        if simplify_tolerance is not None and simplify_tolerance > 0:
+            geometries = BasinsGDF.geometry.simplify(simplify_tolerance, preserve_topology = True)
+        else:
+            geometries = BasinsGDF.geometry
+        paths = [PolygonToPath(poly) for poly in geometries]
 
+        basin_collection = PathCollection(paths, facecolors = face_colours, edgecolors = edgecolour,
+                                          linewidths = linewidth, zorder = zorder)
+        self.ax_list[0].add_collection(basin_collection, autolim = False)
 
         # Now plot the colourbar
         if show_colourbar:
@@ -1207,6 +1626,22 @@ class MapFigure(object):
 
 
 
+    def get_output_pixel_size(self):
+        """
+        Gets the width of a pixel of the saved figure in map units. If the MapFigure was given fig_width_inches
+        and dpi this uses those (so it is a little smaller than the real pixels, since the map doesn't fill the figure);
+        otherwise it uses the width of the map at the dpi of the figure.
+
+        Returns:
+            float: the width of a pixel
+        """
+        xlim = self.ax_list[0].get_xlim()
+        if self._pixel_budget is not None:
+            n_pixels = self._pixel_budget
+        else:
+            n_pixels = self.ax_list[0].get_window_extent().width
+        return abs(xlim[1]-xlim[0])/max(n_pixels, 1)
+
     def cmap_discretize(self, cmap, N):
         """
         Return a discrete colormap from the continuous colormap cmap.
@@ -1319,8 +1754,7 @@ class MapFigure(object):
 
         # get the min and the max of the colourbar
         if use_baseraster:
-            vmin = np.nanmin(BaseRaster._RasterArray)
-            vmax = np.nanmax(BaseRaster._RasterArray)
+            vmin, vmax = BaseRaster.get_min_max()
         else:
             print("I'm fixing the ticks, but won't use a base raster, since you told me not to.")
             vmin = min_value
@@ -1471,7 +1905,8 @@ class MapFigure(object):
                        colour_log = False, colour_manual_scale = [],
                        manual_size = 0.5, alpha = 1, minimum_log_scale_cut_off = -10, label_field = "None",
                        font_size = 6, offset = 100, zorder=10, marker = "o", black_contours = False, discrete_colours = False, NColours = 10,scale_in_absolute = False, color_abs =False, unicolor = "blue",
-                       recast_scale_min_max = [], scale_in_abs_after_recasting = False, legend=False, label=""):
+                       recast_scale_min_max = [], scale_in_abs_after_recasting = False, legend=False, label="",
+                       rasterise_points = False, aggregate = None, aggregate_n_pixels = None):
 
         """
         This add point data to the map.
@@ -1506,6 +1941,14 @@ class MapFigure(object):
             color_abs: get the absolute data for scale
             recast_scale_min_max: recast the min and max of the array before scaling
             scale_in_abs_after_recasting: give the abolute value of scaling after recasting the data
+            rasterise_points (bool): If true, the points are drawn as an image (at the dpi of the saved figure) in pdf and svg figures,
+                rather than as one vector marker each. Use this for dense point data like chi data maps. The labels stay as text.
+            aggregate (str): If this is given ("mean", "max", "min", "sum" or "count") the points are binned into pixels and the
+                colour data of the points in each pixel are reduced to one value, which is drawn as a single image. The time this takes
+                hardly depends on the number of points. The points are not scaled. With discrete_colours only "max", "min"
+                and "count" make sense; the others are replaced by "max".
+            aggregate_n_pixels (int): The number of pixels across the aggregated image. Use the figure width times the dpi. If None, the
+                resolution of the base raster (which is the figure resolution if the MapFigure was given fig_width_inches and dpi).
 
         Author: SMM, BG
         """
@@ -1602,14 +2045,8 @@ class MapFigure(object):
                 print("max is: "+str(max_sd)+ " and min is: "+ str(min_sd))
 
                 # now rescale the data. Always a linear scaling.
-                new_scale = []
                 size_range = max_point_size-min_point_size
-                for datum in scale_data:
-                    frac = (datum-min_sd)/(max_sd-min_sd)
-                    new_size = frac*size_range+min_point_size
-                    new_scale.append(new_size)
-                ns_array = np.asarray(new_scale)
-                point_scale = ns_array
+                point_scale = (np.asarray(scale_data, dtype = float)-min_sd)/(max_sd-min_sd)*size_range+min_point_size
                 print("I have got a scaled point array,")
         else:
             print("I will not scale your points.")
@@ -1618,14 +2055,34 @@ class MapFigure(object):
 
 
         print("I will plot the points now.")
-        print("The colourmap is: " + this_colourmap)
+        print("The colourmap is: " + str(this_colourmap))
         #print("The length of the data file is "+str(len(this_data)))
-        if len(this_data) == 0 or len(this_data) != len(easting):
+        if aggregate is not None:
+            if len(this_data) == 0 or len(this_data) != len(easting):
+                print("I am only plotting where the points are.")
+                sc = self._add_aggregated_points(easting, northing, None, "count", colors.ListedColormap([unicolor]),
+                                                 alpha = alpha, zorder = zorder, n_pixels = aggregate_n_pixels)
+            else:
+                this_cmap = this_colourmap
+                cNorm = None
+                this_reduction = aggregate
+                if discrete_colours:
+                    this_data = np.mod(np.asarray(this_data), NColours)
+                    cNorm = colors.Normalize(vmin=0, vmax=NColours-1)
+                    # The mean or sum of colour classes isn't a class that any of the points have
+                    if this_reduction not in ["max", "min", "count"]:
+                        print("With discrete colours I can't take the "+str(this_reduction)+" of the classes in a pixel, so I'll use the max.")
+                        this_reduction = "max"
+                elif len(colour_manual_scale) == 2:
+                    cNorm = _mcolors.Normalize(vmin=colour_manual_scale[0], vmax=colour_manual_scale[1])
+                sc = self._add_aggregated_points(easting, northing, this_data, this_reduction, this_cmap, norm = cNorm,
+                                                 alpha = alpha, zorder = zorder, n_pixels = aggregate_n_pixels)
+        elif len(this_data) == 0 or len(this_data) != len(easting):
             print("I am only plotting the points.")
             unicolor = unicolor
-            sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c= unicolor,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+            sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c= unicolor,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
             if(black_contours):
-                self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker)
+                self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
 
         else:
             print("I will colour by the points")
@@ -1633,10 +2090,10 @@ class MapFigure(object):
                 print("let me rescale the colour using your array")
                 if(len(colour_manual_scale) == 2):
                     cNorm  = _mcolors.Normalize(vmin=colour_manual_scale[0], vmax=colour_manual_scale[1])
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,norm=cNorm,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,norm=cNorm,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
                     if(black_contours):
 
-                        self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3,edgecolors='k',facecolor = "none",norm=cNorm, alpha = alpha,zorder=zorder, marker = marker)
+                        self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3,edgecolors='k',facecolor = "none",norm=cNorm, alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
 
                 else:
                     print("Your colour_log_manual_scale should be something like [min,max], aborting")
@@ -1649,26 +2106,27 @@ class MapFigure(object):
                     this_cmap = this_colourmap
                     cNorm  = colors.Normalize(vmin=0, vmax=NUM_COLORS-1)
                     plt.cm.ScalarMappable(norm=cNorm, cmap=this_colourmap)
-                    channel_data = [x % NUM_COLORS for x in this_data]
+                    channel_data = np.mod(np.asarray(this_data), NUM_COLORS)
 
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=channel_data,cmap=this_colourmap, norm=cNorm, alpha = alpha,zorder=zorder)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=channel_data,cmap=this_colourmap, norm=cNorm, alpha = alpha,zorder=zorder, rasterized = rasterise_points)
                     if(black_contours):
-                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors = "k", facecolor = "none", norm=cNorm, alpha = alpha,zorder=zorder)
+                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors = "k", facecolor = "none", norm=cNorm, alpha = alpha,zorder=zorder, rasterized = rasterise_points)
 
                 else:
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
                     if(black_contours):
-                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker)
+                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker, rasterized = rasterise_points)
 
 
         # Setting the labelling
         if(label_field != "None"):
             # print("labelling from this tool is not available yet, Boris is working on it")
             tg = thisPointData.QueryData(label_field)
-            print(tg)
-            for i in range(len(easting)):
-                print(str(tg[i]))
-                sc =self.ax_list[0].text(easting[i]-offset,northing[i]-offset,str(tg[i]),fontsize = font_size)
+            print("I am labelling "+str(len(tg))+" points")
+            label_x = np.asarray(easting)-offset
+            label_y = np.asarray(northing)-offset
+            for x, y, this_label in zip(label_x, label_y, tg):
+                sc =self.ax_list[0].text(x,y,str(this_label),fontsize = font_size)
 
         # Annoying but the scatter plot resets the extents so you need to reassert them
         self.ax_list[0].set_xlim(this_xlim)
@@ -1694,6 +2152,35 @@ class MapFigure(object):
             legend_line = mlines.Line2D([],[], color=unicolor, lw=min_point_size, label=label)
             self.legend_handles_list.append(legend_line)
 
+    def _add_aggregated_points(self, easting, northing, values, reduction, colourmap, norm = None, alpha = 1, zorder = 10, n_pixels = None):
+        """
+        Bins points into pixels covering the map (see LSDP.AggregatePointsToGrid) and draws them as one image.
+
+        Args:
+            easting, northing (array): The coordinates of the points
+            values (array): The colour data of the points. None if you only want to show where the points are.
+            reduction (str): "mean", "max", "min", "sum" or "count"
+            colourmap (string or colourmap): The colourmap
+            norm (matplotlib.colors.Normalize): The normalisation. None scales between the minimum and maximum of the image.
+            alpha (float): transparency (between 0 and 1)
+            zorder (int): priority for plotting
+            n_pixels (int): The number of pixels across the image. If None, the resolution of the base raster.
+
+        Returns:
+            The image
+        """
+        extent = self._RasterList[0].extents
+        if n_pixels is None:
+            n_rows, n_cols = self._RasterList[0]._RasterArray.shape
+        else:
+            n_cols = int(n_pixels)
+            n_rows = max(1, int(round(n_cols*(extent[3]-extent[2])/(extent[1]-extent[0]))))
+        print("I am binning "+str(len(easting))+" points into a "+str(n_cols)+" by "+str(n_rows)+" image, using the "+reduction)
+
+        grid = LSDP.AggregatePointsToGrid(easting, northing, values, extent, n_rows, n_cols, reduction = reduction)
+        return self.ax_list[0].imshow(np.ma.masked_invalid(grid), colourmap, norm = norm, extent = extent, alpha = alpha,
+                                      zorder = zorder, interpolation = "nearest")
+
     def add_line_data(self, ThisLineFile, linestyle = '-', edgecolour = "k", linewidth=0.5, zorder = 1, alpha=1, legend=False, label=""):
         """
         This adds line data from a named shapefile to the map.
@@ -1721,6 +2208,7 @@ class MapFigure(object):
         print("I am going to plot some lines for you. The EPSG string is:"+EPSG_string)
 
         # load the data
+        LSDP.RecordFileRead(ThisLineFile)
         with fiona.open(ThisLineFile) as input:
             for feature in input:
                 geom = shape(feature['geometry'])
@@ -1760,7 +2248,7 @@ class MapFigure(object):
         self.ax_list[0].set_ylim(this_ylim)
 
 
-    def add_channel_network_from_points(self, thisPointData, colour='k', alpha = 0.7, zorder=1):
+    def add_channel_network_from_points(self, thisPointData, colour='k', alpha = 0.7, zorder=1, aggregate = False, aggregate_n_pixels = None):
         """
         This function plots the channel network from the map figure, you must pass in the
         channel network as an LSDMap_PointData object.
@@ -1770,6 +2258,9 @@ class MapFigure(object):
             colour (string): colour you want the channel network to be, default = black
             alpha (float): transparency, 1 = opaque. Default = 0.7
             zorder (float): priority for layering of plots
+            aggregate (bool): If true, the channel nodes are binned into pixels and drawn as one image rather than a marker each.
+                Use this for big channel networks.
+            aggregate_n_pixels (int): The number of pixels across the aggregated image (see add_point_data)
 
         Returns:
             plots the channel network
@@ -1787,7 +2278,11 @@ class MapFigure(object):
         [easting,northing] = thisPointData.GetUTMEastingNorthing(EPSG_string)
         print("I got the easting and northing")
 
-        sc = self.ax_list[0].scatter(easting,northing,s=0.1, c=colour, facecolor=colour, alpha = alpha, zorder=zorder)
+        if aggregate:
+            sc = self._add_aggregated_points(easting, northing, None, "count", colors.ListedColormap([colour]),
+                                             alpha = alpha, zorder = zorder, n_pixels = aggregate_n_pixels)
+        else:
+            sc = self.ax_list[0].scatter(easting,northing,s=0.1, c=colour, facecolor=colour, alpha = alpha, zorder=zorder)
 
 
     def add_text_annotation_from_points(self, thisPointData,column_for_plotting = "None",
@@ -2387,7 +2882,29 @@ class MapFigure(object):
 
         Author: SMM
         """
+        fig = self._size_figure(fig_width_inches = fig_width_inches, axis_style = axis_style,
+                                adjust_cbar_characters = adjust_cbar_characters,
+                                fixed_cbar_characters = fixed_cbar_characters, hide_ticklabels = hide_ticklabels)
+
+        # I am returning the figure if wanted, otherwise I am saving the figure and clearing it
+        if(return_fig):
+            #fig.show()
+            return fig
+        else:
+            # saving and closing
+            fig.savefig(FigFileName, format=FigFormat, dpi=Fig_dpi, transparent=transparent)
+            fig.clf()
+            plt.close(fig)
+
+    def _size_figure(self, fig_width_inches = 4, axis_style = "Normal", adjust_cbar_characters=True,
+                     fixed_cbar_characters=4, hide_ticklabels=False):
+        """
+        This styles the axes and sizes the figure and its axes, ready for saving.
+        The arguments are the same as for save_fig.
 
+        Returns:
+            The figure
+        """
         self.ax_list = self.axis_styler(self.ax_list,axis_style)
 
         map_aspect_ratio = self._RasterList[0]._RasterAspectRatio
@@ -2464,15 +2981,150 @@ class MapFigure(object):
             self.ax_list[0].set_xlabel("")
             self.ax_list[0].set_ylabel("")
 
-        # I am returning the figure if wanted, otherwise I am saving the figure and clearing it
-        if(return_fig):
-            #fig.show()
-            return fig
-        else:
-            # saving and closing
-            fig.savefig(FigFileName, format=FigFormat, dpi=Fig_dpi, transparent=transparent)
-            fig.clf()
-            plt.close(fig)
+        return fig
+
+    def export_web_tiles(self, OutputName, min_zoom = None, max_zoom = None, n_threads = 4, name = None):
+        """
+        Writes the raster layers of the figure (the base raster and the drapes, with their colourmaps,
+        normalisations and transparency) as web map tiles. Points, lines, basins and so on are not included.
+        If you export to the same place again only the tiles whose data or colours have changed are redrawn,
+        and tiles the layers no longer cover are deleted.
+
+        Args:
+            OutputName (str): An .mbtiles file, or otherwise a directory for zoom/x/y.png tiles
+            min_zoom (int): The smallest zoom level. If None, 5 levels below max_zoom
+            max_zoom (int): The largest zoom level. If None, the zoom where the tile pixels are about the size of the raster pixels
+            n_threads (int): The number of threads to render the tiles with
+            name (str): The name of the tile set. If None, the name of the output
+
+        Returns:
+            int: the number of tiles that were drawn
+        """
+        # the layers are drawn in zorder, then the order they were added (as matplotlib does)
+        drawn_layers = list(self._DrawnLayers)
+        drawn_layers.sort(key = lambda layer: 0 if layer[3] is None else layer[3])
+        tile_layers = [webtiles.TileLayer(Raster, alpha = alpha, norm = norm) for Raster, alpha, norm, zorder in drawn_layers]
+        return webtiles.WriteWebTiles(tile_layers, OutputName, min_zoom = min_zoom, max_zoom = max_zoom,
+                                      n_threads = n_threads, name = name)
+
+    def _get_render_state(self):
+        """
+        Takes a snapshot of everything that adding layers changes, so the figure
+        can be put back to its base layers after a render.
+
+        Returns:
+            dict: the state
+        """
+        map_ax = self.ax_list[0]
+        state = {"ax_list": list(self.ax_list),
+                 "axes": list(self.fig.axes),
+                 "map_artists": set(map_ax.get_children()),
+                 "map_position": map_ax.get_position(),
+                 "map_title": map_ax.get_title(),
+                 "RasterList": list(self._RasterList),
+                 "DrawnLayers": list(self._DrawnLayers),
+                 "drape_list": list(self._drape_list),
+                 "num_drapes": self._num_drapes,
+                 "legend_handles_list": list(self.legend_handles_list),
+                 "title": self.title,
+                 "colourbar_location": self.colourbar_location,
+                 "colourbar_orientation": self.colourbar_orientation,
+                 "limits": [self._xmin,self._xmax,self._ymin,self._ymax]}
+        return state
+
+    def _restore_render_state(self, state):
+        """
+        Removes everything that was added to the figure since the state was taken.
+
+        Args:
+            state (dict): from _get_render_state
+        """
+        # get rid of any new axes (these are the colourbars)
+        for ax in list(self.fig.axes):
+            if ax not in state["axes"]:
+                self.fig.delaxes(ax)
+
+        # and any new artists on the map
+        map_ax = state["ax_list"][0]
+        for artist in map_ax.get_children():
+            if artist not in state["map_artists"]:
+                try:
+                    artist.remove()
+                except (NotImplementedError, ValueError):
+                    artist.set_visible(False)
+
+        self.ax_list = list(state["ax_list"])
+        self._RasterList = list(state["RasterList"])
+        self._DrawnLayers = list(state["DrawnLayers"])
+        self._drape_list = list(state["drape_list"])
+        self._num_drapes = state["num_drapes"]
+        self.legend_handles_list = list(state["legend_handles_list"])
+        self.title = state["title"]
+        self.colourbar_location = state["colourbar_location"]
+        self.colourbar_orientation = state["colourbar_orientation"]
+        [self._xmin,self._xmax,self._ymin,self._ymax] = state["limits"]
+
+        map_ax.set_title(state["map_title"])
+        map_ax.set_position(state["map_position"])
+        map_ax.set_xlim(self._xmin,self._xmax)
+        map_ax.set_ylim(self._ymin,self._ymax)
+        self.add_ticks_to_axis(map_ax)
+
+    def render_figures(self, figure_specs):
+        """
+        This renders a batch of figures from the layers already in this MapFigure.
+        The base raster (and any layers added before calling this) are only loaded once.
+        Each figure adds its layers, is saved, and then its layers are removed again,
+        so the figures don't see each other's layers.
+
+        Args:
+            figure_specs (list of dicts): One dict for each figure. The keys are:
+                FigFileName (str): The filename. This one is required.
+                layers (list): A list of [method, kwargs] pairs, where method is the name of one of the
+                    MapFigure add_ methods (e.g., "add_drape_image", "add_point_data", "add_basin_plot",
+                    "add_scalebar") or a function that takes the MapFigure as its first argument,
+                    and kwargs is a dict of its arguments.
+                colourbar_location (str): the colourbar location for this figure.
+                plot_title (str): the title of this figure.
+                fig_width_inches, FigFormat, Fig_dpi, axis_style, transparent, adjust_cbar_characters,
+                fixed_cbar_characters, hide_ticklabels: as in save_fig
+
+        Returns:
+            A list of the names of the figures
+        """
+        size_keys = ["fig_width_inches","axis_style","adjust_cbar_characters","fixed_cbar_characters","hide_ticklabels"]
+
+        state = self._get_render_state()
+        FigFileNames = []
+        for spec in figure_specs:
+            if "FigFileName" not in spec:
+                raise Exception("Each of your figure specs needs a FigFileName")
+            print("I am rendering: "+spec["FigFileName"])
+
+            # the add_ methods work on the current figure
+            plt.figure(self.fig.number)
+
+            if "colourbar_location" in spec:
+                self._set_colourbar_location(spec["colourbar_location"])
+            if "plot_title" in spec:
+                self.title = spec["plot_title"]
+
+            try:
+                for method, kwargs in spec.get("layers", []):
+                    if callable(method):
+                        method(self, **kwargs)
+                    else:
+                        getattr(self, method)(**kwargs)
+
+                size_kwargs = {key: spec[key] for key in size_keys if key in spec}
+                fig = self._size_figure(**size_kwargs)
+                fig.savefig(spec["FigFileName"], format = spec.get("FigFormat","png"),
+                            dpi = spec.get("Fig_dpi",100), transparent = spec.get("transparent",False))
+                FigFileNames.append(spec["FigFileName"])
+            finally:
+                self._restore_render_state(state)
+
+        return FigFileNames
 
     def SetRCParams(self,label_size):
         """
@@ -0,0 +1,596 @@
+# -*- coding: utf-8 -*-
+"""
+Web map tiles from the raster layers of a MapFigure.
+
+The tiles are the usual XYZ (slippy map) tiles: 256 x 256 pixel PNGs in web
+mercator (EPSG:3857). They can be written to an MBTiles file (an SQLite database,
+which is what most tile servers want) or to a directory of zoom/x/y.png files.
+
+Each tile reads only the window of each raster that it covers, decimated to about
+the resolution of the tile, and the edits made to the layer in the figure (masks,
+replaced values, clipping) are made again on that window. Tiles are rendered in a
+pool of threads. The inputs of every tile (the windows of the rasters it reads, after
+the edits, and the colours) are hashed and stored with it, so if you export to the
+same place again only the tiles whose inputs have changed are redrawn, and tiles
+that are no longer covered by the layers are deleted.
+
+Released under GPL3
+"""
+
+from lsdviztools import lsdplottingtools as LSDP
+from . import plottinghelpers as phelp
+import matplotlib.pyplot as plt
+import matplotlib.image as mpimg
+from matplotlib import colors
+import numpy as np
+from pyproj import CRS
+from pyproj import Transformer
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+
+# Half the width of the web mercator world, in metres
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+TILE_SIZE = 256
+
+
+#==============================================================================
+def TileBounds(zoom, x, y):
+    """
+    Gets the bounding box of an XYZ tile.
+
+    Args:
+        zoom (int): The zoom level
+        x (int): The tile column (from the west)
+        y (int): The tile row (from the north)
+
+    Returns:
+        list: [XMin,XMax,YMin,YMax] of the tile in web mercator
+    """
+    tile_width = 2*WEB_MERCATOR_HALF_WIDTH/(2**zoom)
+    XMin = -WEB_MERCATOR_HALF_WIDTH + x*tile_width
+    YMax = WEB_MERCATOR_HALF_WIDTH - y*tile_width
+    return [XMin, XMin+tile_width, YMax-tile_width, YMax]
+
+#==============================================================================
+def TilesCoveringExtent(extent, zoom):
+    """
+    Gets the XYZ tiles that cover a bounding box.
+
+    Args:
+        extent (list): [XMin,XMax,YMin,YMax] in web mercator
+        zoom (int): The zoom level
+
+    Returns:
+        list: the (x, y) of the tiles
+    """
+    n_tiles = 2**zoom
+    tile_width = 2*WEB_MERCATOR_HALF_WIDTH/n_tiles
+    x_min = int(np.floor((extent[0]+WEB_MERCATOR_HALF_WIDTH)/tile_width))
+    x_max = int(np.ceil((extent[1]+WEB_MERCATOR_HALF_WIDTH)/tile_width))
+    y_min = int(np.floor((WEB_MERCATOR_HALF_WIDTH-extent[3])/tile_width))
+    y_max = int(np.ceil((WEB_MERCATOR_HALF_WIDTH-extent[2])/tile_width))
+
+    x_min = min(max(x_min, 0), n_tiles)
+    x_max = min(max(x_max, 0), n_tiles)
+    y_min = min(max(y_min, 0), n_tiles)
+    y_max = min(max(y_max, 0), n_tiles)
+    return [(x, y) for x in range(x_min, x_max) for y in range(y_min, y_max)]
+
+#==============================================================================
+def TransformExtent(extent, source_crs, target_crs, n_points = 21):
+    """
+    Gets the bounding box of an extent in another coordinate system. The edges are
+    split into n_points so the curved edges of the transformed box are covered.
+
+    Args:
+        extent (list): [XMin,XMax,YMin,YMax]
+        source_crs, target_crs: anything pyproj's CRS understands (e.g. "EPSG:32630")
+        n_points (int): The number of points along each edge
+
+    Returns:
+        list: [XMin,XMax,YMin,YMax] in the target coordinate system
+    """
+    transformer = Transformer.from_crs(CRS(source_crs), CRS(target_crs), always_xy = True)
+    xs = np.linspace(extent[0], extent[1], n_points)
+    ys = np.linspace(extent[2], extent[3], n_points)
+    edge_x = np.concatenate([xs, xs, np.full(n_points, extent[0]), np.full(n_points, extent[1])])
+    edge_y = np.concatenate([np.full(n_points, extent[2]), np.full(n_points, extent[3]), ys, ys])
+    tx, ty = transformer.transform(edge_x, edge_y)
+    return [np.nanmin(tx), np.nanmax(tx), np.nanmin(ty), np.nanmax(ty)]
+
+#==============================================================================
+class TileLayer(object):
+    """
+    A raster layer of a MapFigure, ready to be cut into tiles. The colourmap, normalisation
+    and transparency are fixed when this is made, so every tile is coloured the same way.
+
+    Args:
+        Raster (BaseRaster): The layer
+        alpha (float): The transparency of the layer
+        norm (matplotlib.colors.Normalize): The normalisation the layer was drawn with. None is linear between
+            the minimum and maximum of the layer.
+    """
+    def __init__(self, Raster, alpha = 1, norm = None):
+        self._Raster = Raster
+        self._FileName = Raster.fullpath_to_raster
+        self._info = LSDP.GetRasterInfo(self._FileName)
+        self._alpha = alpha
+        self._extent = list(Raster.extents)
+        self._crs = CRS.from_wkt(self._info.projection_wkt)
+        self._transformers = threading.local()
+
+        self._colourmap = Raster._colourmap
+        if type(self._colourmap) == str:
+            self._colourmap = plt.get_cmap(self._colourmap)
+
+        if norm is None:
+            norm = colors.Normalize()
+        else:
+            norm = copy.copy(norm)
+        if norm.vmin is None:
+            norm.vmin = Raster.stats.min
+        if norm.vmax is None:
+            norm.vmax = Raster.stats.max
+        self._norm = norm
+
+        # If the array has been set directly we can't make the same edits to the tiles we read,
+        # so we cut the tiles from the array in memory
+        self._array = None
+        if not Raster._can_replay_changes():
+            print("The layer "+self._FileName+" has been modified in a way I can't repeat, so I'll cut its tiles from the array in memory")
+            self._array = Raster._RasterArray
+
+        # The key of the colours of the layer. The data are keyed tile by tile, from the windows the tiles read,
+        # so changing a few pixels of the raster only redraws the tiles that show them.
+        cmap_key = self._colourmap(np.linspace(0, 1, self._colourmap.N), bytes = True).tobytes()
+        layer_key = repr((self._extent, phelp.GetNormKey(norm), alpha))
+        self.key = hashlib.sha1(layer_key.encode("utf-8") + cmap_key).hexdigest()
+
+        # every tile reads all of an array in memory, so it is only hashed once
+        self._array_key = None
+        if self._array is not None:
+            self._array_key = hashlib.sha1(np.ascontiguousarray(self._array).tobytes()).hexdigest()
+
+        self.web_mercator_extent = TransformExtent(self._extent, self._crs, "EPSG:3857")
+
+    def _get_transformer(self):
+        """
+        Each thread gets its own transformer from web mercator to the coordinates of the layer.
+        """
+        if not hasattr(self._transformers, "transformer"):
+            self._transformers.transformer = Transformer.from_crs(CRS("EPSG:3857"), self._crs, always_xy = True)
+        return self._transformers.transformer
+
+    def overlaps(self, tile_extent):
+        """
+        Checks if a tile (the extent is in web mercator) might overlap the layer.
+        """
+        return not (tile_extent[1] <= self.web_mercator_extent[0] or tile_extent[0] >= self.web_mercator_extent[1] or
+                    tile_extent[3] <= self.web_mercator_extent[2] or tile_extent[2] >= self.web_mercator_extent[3])
+
+    def _read_window(self, X, Y, tile_resolution):
+        """
+        Reads the window of the raster that covers some points, decimated to about the tile resolution,
+        and makes the same edits to it as have been made to the layer.
+
+        Args:
+            X, Y (numpy.array): The points, in the coordinates of the layer
+            tile_resolution (float): The size of a tile pixel, in the coordinates of the layer
+
+        Returns:
+            array (numpy.array): The window
+            extent (list): [XMin,XMax,YMin,YMax] of the window
+        """
+        if self._array is not None:
+            return self._array, self._extent
+
+        GeoT = self._info.geotransform
+        cellsize = GeoT[1]
+
+        # The window, clipped to the layer (which might be a window of the file)
+        col_min = int(np.floor((max(X.min(), self._extent[0])-GeoT[0])/cellsize))
+        col_max = int(np.ceil((min(X.max(), self._extent[1])-GeoT[0])/cellsize))
+        row_min = int(np.floor((min(Y.max(), self._extent[3])-GeoT[3])/GeoT[5]))
+        row_max = int(np.ceil((max(Y.min(), self._extent[2])-GeoT[3])/GeoT[5]))
+        col_min = max(col_min, 0)
+        row_min = max(row_min, 0)
+        col_max = max(min(col_max, self._info.xsize), col_min+1)
+        row_max = max(min(row_max, self._info.ysize), row_min+1)
+        n_cols = col_max-col_min
+        n_rows = row_max-row_min
+
+        decimation = max(1, int(tile_resolution // cellsize))
+        out_shape = (int(np.ceil(n_rows/float(decimation))), int(np.ceil(n_cols/float(decimation))))
+
+        array = LSDP.ReadRasterArrayBlocks(self._FileName, window = (col_min, row_min, n_cols, n_rows), out_shape = out_shape,
+                                           dtype = np.float32)
+        array = self._Raster._replay_changes(array)
+
+        extent = [GeoT[0]+col_min*cellsize, GeoT[0]+col_max*cellsize, GeoT[3]+row_max*GeoT[5], GeoT[3]+row_min*GeoT[5]]
+        return array, extent
+
+    def tile_window(self, zoom, x, y):
+        """
+        Reads the window of the layer that a tile covers.
+
+        Args:
+            zoom (int): The zoom level
+            x (int): The tile column (from the west)
+            y (int): The tile row (from the north)
+
+        Returns:
+            tuple: (inside, X, Y, array, extent): the tile pixels that are on the layer, the centres of those pixels
+            in the coordinates of the layer, and the window and its extent. None if the layer isn't on the tile.
+        """
+        tile_extent = TileBounds(zoom, x, y)
+        if not self.overlaps(tile_extent):
+            return None
+
+        # the centres of the tile pixels, in the coordinates of the layer
+        pixel_width = (tile_extent[1]-tile_extent[0])/TILE_SIZE
+        centres = (np.arange(TILE_SIZE)+0.5)*pixel_width
+        merc_x, merc_y = np.meshgrid(tile_extent[0]+centres, tile_extent[3]-centres)
+        X, Y = self._get_transformer().transform(merc_x, merc_y)
+
+        inside = ((X >= self._extent[0]) & (X < self._extent[1]) &
+                  (Y > self._extent[2]) & (Y <= self._extent[3]))
+        if not inside.any():
+            return None
+
+        X = X[inside]
+        Y = Y[inside]
+        tile_resolution = max(X.max()-X.min(), Y.max()-Y.min())/TILE_SIZE
+        array, extent = self._read_window(X, Y, tile_resolution)
+        return inside, X, Y, array, extent
+
+    def window_key(self, window):
+        """
+        Gets the key of a window read by tile_window: the colours of the layer and the data in the window.
+
+        Args:
+            window (tuple): What tile_window returned
+
+        Returns:
+            bytes: The key
+        """
+        inside, X, Y, array, extent = window
+        if self._array_key is not None:
+            data_key = self._array_key
+        else:
+            data_key = hashlib.sha1(np.ascontiguousarray(array).tobytes()).hexdigest()
+        return (self.key + data_key + repr((array.shape, array.dtype.str, list(extent)))).encode("utf-8")
+
+    def render(self, zoom, x, y, window = None):
+        """
+        Renders the layer on a tile.
+
+        Args:
+            zoom (int): The zoom level
+            x (int): The tile column (from the west)
+            y (int): The tile row (from the north)
+            window (tuple): What tile_window returned for this tile, if it has already been read
+
+        Returns:
+            numpy.array: The tile as a float RGBA array (TILE_SIZE, TILE_SIZE, 4), or None if the layer isn't on it
+        """
+        if window is None:
+            window = self.tile_window(zoom, x, y)
+            if window is None:
+                return None
+        inside, X, Y, array, extent = window
+
+        # nearest neighbour sampling of the window
+        n_rows, n_cols = array.shape
+        cols = ((X-extent[0])/(extent[1]-extent[0])*n_cols).astype(np.int64)
+        rows = ((extent[3]-Y)/(extent[3]-extent[2])*n_rows).astype(np.int64)
+        np.clip(cols, 0, n_cols-1, out = cols)
+        np.clip(rows, 0, n_rows-1, out = rows)
+
+        values = np.full((TILE_SIZE, TILE_SIZE), np.nan)
+        values[inside] = array[rows, cols]
+        values = np.ma.masked_invalid(values)
+
+        rgba = self._colourmap(self._norm(values))
+        rgba[...,3] *= self._alpha
+        rgba[np.ma.getmaskarray(values),3] = 0
+        return rgba
+
+#==============================================================================
+class _MBTilesWriter(object):
+    """
+    Writes tiles to an MBTiles file. The hash of the inputs of each tile is kept in an extra table.
+    """
+    def __init__(self, FileName):
+        self._connection = sqlite3.connect(FileName)
+        cursor = self._connection.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS metadata (name text, value text)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS tile_inputs (zoom_level integer, tile_column integer, tile_row integer, input_hash text)")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_inputs_index ON tile_inputs (zoom_level, tile_column, tile_row)")
+        self._connection.commit()
+
+    @staticmethod
+    def _tms_row(zoom, y):
+        # MBTiles numbers the rows from the south
+        return 2**zoom - 1 - y
+
+    def get_hashes(self, zoom):
+        cursor = self._connection.execute("SELECT tile_column, tile_row, input_hash FROM tile_inputs WHERE zoom_level = ?", (zoom,))
+        return {(x, self._tms_row(zoom, row)): input_hash for x, row, input_hash in cursor}
+
+    def get_zooms(self):
+        cursor = self._connection.execute("SELECT DISTINCT zoom_level FROM tile_inputs")
+        return [zoom for zoom, in cursor]
+
+    def delete(self, zoom, x, y):
+        row = self._tms_row(zoom, y)
+        self._connection.execute("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (zoom, x, row))
+        self._connection.execute("DELETE FROM tile_inputs WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (zoom, x, row))
+
+    def put(self, zoom, x, y, png, input_hash):
+        row = self._tms_row(zoom, y)
+        if png is None:
+            self._connection.execute("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (zoom, x, row))
+        else:
+            self._connection.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, row, sqlite3.Binary(png)))
+        self._connection.execute("INSERT OR REPLACE INTO tile_inputs VALUES (?, ?, ?, ?)", (zoom, x, row, input_hash))
+
+    def set_metadata(self, metadata):
+        for name, value in metadata.items():
+            self._connection.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?)", (name, str(value)))
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+#==============================================================================
+class _XYZDirectoryWriter(object):
+    """
+    Writes tiles to a directory of zoom/x/y.png files. The hash of the inputs of each tile is kept
+    in tile_inputs.json and the metadata in metadata.json.
+    """
+    def __init__(self, Directory):
+        self._Directory = Directory
+        self._hash_file = os.path.join(Directory, "tile_inputs.json")
+        if not os.path.isdir(Directory):
+            os.makedirs(Directory)
+        self._hashes = {}
+        if os.path.exists(self._hash_file):
+            with open(self._hash_file) as f:
+                self._hashes = json.load(f)
+
+    def get_hashes(self, zoom):
+        hashes = {}
+        for name, input_hash in self._hashes.items():
+            z, x, y = [int(i) for i in name.split("/")]
+            if z == zoom:
+                hashes[(x, y)] = input_hash
+        return hashes
+
+    def get_zooms(self):
+        return sorted(set(int(name.split("/")[0]) for name in self._hashes))
+
+    def delete(self, zoom, x, y):
+        tile_file = os.path.join(self._Directory, str(zoom), str(x), str(y)+".png")
+        if os.path.exists(tile_file):
+            os.remove(tile_file)
+        self._hashes.pop(str(zoom)+"/"+str(x)+"/"+str(y), None)
+
+    def put(self, zoom, x, y, png, input_hash):
+        tile_file = os.path.join(self._Directory, str(zoom), str(x), str(y)+".png")
+        if png is None:
+            if os.path.exists(tile_file):
+                os.remove(tile_file)
+        else:
+            if not os.path.isdir(os.path.dirname(tile_file)):
+                os.makedirs(os.path.dirname(tile_file))
+            with open(tile_file, "wb") as f:
+                f.write(png)
+        self._hashes[str(zoom)+"/"+str(x)+"/"+str(y)] = input_hash
+
+    def set_metadata(self, metadata):
+        with open(os.path.join(self._Directory, "metadata.json"), "w") as f:
+            json.dump(metadata, f, indent = 2)
+
+    def close(self):
+        with open(self._hash_file, "w") as f:
+            json.dump(self._hashes, f)
+
+#==============================================================================
+def _CompositeTile(tile_layers, windows, zoom, x, y):
+    """
+    Draws each layer over the ones before it and makes a PNG of the tile.
+
+    Args:
+        tile_layers (list): TileLayers, bottom first
+        windows (list): What tile_window returned for each layer
+        zoom, x, y (int): The tile
+
+    Returns:
+        bytes: The PNG of the tile, or None if it is empty
+    """
+    tile = np.zeros((TILE_SIZE, TILE_SIZE, 4))
+    for layer, window in zip(tile_layers, windows):
+        if window is None:
+            continue
+        rgba = layer.render(zoom, x, y, window = window)
+        # the usual "over" compositing
+        src_alpha = rgba[...,3:]
+        dst_alpha = tile[...,3:]*(1-src_alpha)
+        out_alpha = src_alpha + dst_alpha
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            tile[...,:3] = np.where(out_alpha > 0, (rgba[...,:3]*src_alpha + tile[...,:3]*dst_alpha)/out_alpha, 0)
+        tile[...,3:] = out_alpha
+
+    if not (tile[...,3] > 0).any():
+        return None
+
+    png = io.BytesIO()
+    mpimg.imsave(png, (tile*255).round().astype(np.uint8), format = "png")
+    return png.getvalue()
+
+#==============================================================================
+def RenderTile(tile_layers, zoom, x, y):
+    """
+    Renders a tile from a stack of layers, drawing each over the ones before it.
+
+    Args:
+        tile_layers (list): TileLayers, bottom first
+        zoom (int): The zoom level
+        x (int): The tile column (from the west)
+        y (int): The tile row (from the north)
+
+    Returns:
+        bytes: The PNG of the tile, or None if it is empty
+    """
+    windows = [layer.tile_window(zoom, x, y) for layer in tile_layers]
+    return _CompositeTile(tile_layers, windows, zoom, x, y)
+
+#==============================================================================
+def _RenderTileIfChanged(tile_layers, zoom, x, y, old_hash):
+    """
+    Reads the windows of a tile and hashes them with the colours of the layers. The tile is
+    only rendered if the hash isn't the one it was drawn with before.
+
+    Args:
+        tile_layers (list): TileLayers, bottom first
+        zoom, x, y (int): The tile
+        old_hash (str): The hash the tile was drawn with before, or None
+
+    Returns:
+        tuple: (input_hash, changed, png)
+    """
+    windows = [layer.tile_window(zoom, x, y) for layer in tile_layers]
+    tile_hash = hashlib.sha1()
+    for layer, window in zip(tile_layers, windows):
+        if window is not None:
+            tile_hash.update(layer.window_key(window))
+    input_hash = tile_hash.hexdigest()
+    if input_hash == old_hash:
+        return input_hash, False, None
+    return input_hash, True, _CompositeTile(tile_layers, windows, zoom, x, y)
+
+#==============================================================================
+def GetNativeZoom(tile_layers):
+    """
+    Gets the zoom level at which the tile pixels are about the size of the finest raster pixels.
+
+    Args:
+        tile_layers (list): TileLayers
+
+    Returns:
+        int: The zoom level
+    """
+    zoom = 0
+    for layer in tile_layers:
+        merc_extent = layer.web_mercator_extent
+        n_cols = (layer._extent[1]-layer._extent[0])/layer._info.cellsize
+        merc_cellsize = (merc_extent[1]-merc_extent[0])/n_cols
+        this_zoom = int(np.ceil(np.log2(2*WEB_MERCATOR_HALF_WIDTH/(TILE_SIZE*merc_cellsize))))
+        zoom = max(zoom, this_zoom)
+    return min(zoom, 24)
+
+#==============================================================================
+def WriteWebTiles(tile_layers, OutputName, min_zoom = None, max_zoom = None, n_threads = 4, name = None):
+    """
+    Writes the tiles of a stack of layers. If the output already has tiles, only the ones
+    whose inputs have changed are drawn again.
+
+    Args:
+        tile_layers (list): TileLayers, bottom first
+        OutputName (str): An .mbtiles file, or otherwise a directory for zoom/x/y.png tiles
+        min_zoom (int): The smallest zoom level. If None, 5 levels below max_zoom
+        max_zoom (int): The largest zoom level. If None, the zoom where the tile pixels are about the size of the raster pixels
+        n_threads (int): The number of threads to render the tiles with
+        name (str): The name of the tile set in the metadata. If None, the name of the output
+
+    Returns:
+        int: the number of tiles that were drawn
+    """
+    if len(tile_layers) == 0:
+        raise Exception("There are no raster layers to make tiles from")
+
+    if max_zoom is None:
+        max_zoom = GetNativeZoom(tile_layers)
+    if min_zoom is None:
+        min_zoom = max(0, max_zoom-5)
+    if min_zoom > max_zoom:
+        raise Exception("The minimum zoom ("+str(min_zoom)+") is bigger than the maximum zoom ("+str(max_zoom)+")")
+    if name is None:
+        name = os.path.splitext(os.path.basename(os.path.normpath(OutputName)))[0]
+
+    if OutputName.endswith(".mbtiles"):
+        writer = _MBTilesWriter(OutputName)
+    else:
+        writer = _XYZDirectoryWriter(OutputName)
+
+    extents = [layer.web_mercator_extent for layer in tile_layers]
+    merc_extent = [min(e[0] for e in extents), max(e[1] for e in extents),
+                   min(e[2] for e in extents), max(e[3] for e in extents)]
+
+    # the tiles are submitted in batches so only a few PNGs are held at once
+    batch_size = 4*max(1, n_threads)
+
+    n_drawn = 0
+    try:
+        # tiles at zoom levels we aren't making any more
+        for zoom in writer.get_zooms():
+            if zoom < min_zoom or zoom > max_zoom:
+                for x, y in writer.get_hashes(zoom):
+                    writer.delete(zoom, x, y)
+
+        with ThreadPoolExecutor(max_workers = max(1, n_threads)) as executor:
+            for zoom in range(min_zoom, max_zoom+1):
+                old_hashes = writer.get_hashes(zoom)
+                tiles = []
+                for x, y in TilesCoveringExtent(merc_extent, zoom):
+                    tile_extent = TileBounds(zoom, x, y)
+                    these_layers = [layer for layer in tile_layers if layer.overlaps(tile_extent)]
+                    tiles.append((x, y, these_layers))
+
+                # tiles that the layers no longer cover
+                covered = set((x, y) for x, y, these_layers in tiles)
+                n_deleted = 0
+                for x, y in old_hashes:
+                    if (x, y) not in covered:
+                        writer.delete(zoom, x, y)
+                        n_deleted += 1
+
+                n_drawn_zoom = 0
+                for i in range(0, len(tiles), batch_size):
+                    batch = tiles[i:i+batch_size]
+                    futures = [executor.submit(_RenderTileIfChanged, these_layers, zoom, x, y, old_hashes.get((x, y)))
+                               for x, y, these_layers in batch]
+                    # the database is only touched from this thread
+                    for (x, y, these_layers), future in zip(batch, futures):
+                        input_hash, changed, png = future.result()
+                        if changed:
+                            writer.put(zoom, x, y, png, input_hash)
+                            n_drawn_zoom += 1
+                    del futures
+
+                print("Zoom "+str(zoom)+": I drew "+str(n_drawn_zoom)+" of "+str(len(tiles))+" tiles, the rest haven't changed. "+
+                      "I deleted "+str(n_deleted)+" tiles that are no longer covered.")
+                n_drawn += n_drawn_zoom
+
+        lon_lat = TransformExtent(merc_extent, "EPSG:3857", "EPSG:4326")
+        writer.set_metadata({"name": name,
+                             "format": "png",
+                             "type": "overlay",
+                             "minzoom": min_zoom,
+                             "maxzoom": max_zoom,
+                             "bounds": ",".join(str(v) for v in [lon_lat[0], lon_lat[2], lon_lat[1], lon_lat[3]]),
+                             "center": ",".join(str(v) for v in [(lon_lat[0]+lon_lat[1])/2, (lon_lat[2]+lon_lat[3])/2, min_zoom])})
+    finally:
+        writer.close()
+
+    print("I drew "+str(n_drawn)+" tiles into "+OutputName)
+    return n_drawn
@@ -99,7 +99,7 @@ def SimpleHillshade(DataDirectory,Base_file, cmap = "terrain", cbar_loc = "right
     plt.clf()
 
     # set up the base image and the map
-    MF = MapFigure(BackgroundRasterName, DataDirectory,coord_type="UTM_km",colourbar_location = cbar_loc)
+    MF = MapFigure(BackgroundRasterName, DataDirectory,coord_type="UTM_km",colourbar_location = cbar_loc, fig_width_inches = fig_size_inches, dpi = dpi)
     MF.add_drape_image(DrapeRasterName,DataDirectory,colourmap = cmap, alpha = 0.6, colorbarlabel = "Elevation (m)")
 
     if(use_scalebar):
@@ -174,7 +174,7 @@ def SimpleDrape(DataDirectory,Base_file, Drape_prefix, cmap = "cubehelix", cbar_
     plt.clf()
 
     # set up the base image and the map
-    MF = MapFigure(BackgroundRasterName, DataDirectory,coord_type=coord_type,colourbar_location = cbar_loc)
+    MF = MapFigure(BackgroundRasterName, DataDirectory,coord_type=coord_type,colourbar_location = cbar_loc, fig_width_inches = fig_size_inches, dpi = dpi)
     #MF.add_drape_image(ElevationName,DataDirectory,colourmap = "gray", alpha = 0.6, colorbarlabel = None)
     MF.add_drape_image(DrapeName,DataDirectory,colourmap = cmap, alpha = 0.6, colorbarlabel = cbar_label, norm = drape_cnorm, colour_min_max = colour_min_max,discrete_cmap = discrete_cmap,n_colours=n_colours)
 
@@ -366,7 +366,7 @@ def SimpleSwath(DataDirectory,swath_csv_name, FigFileName = "swath.png",cmap = "
     return imname
 
 
-def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, out_fname_prefix = "", channel_colourmap = "Blues", save_fig = True, use_scalebar = False):
+def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250, out_fname_prefix = "", channel_colourmap = "Blues", save_fig = True, use_scalebar = False, aggregate = None):
     """
     This function prints a channel map over a hillshade. It gets ALL the channels within the DEM: it automatically selects the _CN csv file that is obtained by the print channel network tool in lsdtopotools. Channels are coloured by the stream order.
 
@@ -384,6 +384,8 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
         channel_colourmap (str or cmap): the colourmap of the point data
         save_fig (bool): If true, saves the fig, else, returns the filename
         use_scalebar (bool): If true inserts a scalebar in the image
+        aggregate (str): If this is given ("mean", "max", "min" or "count") the channel nodes are binned into pixels at the
+            resolution of the figure and drawn as one image. Use it for big channel networks, especially in pdf and svg figures.
         
     Returns:
         If save_fig is true, return a string with the name of the image (printed to file). If save_fig is false, returns the figure handle to the shaded relief plot with the channels.
@@ -419,7 +421,8 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
     MF.add_point_data(thisPointData,column_for_plotting = "Stream Order", this_colourmap = channel_colourmap,
                        scale_points = True,column_for_scaling = "Stream Order",
                        scaled_data_in_log = False,
-                       max_point_size = 5, min_point_size = 1,zorder = 10, alpha = 1)
+                       max_point_size = 5, min_point_size = 1,zorder = 10, alpha = 1,
+                       aggregate = aggregate, aggregate_n_pixels = int(fig_size_inches*dpi))
 
     if(use_scalebar):
         print("Let me add a scalebar")
@@ -447,7 +450,7 @@ def PrintAllChannels(DataDirectory,fname_prefix, add_basin_labels = True, cmap =
     return thing_to_return
 
 
-def PrintChannels(DataDirectory,fname_prefix, ChannelFileName, cmap = "jet", size_format = "ESURF", fig_format = "png", dpi = 250, out_fname_prefix = "", plotting_column = "basin_key", save_fig = True,use_scalebar = False):
+def PrintChannels(DataDirectory,fname_prefix, ChannelFileName, cmap = "jet", size_format = "ESURF", fig_format = "png", dpi = 250, out_fname_prefix = "", plotting_column = "basin_key", save_fig = True,use_scalebar = False, aggregate = None):
     """
     This function prints a channel map over a hillshade. It is more flexible than PrintAllChannels since you can choose the channel csv and you can also choose the column in the csv to plot
 
@@ -463,6 +466,8 @@ def PrintChannels(DataDirectory,fname_prefix, ChannelFileName, cmap = "jet", siz
         plotting_column (str): the column to plot from the csv file
         save_fig (bool): If true, saves the fig, else, returns the filename
         use_scalebar (bool): If true inserts a scalebar in the image
+        aggregate (str): If this is given ("mean", "max", "min" or "count") the channel nodes are binned into pixels at the
+            resolution of the figure and drawn as one image. Use it for big channel networks, especially in pdf and svg figures.
         
     Returns:
         If save_fig is true, return a string with the name of the image (printed to file). If save_fig is false, returns the figure handle to the shaded relief plot with the channels.
@@ -504,7 +509,8 @@ def PrintChannels(DataDirectory,fname_prefix, ChannelFileName, cmap = "jet", siz
     MF.add_point_data(thisPointData,column_for_plotting = plotting_column,
                        scale_points = True, column_for_scaling = "drainage_area",
                        this_colourmap = cmap, scaled_data_in_log = True,
-                       max_point_size = 5, min_point_size = 1)
+                       max_point_size = 5, min_point_size = 1,
+                       aggregate = aggregate, aggregate_n_pixels = int(fig_size_inches*dpi))
 
     if(use_scalebar):
         print("Let me add a scalebar")
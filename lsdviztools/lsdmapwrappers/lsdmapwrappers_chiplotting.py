@@ -38,7 +38,7 @@ from lsdviztools.lsdmapfigure import plottinghelpers as PlotHelp
 from lsdviztools.lsdplottingtools import lsdmap_chiplotting as LSDCP
 
 
-def PrintChiChannels(DataDirectory,fname_prefix, ChannelFileName, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250,plotting_column = "source_key",discrete_colours = False, NColours = 10, out_fname_prefix = ""):
+def PrintChiChannels(DataDirectory,fname_prefix, ChannelFileName, add_basin_labels = True, cmap = "jet", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250,plotting_column = "source_key",discrete_colours = False, NColours = 10, out_fname_prefix = "", aggregate = None):
     """
     This function prints a channel map over a hillshade.
 
@@ -57,6 +57,8 @@ def PrintChiChannels(DataDirectory,fname_prefix, ChannelFileName, add_basin_labe
         discrete_colours (bool): if true use a discrete colourmap
         NColours (int): the number of colours to cycle through when making the colourmap
         out_fname_prefix (str): The prefix of the image file. If blank uses the fname_prefix
+        aggregate (str): If this is given ("mean", "max", "min" or "count") the channel nodes are binned into pixels at the
+            resolution of the figure and drawn as one image. Use it for big channel networks, especially in pdf and svg figures.
 
 
     Returns:
@@ -91,7 +93,8 @@ def PrintChiChannels(DataDirectory,fname_prefix, ChannelFileName, add_basin_labe
     MF.add_point_data(thisPointData,column_for_plotting = plotting_column,this_colourmap = cmap,
                        scale_points = True,column_for_scaling = "drainage_area",
                        scaled_data_in_log = True,
-                       max_point_size = 5, min_point_size = 1,discrete_colours = discrete_colours, NColours = NColours)
+                       max_point_size = 5, min_point_size = 1,discrete_colours = discrete_colours, NColours = NColours,
+                       aggregate = aggregate, aggregate_n_pixels = int(fig_size_inches*dpi))
 
     # Save the image
     if len(out_fname_prefix) == 0:
@@ -209,6 +212,102 @@ def PrintChiChannelsAndBasins(DataDirectory,fname_prefix, ChannelFileName, add_b
 
 
 
+def PrintAllRasterPlots(DataDirectory,fname_prefix, ChannelFileName, size_format = "ESURF", fig_format = "png", dpi = 250, Basin_remove_list = [], Basin_rename_dict = {}, value_dict = {}, value_dict_single_basin = {}, out_fname_prefix = "", min_channel_point_size = 0.5, max_channel_point_size = 2):
+    """
+    This prints the standard set of raster plots (the labelled basins, the stacked basins, the k_sn channels
+    and the source channels) from one MapFigure, so the hillshade and the channel data are only read once.
+    The figures are the same as the ones you get from PrintBasins_Complex and PrintChiChannelsAndBasins.
+
+    Args:
+        DataDirectory (str): the data directory with the m/n csv files
+        fname_prefix (str): The prefix for the m/n csv files
+        ChannelFileName (str): The name of the channel csv file (with the m_chi, source_key and drainage_area columns)
+        size_format (str): Either geomorphology or big. Anything else gets you a 4.9 inch wide figure (standard ESURF size)
+        fig_format (str): An image format. png, pdf, eps, svg all valid
+        dpi (int): The dots per inch of the figure
+        Basin_remove_list (list): A lists containing the keys of basins you want to remove from plotting
+        Basin_rename_dict (dict): A dict where the key is the basin key, and the value is a new name for the basin
+        value_dict (dict): The values used to colour the basins in the stacked basin and source plots
+        value_dict_single_basin (dict): The values used to colour the basins in the k_sn plot
+        out_fname_prefix (str): The prefix of the image files. If blank uses the fname_prefix
+        min_channel_point_size (float): The minimum size of a channel point in points
+        max_channel_point_size (float): The maximum size of a channel point in points
+
+    Returns:
+        A list of the names of the figures
+    """
+    # set figure sizes based on format
+    if size_format == "geomorphology":
+        fig_size_inches = 6.25
+    elif size_format == "big":
+        fig_size_inches = 16
+    else:
+        fig_size_inches = 4.92126
+
+    if len(out_fname_prefix) == 0:
+        out_fname_prefix = fname_prefix
+
+    # get the rasters
+    raster_ext = '.bil'
+    HillshadeName = fname_prefix+'_hs'+raster_ext
+    BasinsName = fname_prefix+'_AllBasins'+raster_ext
+
+    # The channel data is read once and shared by the channel plots
+    thisPointData = LSDMap_PD.LSDMap_PointData(DataDirectory+ChannelFileName)
+    thisPointData.selectValue("basin_key",value = Basin_remove_list, operator = "!=")
+
+    # clear the plot
+    plt.clf()
+    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", colourbar_location="None")
+
+    basin_kwargs = {"RasterName": BasinsName, "BasinInfoPrefix": fname_prefix, "Directory": DataDirectory,
+                    "mask_list": Basin_remove_list, "rename_dict": Basin_rename_dict, "use_keys_not_junctions": True,
+                    "show_colourbar": False}
+    channel_kwargs = {"thisPointData": thisPointData, "scale_points": True, "column_for_scaling": "drainage_area",
+                      "scaled_data_in_log": True, "max_point_size": max_channel_point_size,
+                      "min_point_size": min_channel_point_size, "zorder": 10}
+
+    specs = []
+
+    # First the basins, labeled
+    specs.append({"FigFileName": DataDirectory+out_fname_prefix+"_basins_selected_basins."+fig_format,
+                  "layers": [["add_basin_plot", dict(basin_kwargs, discrete_cmap=True, n_colours=15,
+                                                     colourmap = "jet", adjust_text = False, label_basins = True)]],
+                  "transparent": True})
+
+    # Basins colour coded
+    specs.append({"FigFileName": DataDirectory+out_fname_prefix+"_stack_basins_selected_basins."+fig_format,
+                  "layers": [["add_basin_plot", dict(basin_kwargs, value_dict = value_dict, discrete_cmap=True, n_colours=15,
+                                                     colourmap = "gray", adjust_text = False, label_basins = True)]],
+                  "transparent": True})
+
+    # Now the chi steepness
+    specs.append({"FigFileName": DataDirectory+out_fname_prefix+"_ksn_chi_channels_and_basins."+fig_format,
+                  "layers": [["add_basin_plot", dict(basin_kwargs, value_dict = value_dict_single_basin, label_basins = False,
+                                                     colourmap = "gray")],
+                             ["add_point_data", dict(channel_kwargs, column_for_plotting = "m_chi", show_colourbar = True,
+                                                     colourbar_location = "right", this_colourmap = "viridis",
+                                                     colorbarlabel = "$\mathrm{log}_{10} \; \mathrm{of} \; k_{sn}$",
+                                                     colour_log = True, discrete_colours = False, NColours = 10)]]})
+
+    # Now plot the channels coloured by the source number
+    specs.append({"FigFileName": DataDirectory+out_fname_prefix+"sources_chi_channels_and_basins."+fig_format,
+                  "layers": [["add_basin_plot", dict(basin_kwargs, value_dict = value_dict, label_basins = False,
+                                                     colourmap = "gray")],
+                             ["add_point_data", dict(channel_kwargs, column_for_plotting = "source_key", show_colourbar = True,
+                                                     colourbar_location = "None", this_colourmap = "tab20b",
+                                                     colorbarlabel = "Colourbar", colour_log = False,
+                                                     discrete_colours = True, NColours = 20)]]})
+
+    for spec in specs:
+        spec.update({"fig_width_inches": fig_size_inches, "FigFormat": fig_format, "Fig_dpi": dpi})
+
+    FigFileNames = MF.render_figures(specs)
+    plt.close(MF.fig)
+    return FigFileNames
+
+
+
 def PrintChiCoordChannelsAndBasins(DataDirectory,fname_prefix, ChannelFileName, add_basin_labels = True, cmap = "cubehelix", cbar_loc = "right", size_format = "ESURF", fig_format = "png", dpi = 250,plotting_column = "source_key",discrete_colours = False, NColours = 10, colour_log = True, colorbarlabel = "Colourbar", Basin_remove_list = [], Basin_rename_dict = {} , value_dict = {}, plot_chi_raster = False, out_fname_prefix = "", show_basins = True, min_channel_point_size = 0.5, max_channel_point_size = 2):
     """
     This function prints a channel map and has the option of plooting over a raster of chi values. Similar to PrintChiChannelsAndBasins but adds the map of chi coordinate underneath
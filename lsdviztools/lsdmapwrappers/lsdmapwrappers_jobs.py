@@ -0,0 +1,398 @@
+"""
+    This contains functions for running figure jobs, so the command line tools
+    can farm out independent figures to several processes.
+
+    A figure job is a list of [function, args, kwargs]. Make them with FigureJob.
+    The function has to be importable (i.e., a module level function like the
+    wrapper functions) so it can be sent to another process. Only the arguments
+    are sent: each job reads its own rasters, and the worker processes read ENVI
+    rasters with numpy.memmap so they share them through the page cache
+    instead of each holding a copy. The memmap reader gives the same arrays as
+    gdal (see plottingraster.SetMemmapRasters), so the figures don't depend on n_jobs.
+
+    If you give RunFigureJobs a manifest file, the files each job reads and
+    writes are recorded as it runs, along with a hash of the contents of every
+    file it read. Rasters and vector files are recorded by the code that opens
+    them (see lsdmap_gdalio.FileRecorder); files opened by python, like csv
+    files and the figures, are recorded with an audit hook (so python 3.8 or
+    later). The next time, a job is skipped if its options, and the contents of
+    all the files it read, are the same and the files it wrote are still there.
+
+    Released under GPL3
+"""
+
+import matplotlib
+# Force matplotlib to not use any Xwindows backend.
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import colors
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from lsdviztools.lsdmapfigure import plottinghelpers as Helper
+from lsdviztools.lsdmapfigure import plottingraster as LSDMF_PR
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+
+
+def FigureJob(function, *args, **kwargs):
+    """
+    This packs a function and its arguments into a figure job.
+
+    Args:
+        function: The function that makes the figure(s). It has to be a module level function.
+        *args, **kwargs: The arguments of the function
+
+    Returns:
+        The job: [function, args, kwargs]
+    """
+    return [function, list(args), kwargs]
+
+
+def FigureJobSequence(*jobs):
+    """
+    This packs several figure jobs into one job that runs them in order. Use this
+    when one job needs files made by another (e.g., a summary csv and the plots of it).
+
+    Args:
+        *jobs: figure jobs, made by FigureJob
+
+    Returns:
+        The job
+    """
+    return FigureJob(_RunFigureJobSequence, list(jobs))
+
+
+def UniqueFigureJobs(job_list):
+    """
+    This removes repeated jobs (the same function with the same arguments) from a list of figure jobs,
+    keeping the first of each. Use it when several command line options ask for the same figure, so two
+    processes don't write the same files at the same time.
+
+    Args:
+        job_list (list): The figure jobs
+
+    Returns:
+        The list without the repeats, in the same order
+    """
+    unique_jobs = []
+    job_keys = set()
+    for n, job in enumerate(job_list):
+        job_key = _TryGetFigureJobKey(job, n+1)
+        if job_key is None:
+            # we can't tell if it is a repeat, so it is kept
+            unique_jobs.append(job)
+        elif job_key not in job_keys:
+            job_keys.add(job_key)
+            unique_jobs.append(job)
+    return unique_jobs
+
+
+def _RunFigureJobSequence(job_list):
+    """
+    Runs a list of figure jobs in order. This is what FigureJobSequence runs.
+    """
+    return [_RunFigureJob(job) for job in job_list]
+
+
+def _RunFigureJob(job):
+    """
+    Runs one figure job and closes any figures it left open.
+    """
+    function, args, kwargs = job
+    try:
+        return function(*args, **kwargs)
+    finally:
+        plt.close("all")
+
+
+# Python can't remove an audit hook, so it is added the first time a job is recorded and
+# does nothing unless a job is being recorded (i.e. a FileRecorder is active)
+_AuditHookInstalled = False
+_IgnoredDirectories = None
+
+# The default repr of an object has its address in it, e.g. <Thing object at 0x7f...>
+_MemoryAddress = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _GetIgnoredDirectories():
+    """
+    The directories whose files are never counted as inputs or outputs of a job:
+    python itself, the installed packages and matplotlib's config and cache.
+    """
+    global _IgnoredDirectories
+    if _IgnoredDirectories is None:
+        directories = set([sys.prefix, sys.base_prefix, sys.exec_prefix, matplotlib.get_configdir(),
+                           matplotlib.get_cachedir(), matplotlib.get_data_path(), "/dev", "/proc", "/sys"])
+        _IgnoredDirectories = tuple(os.path.join(os.path.abspath(d), "") for d in directories)
+    return _IgnoredDirectories
+
+
+def _AuditFiles(event, args):
+    """
+    The audit hook that passes the files python opens (csv files, the saved figures, memory mapped
+    rasters) to the active FileRecorder. Files opened by gdal, rasterio, fiona and geopandas
+    are recorded by lsdplottingtools itself.
+    """
+    if event != "open" or not LSDMap_IO.IsRecordingFiles():
+        return
+    path, mode, flags = args
+
+    if isinstance(path, bytes):
+        path = os.fsdecode(path)
+    if not isinstance(path, str):
+        return
+    path = os.path.abspath(path)
+    if path.startswith(_GetIgnoredDirectories()):
+        return
+
+    if mode is None:
+        writing = flags is not None and (flags & (os.O_WRONLY | os.O_RDWR)) != 0
+    else:
+        writing = any(c in mode for c in "wax+")
+    if writing:
+        LSDMap_IO.RecordFileWrite(path)
+    else:
+        LSDMap_IO.RecordFileRead(path)
+
+
+def _RunRecordedFigureJob(job):
+    """
+    Runs one figure job and records the files it read and wrote.
+
+    Returns:
+        [what the job returned, the files it read, the files it wrote]
+    """
+    global _AuditHookInstalled
+    if not _AuditHookInstalled:
+        _GetIgnoredDirectories()
+        sys.addaudithook(_AuditFiles)
+        _AuditHookInstalled = True
+
+    with LSDMap_IO.FileRecorder() as recorder:
+        result = _RunFigureJob(job)
+
+    # files the job made and then read (e.g., a summary csv) aren't inputs
+    inputs = recorder.inputs - recorder.outputs
+    return [result, sorted(inputs), sorted(recorder.outputs)]
+
+
+def _CanonicalJobParameters(thing):
+    """
+    Turns the function and arguments of a job into something whose repr is the same
+    from one run to the next (functions are named, not given by their address). Colourmaps
+    and normalisations are described by their contents. Anything else whose repr has a
+    memory address in it can't be keyed, so you get an exception.
+    """
+    if isinstance(thing, colors.Colormap):
+        lut = thing(np.linspace(0, 1, thing.N), bytes = True)
+        return ["colormap", thing.name, thing.N, hashlib.sha1(lut.tobytes()).hexdigest()]
+    if isinstance(thing, colors.Normalize):
+        return ["norm", repr(Helper.GetNormKey(thing))]
+    if callable(thing) and hasattr(thing, "__qualname__"):
+        return getattr(thing, "__module__", "")+"."+getattr(thing, "__qualname__", repr(thing))
+    if isinstance(thing, dict):
+        return [("dict",)] + sorted([(repr(key), _CanonicalJobParameters(value)) for key, value in thing.items()])
+    if isinstance(thing, (list, tuple)):
+        return [type(thing).__name__] + [_CanonicalJobParameters(item) for item in thing]
+    if isinstance(thing, (set, frozenset)):
+        return ["set"] + sorted(repr(_CanonicalJobParameters(item)) for item in thing)
+    if hasattr(thing, "tobytes") and hasattr(thing, "shape"):
+        return ["array", str(thing.dtype), thing.shape, hashlib.sha1(thing.tobytes()).hexdigest()]
+    thing_repr = repr(thing)
+    if _MemoryAddress.search(thing_repr):
+        raise Exception("I can't make a key for a figure job with this argument, since it is different every time: "+thing_repr)
+    return thing_repr
+
+
+def GetFigureJobKey(job):
+    """
+    Gets a key for a figure job from its function and all of its arguments.
+
+    Args:
+        job: The figure job
+
+    Returns:
+        str: the key. If an argument can't be keyed (its repr has a memory address in it) you get an exception.
+    """
+    return hashlib.sha1(repr(_CanonicalJobParameters(job)).encode("utf-8")).hexdigest()
+
+
+def _TryGetFigureJobKey(job, job_number):
+    """
+    Gets the key of a figure job, or None if it can't be keyed.
+    """
+    try:
+        return GetFigureJobKey(job)
+    except Exception as e:
+        print("Figure job "+str(job_number)+" ("+job[0].__name__+") will always be run: "+str(e))
+        return None
+
+
+class FigureManifest(object):
+    """
+    The record of the figure jobs that have been run, kept in a json file. For each job it has the
+    files it wrote and the content hash of each file it read. The hashes of the files are also kept
+    with their size and modification time, so a file is only read again to hash it if it might have changed.
+
+    Args:
+        FileName (str): The manifest file. It is made if it doesn't exist.
+    """
+    def __init__(self, FileName):
+        self._FileName = FileName
+        self._files = {}
+        self._jobs = {}
+        if os.path.exists(FileName):
+            try:
+                with open(FileName) as f:
+                    manifest = json.load(f)
+                self._files = manifest["files"]
+                self._jobs = manifest["jobs"]
+            except (ValueError, KeyError):
+                print("I can't read the figure manifest "+FileName+", so I'll make all the figures.")
+
+    def file_hash(self, path):
+        """
+        Gets the sha1 of the contents of a file, or None if it doesn't exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        known = self._files.get(path)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                sha1.update(chunk)
+        self._files[path] = [stat.st_size, stat.st_mtime_ns, sha1.hexdigest()]
+        return self._files[path][2]
+
+    def is_up_to_date(self, job_key):
+        """
+        Checks if a job was run before with the same options, none of the files it read have changed
+        and the files it wrote are all still there.
+        """
+        entry = self._jobs.get(job_key)
+        if entry is None or len(entry["outputs"]) == 0:
+            return False
+        for path in entry["outputs"]:
+            if not os.path.exists(path):
+                return False
+        for path, content_hash in entry["inputs"].items():
+            if self.file_hash(path) != content_hash:
+                return False
+        return True
+
+    def record(self, job_key, inputs, outputs):
+        """
+        Records a job that has just been run.
+        """
+        input_hashes = {}
+        for path in inputs:
+            content_hash = self.file_hash(path)
+            if content_hash is not None:
+                input_hashes[path] = content_hash
+        self._jobs[job_key] = {"inputs": input_hashes, "outputs": list(outputs)}
+
+    def save(self):
+        """
+        Writes the manifest. It is written to a temporary file first so a crash can't leave half a manifest.
+        """
+        temp_file = self._FileName+".tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"files": self._files, "jobs": self._jobs}, f, indent = 1)
+        os.replace(temp_file, self._FileName)
+
+
+def _InitFigureWorker():
+    """
+    This sets up each worker process.
+    """
+    matplotlib.use('Agg')
+    LSDMF_PR.SetMemmapRasters(True)
+
+
+def RunFigureJobs(job_list, n_jobs = 1, manifest_file = None):
+    """
+    This runs a list of figure jobs. If n_jobs is 1 they are run one after
+    another in this process, in the order they are in the list. Otherwise they
+    are run in a pool of n_jobs processes. A failed job doesn't stop the others;
+    you get an exception listing the failures once they have all finished.
+
+    Args:
+        job_list (list): The figure jobs, made by FigureJob or FigureJobSequence
+        n_jobs (int): The number of processes
+        manifest_file (str): If this is given, jobs that have been run before with the same options and
+            the same input files (see FigureManifest) are skipped. None runs everything.
+
+    Returns:
+        A list of whatever each job returned (None for the ones that were skipped)
+    """
+    if len(job_list) == 0:
+        return []
+
+    start_time = time.time()
+    results = [None]*len(job_list)
+    failures = []
+
+    manifest = None
+    run_function = _RunFigureJob
+    if manifest_file is not None:
+        if hasattr(sys, "addaudithook"):
+            manifest = FigureManifest(manifest_file)
+            run_function = _RunRecordedFigureJob
+        else:
+            print("I need python 3.8 or later to record the inputs of the figures, so I'll make all of them.")
+
+    job_indices = list(range(len(job_list)))
+    if manifest is not None:
+        job_keys = [_TryGetFigureJobKey(job, i+1) for i, job in enumerate(job_list)]
+        job_indices = [i for i in job_indices if job_keys[i] is None or not manifest.is_up_to_date(job_keys[i])]
+        print("The inputs of "+str(len(job_list)-len(job_indices))+" of the "+str(len(job_list))+" figure jobs haven't changed, so I'm skipping them.")
+
+    def finish_job(i, output):
+        if manifest is None:
+            results[i] = output
+        else:
+            results[i] = output[0]
+            if job_keys[i] is not None:
+                manifest.record(job_keys[i], output[1], output[2])
+
+    try:
+        if n_jobs <= 1:
+            print("I am running "+str(len(job_indices))+" figure jobs, one at a time.")
+            for i in job_indices:
+                try:
+                    finish_job(i, run_function(job_list[i]))
+                except Exception as e:
+                    print("Figure job "+str(i+1)+" ("+job_list[i][0].__name__+") failed with: "+str(e))
+                    failures.append(job_list[i][0].__name__)
+        elif len(job_indices) > 0:
+            print("I am running "+str(len(job_indices))+" figure jobs on "+str(n_jobs)+" processes.")
+            with ProcessPoolExecutor(max_workers = n_jobs, initializer = _InitFigureWorker) as executor:
+                futures = [executor.submit(run_function, job_list[i]) for i in job_indices]
+                for n,(i,future) in enumerate(zip(job_indices,futures)):
+                    try:
+                        finish_job(i, future.result())
+                        print("Finished figure job "+str(n+1)+" of "+str(len(job_indices)))
+                    except Exception as e:
+                        print("Figure job "+str(i+1)+" ("+job_list[i][0].__name__+") failed with: "+str(e))
+                        failures.append(job_list[i][0].__name__)
+    finally:
+        # the jobs that did finish are kept even if one of them failed
+        if manifest is not None:
+            manifest.save()
+
+    print("The figure jobs took "+str(round(time.time()-start_time,1))+" seconds.")
+    if len(failures) > 0:
+        raise Exception("These figure jobs failed: "+", ".join(failures))
+    return results
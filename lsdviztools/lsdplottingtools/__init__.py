@@ -9,6 +9,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from .lsdmap_basicplotting import *
 from .lsdmap_gdalio import *
+from .lsdmap_hillshade import *
 from .lsdmap_basicmanipulation import *
 from .lsdmap_pointtools import *
 from .lsdmap_chiplotting import *
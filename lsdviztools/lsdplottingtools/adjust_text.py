@@ -29,6 +29,130 @@ def get_points_inside_bbox(x, y, bbox):
     y_in = np.logical_and(y>y1, y<y2)
     return np.where(x_in & y_in)[0]
 
+def get_bbox_extents(bboxes):
+    """
+    The extents of a list of bboxes as an (n, 4) array of xmin, ymin, xmax, ymax
+    """
+    if len(bboxes) == 0:
+        return np.zeros((0, 4))
+    return np.array([[b.xmin, b.ymin, b.xmax, b.ymax] for b in bboxes],
+                    dtype=float)
+
+def _grid_cells(extents, cell_size, origin, cell_bounds):
+    """
+    Lists the grid cells that each box touches, as (box index, cell key)
+    pairs. Points are boxes with no width or height.
+    """
+    cx0 = np.floor((extents[:, 0]-origin[0])/cell_size).astype(np.int64)
+    cy0 = np.floor((extents[:, 1]-origin[1])/cell_size).astype(np.int64)
+    cx1 = np.floor((extents[:, 2]-origin[0])/cell_size).astype(np.int64)
+    cy1 = np.floor((extents[:, 3]-origin[1])/cell_size).astype(np.int64)
+    # Cells outside the other set can't hold a pair, so don't list them
+    cx0 = np.maximum(cx0, cell_bounds[0])
+    cy0 = np.maximum(cy0, cell_bounds[1])
+    cx1 = np.minimum(cx1, cell_bounds[2])
+    cy1 = np.minimum(cy1, cell_bounds[3])
+    ncx = np.maximum(cx1-cx0+1, 0)
+    ncy = np.maximum(cy1-cy0+1, 0)
+    counts = ncx*ncy
+
+    box = np.repeat(np.arange(len(extents)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts,
+                                                 counts)
+    cx = cx0[box] + offset % ncx[box]
+    cy = cy0[box] + offset // ncx[box]
+    n_rows = cell_bounds[3] - cell_bounds[1] + 1
+    return box, (cx-cell_bounds[0])*n_rows + (cy-cell_bounds[1])
+
+def get_candidate_pairs(extents1, extents2, cell_size=None):
+    """
+    Uses a grid hash to find the pairs of boxes (i from extents1, j from
+    extents2) that might overlap: the ones that share at least one grid cell.
+    This is a superset of the overlapping pairs, so check them afterwards.
+    The cells are about as big as the boxes in extents1, so each box only
+    looks at its neighbours rather than at every other box.
+
+    Returns:
+        two arrays of indices, i and j, with each pair listed once
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    if len(extents1) == 0 or len(extents2) == 0:
+        return empty
+    if cell_size is None:
+        sizes = np.maximum(extents1[:, 2]-extents1[:, 0],
+                           extents1[:, 3]-extents1[:, 1])
+        cell_size = np.median(sizes)
+    if not np.isfinite(cell_size) or cell_size <= 0:
+        span = max(np.ptp(np.concatenate([extents1[:, [0, 2]],
+                                          extents2[:, [0, 2]]])),
+                   np.ptp(np.concatenate([extents1[:, [1, 3]],
+                                          extents2[:, [1, 3]]])))
+        cell_size = span/max(1.0, np.sqrt(len(extents1))) if span > 0 else 1.0
+
+    # Only the cells covered by both sets matter
+    origin = (min(extents1[:, 0].min(), extents2[:, 0].min()),
+              min(extents1[:, 1].min(), extents2[:, 1].min()))
+    bounds = []
+    for extents in (extents1, extents2):
+        bounds.append([np.floor((extents[:, 0].min()-origin[0])/cell_size),
+                       np.floor((extents[:, 1].min()-origin[1])/cell_size),
+                       np.floor((extents[:, 2].max()-origin[0])/cell_size),
+                       np.floor((extents[:, 3].max()-origin[1])/cell_size)])
+    bounds = np.array(bounds, dtype=np.int64)
+    cell_bounds = np.concatenate([bounds[:, :2].max(axis=0),
+                                  bounds[:, 2:].min(axis=0)])
+    if cell_bounds[0] > cell_bounds[2] or cell_bounds[1] > cell_bounds[3]:
+        return empty
+
+    box1, cells1 = _grid_cells(extents1, cell_size, origin, cell_bounds)
+    box2, cells2 = _grid_cells(extents2, cell_size, origin, cell_bounds)
+
+    # Join the two lists on the cell keys
+    order = np.argsort(cells2, kind='mergesort')
+    cells2 = cells2[order]
+    box2 = box2[order]
+    lo = np.searchsorted(cells2, cells1, side='left')
+    hi = np.searchsorted(cells2, cells1, side='right')
+    counts = hi - lo
+    i = np.repeat(box1, counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts,
+                                                 counts)
+    j = box2[np.repeat(lo, counts) + offset]
+
+    # Boxes that share several cells turn up several times
+    pair_keys = np.unique(i*len(extents2) + j)
+    return pair_keys // len(extents2), pair_keys % len(extents2)
+
+def get_points_inside_bboxes(x, y, extents):
+    """
+    Finds every point that is strictly inside each box, as in
+    get_points_inside_bbox but for all the boxes at once.
+
+    Returns:
+        two arrays of indices: the boxes and the points inside them
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Points with no position can't be inside anything
+    valid = np.where(np.isfinite(x) & np.isfinite(y))[0]
+    point_extents = np.column_stack([x[valid], y[valid], x[valid], y[valid]])
+    i, j = get_candidate_pairs(extents, point_extents)
+    j = valid[j]
+    inside = ((x[j] > extents[i, 0]) & (x[j] < extents[i, 2]) &
+              (y[j] > extents[i, 1]) & (y[j] < extents[i, 3]))
+    return i[inside], j[inside]
+
+def get_intersection_sizes(extents1, extents2):
+    """
+    The width and height of the intersection of each pair of boxes, as
+    Bbox.intersection works them out. Negative if they don't intersect.
+    """
+    w = (np.minimum(extents1[..., 2], extents2[..., 2]) -
+         np.maximum(extents1[..., 0], extents2[..., 0]))
+    h = (np.minimum(extents1[..., 3], extents2[..., 3]) -
+         np.maximum(extents1[..., 1], extents2[..., 1]))
+    return w, h
+
 def get_renderer(fig):
     try: 
         return fig.canvas.get_renderer()
@@ -109,6 +233,9 @@ def optimally_align_text(x, y, texts, expand=(1., 1.), add_bboxes=[],
     else:
         va = ['bottom', 'top', 'center']
     alignment = list(product(ha, va))
+    x = np.asarray(x)
+    y = np.asarray(y)
+    other_extents = get_bbox_extents(bboxes+add_bboxes)
     for i, text in enumerate(texts):
         counts = []
         for h, v in alignment:
@@ -119,10 +246,10 @@ def optimally_align_text(x, y, texts, expand=(1., 1.), add_bboxes=[],
             bbox = text.get_window_extent(r).expanded(*expand).\
                                        transformed(ax.transData.inverted())
             c = len(get_points_inside_bbox(x, y, bbox))
-            intersections = [bbox.intersection(bbox, bbox2) for bbox2 in
-                             bboxes+add_bboxes]
-            intersections = sum([abs(b.width*b.height) if b is not None else 0
-                                 for b in intersections])
+            w, h = get_intersection_sizes(get_bbox_extents([bbox]),
+                                          other_extents)
+            intersecting = (w >= 0) & (h >= 0)
+            intersections = np.sum(np.abs(w[intersecting]*h[intersecting]))
             # Check for out-of-axes position
             bbox = text.get_window_extent(r).transformed(ax.transData.inverted())
             x1, y1, x2, y2 = bbox.xmin, bbox.ymin, bbox.xmax, bbox.ymax
@@ -138,6 +265,7 @@ def optimally_align_text(x, y, texts, expand=(1., 1.), add_bboxes=[],
             text.set_va(alignment[a][1])
         bboxes[i] = text.get_window_extent(r).expanded(*expand).\
                                        transformed(ax.transData.inverted())
+        other_extents[i] = get_bbox_extents([bboxes[i]])[0]
     return texts
 
 def repel_text(texts, renderer=None, ax=None, expand=(1.2, 1.2),
@@ -156,33 +284,24 @@ def repel_text(texts, renderer=None, ax=None, expand=(1.2, 1.2),
     else:
         r = renderer
     bboxes = get_bboxes(texts, r, expand)
-    xmins = [bbox.xmin for bbox in bboxes]
-    xmaxs = [bbox.xmax for bbox in bboxes]
-    ymaxs = [bbox.ymax for bbox in bboxes]
-    ymins = [bbox.ymin for bbox in bboxes]
-
-    overlaps_x = np.zeros((len(bboxes), len(bboxes)))
-    overlaps_y = np.zeros_like(overlaps_x)
-    overlap_directions_x = np.zeros_like(overlaps_x)
-    overlap_directions_y = np.zeros_like(overlaps_y)
-    for i, bbox1 in enumerate(bboxes):
-        overlaps = get_points_inside_bbox(xmins*2+xmaxs*2, (ymins+ymaxs)*2,
-                                             bbox1) % len(bboxes)
-        overlaps = np.unique(overlaps)
-        for j in overlaps:
-            bbox2 = bboxes[j]
-            x, y = bbox1.intersection(bbox1, bbox2).size
-            overlaps_x[i, j] = x
-            overlaps_y[i, j] = y
-            direction = np.sign(bbox1.extents - bbox2.extents)[:2]
-            overlap_directions_x[i, j] = direction[0]
-            overlap_directions_y[i, j] = direction[1]
-
-    move_x = overlaps_x*overlap_directions_x
-    move_y = overlaps_y*overlap_directions_y
-
-    delta_x = move_x.sum(axis=1)
-    delta_y = move_y.sum(axis=1)
+    extents = get_bbox_extents(bboxes)
+    n = len(bboxes)
+
+    # Box i is pushed by box j if one of the corners of j is inside i
+    corners_x = np.concatenate([extents[:, 0], extents[:, 0],
+                                extents[:, 2], extents[:, 2]])
+    corners_y = np.concatenate([extents[:, 1], extents[:, 3],
+                                extents[:, 1], extents[:, 3]])
+    i, corner = get_points_inside_bboxes(corners_x, corners_y, extents)
+    pair_keys = np.unique(i*n + corner % n)
+    i, j = pair_keys // n, pair_keys % n
+
+    overlaps_x, overlaps_y = get_intersection_sizes(extents[i], extents[j])
+    directions_x = np.sign(extents[i, 0] - extents[j, 0])
+    directions_y = np.sign(extents[i, 1] - extents[j, 1])
+
+    delta_x = np.bincount(i, weights=overlaps_x*directions_x, minlength=n)
+    delta_y = np.bincount(i, weights=overlaps_y*directions_y, minlength=n)
 
     q = np.sum(np.abs(delta_x) + np.abs(delta_y))
     if move:
@@ -208,29 +327,23 @@ def repel_text_from_bboxes(add_bboxes, texts, renderer=None, ax=None,
         r = renderer
 
     bboxes = get_bboxes(texts, r, expand)
-
-    overlaps_x = np.zeros((len(bboxes), len(add_bboxes)))
-    overlaps_y = np.zeros_like(overlaps_x)
-    overlap_directions_x = np.zeros_like(overlaps_x)
-    overlap_directions_y = np.zeros_like(overlaps_y)
-
-    for i, bbox1 in enumerate(bboxes):
-        for j, bbox2 in enumerate(add_bboxes):
-            try:
-                x, y = bbox1.intersection(bbox1, bbox2).size
-                direction = np.sign(bbox1.extents - bbox2.extents)[:2]
-                overlaps_x[i, j] = x
-                overlaps_y[i, j] = y
-                overlap_directions_x[i, j] = direction[0]
-                overlap_directions_y[i, j] = direction[1]
-            except AttributeError:
-                pass
-
-    move_x = overlaps_x*overlap_directions_x
-    move_y = overlaps_y*overlap_directions_y
-
-    delta_x = move_x.sum(axis=1)
-    delta_y = move_y.sum(axis=1)
+    extents = get_bbox_extents(bboxes)
+    add_extents = get_bbox_extents(add_bboxes)
+
+    i, j = get_candidate_pairs(extents, add_extents)
+    overlaps_x, overlaps_y = get_intersection_sizes(extents[i],
+                                                    add_extents[j])
+    # Boxes that only touch still count, as with Bbox.intersection
+    intersecting = (overlaps_x >= 0) & (overlaps_y >= 0)
+    i, j = i[intersecting], j[intersecting]
+    overlaps_x, overlaps_y = overlaps_x[intersecting], overlaps_y[intersecting]
+    directions_x = np.sign(extents[i, 0] - add_extents[j, 0])
+    directions_y = np.sign(extents[i, 1] - add_extents[j, 1])
+
+    delta_x = np.bincount(i, weights=overlaps_x*directions_x,
+                          minlength=len(bboxes))
+    delta_y = np.bincount(i, weights=overlaps_y*directions_y,
+                          minlength=len(bboxes))
 
     q = np.sum(np.abs(delta_x) + np.abs(delta_y))
     if move:
@@ -257,20 +370,22 @@ def repel_text_from_points(x, y, texts, renderer=None, ax=None,
     else:
         r = renderer
     bboxes = get_bboxes(texts, r, expand)
-
-    move_x = np.zeros((len(bboxes), len(x)))
-    move_y = np.zeros((len(bboxes), len(x)))
-    for i, bbox in enumerate(bboxes):
-        xy_in = get_points_inside_bbox(x, y, bbox)
-        for j in xy_in:
-            xp, yp = x[j], y[j]
-            dx, dy = overlap_bbox_and_point(bbox, xp, yp)
-
-            move_x[i, j] = dx
-            move_y[i, j] = dy
-
-    delta_x = move_x.sum(axis=1)
-    delta_y = move_y.sum(axis=1)
+    extents = get_bbox_extents(bboxes)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # This is overlap_bbox_and_point for every point in every box
+    i, j = get_points_inside_bboxes(x, y, extents)
+    xp, yp = x[j], y[j]
+    dir_x = np.sign((extents[i, 0] + extents[i, 2])/2 - xp)
+    dir_y = np.sign((extents[i, 1] + extents[i, 3])/2 - yp)
+    dx = np.where(dir_x == -1, xp - extents[i, 2],
+                  np.where(dir_x == 1, xp - extents[i, 0], 0))
+    dy = np.where(dir_y == -1, yp - extents[i, 3],
+                  np.where(dir_y == 1, yp - extents[i, 1], 0))
+
+    delta_x = np.bincount(i, weights=dx, minlength=len(bboxes))
+    delta_y = np.bincount(i, weights=dy, minlength=len(bboxes))
     q = np.sum(np.abs(delta_x) + np.abs(delta_y))
     if move:
         move_texts(texts, delta_x, delta_y, bboxes, ax=ax)
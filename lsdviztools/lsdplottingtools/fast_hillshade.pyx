@@ -1,7 +1,11 @@
 #fast_hillshade.pyx
 """
-This is a cython version of the nicer looking hillshade function in the
-LSDTopoTools core C++ libraries.
+This is a cython version of the hillshade in lsdmap_hillshade. It does the
+same calculation (the same gradient kernels, illumination and scaling) as
+HillshadeArray with a single azimuth, but runs the rows in parallel with OpenMP.
+
+It is built by setup.py if Cython and a compiler are available. If it isn't,
+lsdmap_hillshade.HillshadeArray does the same thing in numpy.
 
 @author dav
 """
@@ -9,7 +13,7 @@ LSDTopoTools core C++ libraries.
 # Cython rule of thumb no 1. If there are equivalent C-libraries for
 # numpy stuff, use them. (E.g. math functions)
 # Let's use the native C-libraries for math functions.
-from libc.math cimport sin, cos, sqrt, M_PI, atan, atan2
+from libc.math cimport sin, cos, sqrt, M_PI
 
 import cython
 cimport cython
@@ -21,8 +25,7 @@ cimport numpy as np
 
 # Find out how many cores/CPUs we have available
 import multiprocessing
-cdef int num_threads_use = multiprocessing.cpu_count()
-print(num_threads_use)
+cdef int num_threads_available = multiprocessing.cpu_count()
 
 # Fix a data type for our arrays.
 DTYPE = np.float64
@@ -36,9 +39,10 @@ ctypedef np.float64_t DTYPE_t
 @cython.nonecheck(False)
 @cython.cdivision(True)
 def Hillshade(np.ndarray[DTYPE_t, ndim=2] terrain_array,
-              float DataResolution, float azimuth = 315,
-              float angle_altitude = 45,
-              float NoDataValue = -9999, float z_factor = 1):
+              double DataResolution, double azimuth = 315,
+              double angle_altitude = 45,
+              double NoDataValue = -9999, double z_factor = 1,
+              int num_threads = 0, method = "zevenbergen_thorne"):
   """Creates a hillshade raster
 
   Args:
@@ -48,66 +52,99 @@ def Hillshade(np.ndarray[DTYPE_t, ndim=2] terrain_array,
       angle_altitude (float): Angle altitude of sun
       z_factor (float): z_factor
       NoDataValue (float): The nodata value of the raster
+      num_threads (int): The number of threads. 0 uses all the cores.
+      method (str): The gradient kernel, "zevenbergen_thorne" or "horn".
+          See lsdmap_hillshade.HillshadeArray for the scaling of each.
 
   Returns:
-      HSArray (numpy.array): The hillshade array
+      HSArray (numpy.array): The hillshade array. Nodata (and, for horn, the edge pixels) are nan.
 
   Author:
       DAV, SWDG, SMM
 
   """
-  cdef unsigned int ncols = terrain_array.shape[1]
-  cdef unsigned int nrows = terrain_array.shape[0]
+  cdef Py_ssize_t ncols = terrain_array.shape[1]
+  cdef Py_ssize_t nrows = terrain_array.shape[0]
 
-  # Ndarray best choice? Will revisit later...
-  cdef np.ndarray[DTYPE_t, ndim=2] HSarray = np.empty((ncols,nrows))
-  HSarray.fill(np.nan)
+  cdef bint horn
+  if method == "horn":
+    horn = True
+  elif method == "zevenbergen_thorne":
+    horn = False
+  else:
+    raise ValueError("The hillshade method must be zevenbergen_thorne or horn, you gave me: "+str(method))
+
+  if num_threads <= 0:
+    num_threads = num_threads_available
 
-  cdef float zenith_rad = (90 - angle_altitude) * M_PI / 180.0
-  cdef float azimuth_math = 360-azimuth + 90
-  if (azimuth_math >= 360.0):
-    azimuth_math = azimuth_math - 360
-  cdef float azimuth_rad = azimuth_math * M_PI  / 180.0
+  cdef np.ndarray[DTYPE_t, ndim=2] HSarray = np.empty((nrows,ncols))
+  HSarray.fill(np.nan)
 
-  cdef float slope_rad = 0
-  cdef float aspect_rad = 0
-  cdef float dzdx = 0
-  cdef float dzdy = 0
-  cdef int i = 0, j = 0
+  # The horn kernel needs all eight neighbours so the edge pixels are left as nan.
+  # Central differences use one sided differences at the edges, like np.gradient.
+  cdef Py_ssize_t edge = 1 if horn else 0
+  if nrows < 2*edge+1 or ncols < 2*edge+1:
+    return HSarray
+  if not horn and (nrows < 2 or ncols < 2):
+    raise ValueError("The zevenbergen_thorne hillshade needs at least two rows and two columns")
+
+  # The same terms as lsdmap_hillshade.ShadeFromGradients
+  cdef double altitude_rad = angle_altitude * M_PI / 180.0
+  cdef double azimuth_rad = azimuth * M_PI / 180.0
+  cdef double sin_alt = sin(altitude_rad)
+  cdef double cos_alt_z = cos(altitude_rad) * z_factor
+  cdef double col_factor = cos(azimuth_rad) * cos_alt_z
+  cdef double row_factor = sin(azimuth_rad) * cos_alt_z
+  cdef double z_factor_2 = z_factor * z_factor
+  cdef double eight_res = 8 * DataResolution
+
+  cdef double d_row = 0
+  cdef double d_col = 0
+  cdef double inv_norm = 0
+  cdef double hs = 0
+  cdef Py_ssize_t i = 0, j = 0
 
   # We can safely turn off the Python Global Interpreter lock for these for loops
-  with nogil, parallel(num_threads=num_threads_use):
+  with nogil, parallel(num_threads=num_threads):
     # OpenMP threads created for the outer loop.
-    for i in prange(nrows):
-      for j in range(ncols):
-          if terrain_array[i, j] != NoDataValue:
-            dzdx = (((terrain_array[i, j+1] + 2*terrain_array[i+1, j] + terrain_array[i+1, j+1]) -
-                    (terrain_array[i-1, j-1] + 2*terrain_array[i-1, j] + terrain_array[i-1, j+1]))
-                    / (8 * DataResolution))
-            dzdy = (((terrain_array[i-1, j+1] + 2*terrain_array[i, j+1] + terrain_array[i+1, j+1]) -
-                    (terrain_array[i-1, j-1] + 2*terrain_array[i, j-1] + terrain_array[i+1, j-1]))
-                    / (8 * DataResolution))
-
-            slope_rad = atan(z_factor * sqrt((dzdx * dzdx) + (dzdy * dzdy)))
-
-            if (dzdx != 0):
-              aspect_rad = atan2(dzdy, (dzdx*-1))
-              if (aspect_rad < 0):
-                aspect_rad = 2 * M_PI + aspect_rad
-
+    for i in prange(edge, nrows-edge):
+      for j in range(edge, ncols-edge):
+          if terrain_array[i, j] == NoDataValue:
+            continue
+
+          if horn:
+            d_row = (((terrain_array[i+1, j-1] + 2*terrain_array[i+1, j] + terrain_array[i+1, j+1]) -
+                     (terrain_array[i-1, j-1] + 2*terrain_array[i-1, j] + terrain_array[i-1, j+1]))
+                     / eight_res)
+            d_col = (((terrain_array[i-1, j+1] + 2*terrain_array[i, j+1] + terrain_array[i+1, j+1]) -
+                     (terrain_array[i-1, j-1] + 2*terrain_array[i, j-1] + terrain_array[i+1, j-1]))
+                     / eight_res)
+          else:
+            if i == 0:
+              d_row = terrain_array[1, j] - terrain_array[0, j]
+            elif i == nrows-1:
+              d_row = terrain_array[i, j] - terrain_array[i-1, j]
+            else:
+              d_row = (terrain_array[i+1, j] - terrain_array[i-1, j]) / 2.0
+            if j == 0:
+              d_col = terrain_array[i, 1] - terrain_array[i, 0]
+            elif j == ncols-1:
+              d_col = terrain_array[i, j] - terrain_array[i, j-1]
             else:
-              if (dzdy > 0):
-                aspect_rad = M_PI / 2
-              elif (dzdy < 0):
-                aspect_rad = 2 * M_PI - M_PI / 2
-              else:
-                aspect_rad = aspect_rad
-
-            HSarray[i, j] = 255.0 * ((cos(zenith_rad) * cos(slope_rad)) +
-                            (sin(zenith_rad) * sin(slope_rad) *
-                            cos(azimuth_rad - aspect_rad)))
-            # Necessary?
-            if (HSarray[i, j] < 0):
-              HSarray[i, j] = 0
+              d_col = (terrain_array[i, j+1] - terrain_array[i, j-1]) / 2.0
+            d_row = d_row / DataResolution
+            d_col = d_col / DataResolution
+
+          # sin(alt)*cos(slope) + cos(alt)*sin(slope)*cos(azimuth - aspect)
+          inv_norm = 1.0 / sqrt((d_row*d_row + d_col*d_col) * z_factor_2 + 1)
+          hs = (d_col*col_factor - d_row*row_factor + sin_alt) * inv_norm
+
+          if horn:
+            # clipped at 0, as in LSDRaster
+            if hs < 0:
+              hs = 0
+            HSarray[i, j] = hs * 255
+          else:
+            HSarray[i, j] = (hs + 1) * 127.5
 
   return HSarray
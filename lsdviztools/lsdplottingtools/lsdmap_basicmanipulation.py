@@ -281,6 +281,64 @@ def BasinOrderer(thisPointData, FileName, criteria_string,reverse=False,
     print(sorted_basins)
 
 
+#==============================================================================
+# This function replaces a list of values in a raster with another list of
+# values, in one pass over the raster
+#==============================================================================
+def RemapRasterValues(rasterArray, old_values, new_values, max_lut_size = 2**24):
+    """This function replaces the values in old_values with the matching values in new_values.
+
+    All the values are replaced at once, so a value that has just been written is never
+    replaced again (e.g., swapping 1 and 2 works). If a value is in old_values more than
+    once the first one is used. Integer rasters are remapped with a lookup table indexed
+    by the raster values; anything else (or integer rasters with a huge range of values)
+    finds the values with a binary search of the sorted old_values. Either way the raster
+    is only read once, rather than once per value.
+
+    Args:
+        rasterArray (np.array): The raster array. It is modified in place.
+        old_values (list): The values to replace
+        new_values (list): The replacement values. Needs to be the same size as old_values
+        max_lut_size (int): The largest lookup table (number of entries) to use for integer rasters
+
+    Returns:
+        np.array: The remapped array (the same array as rasterArray)
+    """
+    old_values = np.asarray(old_values).ravel()
+    new_values = np.asarray(new_values).ravel()
+    if old_values.size != new_values.size:
+        raise Exception("The old and new value lists need to be the same length, they are "+str(old_values.size)+" and "+str(new_values.size))
+    if old_values.size == 0 or rasterArray.size == 0:
+        return rasterArray
+
+    # keep the first of any repeated values
+    sorted_old, first = np.unique(old_values, return_index = True)
+    sorted_new = new_values[first].astype(rasterArray.dtype)
+
+    if np.issubdtype(rasterArray.dtype, np.integer) and np.issubdtype(sorted_old.dtype, np.integer):
+        # values outside the raster's range can't match anything
+        rmin = rasterArray.min()
+        rmax = rasterArray.max()
+        in_range = (sorted_old >= rmin) & (sorted_old <= rmax)
+        sorted_old = sorted_old[in_range]
+        sorted_new = sorted_new[in_range]
+        if sorted_old.size == 0:
+            return rasterArray
+        rmin = int(rmin)
+        rmax = int(rmax)
+        if rmax - rmin + 1 <= max_lut_size:
+            lut = np.arange(rmin, rmax + 1).astype(rasterArray.dtype)
+            lut[sorted_old.astype(np.int64) - rmin] = sorted_new
+            rasterArray[...] = lut[np.subtract(rasterArray, rmin, dtype = np.int64)]
+            return rasterArray
+
+    # nan doesn't match anything, as it didn't with ==
+    index = np.searchsorted(sorted_old, rasterArray)
+    np.minimum(index, sorted_old.size - 1, out = index)
+    matched = sorted_old[index] == rasterArray
+    rasterArray[matched] = sorted_new[index[matched]]
+    return rasterArray
+
 #==============================================================================
 # This function takes groups of data and then resets values in a
 # raster to mimic these values
@@ -288,7 +346,8 @@ def BasinOrderer(thisPointData, FileName, criteria_string,reverse=False,
 def RedefineIntRaster(rasterArray,grouped_data_list,spread):
     """This function takes values from an integer raster and renames them based on a list.
 
-    It is useful for renaming basin numbers.
+    It is useful for renaming basin numbers. The elements of each group are numbered
+    consecutively, with a gap of spread between groups.
 
     Args:
         rasterArray (np.array): The raster array
@@ -301,31 +360,34 @@ def RedefineIntRaster(rasterArray,grouped_data_list,spread):
     Author: SMM
     """
 
-    counter = 0
     if not grouped_data_list:
         return rasterArray
-    else:
-        for group in grouped_data_list:
-            for element in group:
-                rasterArray[rasterArray == element] = counter
-                counter= counter+1
 
-            counter = counter+spread
-    return rasterArray
+    old_values = []
+    new_values = []
+    counter = 0
+    for group in grouped_data_list:
+        for element in group:
+            old_values.append(element)
+            new_values.append(counter)
+            counter= counter+1
+
+        counter = counter+spread
+    return RemapRasterValues(rasterArray, old_values, new_values)
 
 #==============================================================================
-# This function takes groups of data and then resets values in a
-# raster to mimic these values
+# This function masks a raster everywhere except where another raster
+# has one of a list of values
 #==============================================================================
 def MaskByCategory(rasterArray,rasterForMasking,data_list):
-    """This function takes values from an integer raster and renames them based on a list.
+    """This function sets the raster to nan everywhere the masking raster isn't one of the values in a list.
 
-    It is useful for renaming basin numbers.
+    It is useful for only showing some basins.
 
     Args:
-        rasterArray (np.array): The raster array
-        grouped_data_list (int): A list of lists containing groups to be redefined
-        spread (int): How big of a difference between groups. For plotting this helps to generate differenc colours.
+        rasterArray (np.array): The raster array. It is modified in place.
+        rasterForMasking (np.array): The raster with the categories (e.g., basin junctions). It is not modified.
+        data_list (list): The categories to keep
 
     Returns:
         np.array: The new array
@@ -333,12 +395,7 @@ def MaskByCategory(rasterArray,rasterForMasking,data_list):
     Author: SMM
     """
 
-    # The -9090 is just a placeholder
-    for item in data_list:
-        rasterForMasking[rasterForMasking == item] = -9090
-
-    rasterArray[rasterForMasking != -9090] = np.nan
-
+    rasterArray[~np.isin(rasterForMasking, data_list)] = np.nan
 
     return rasterArray
 
@@ -392,7 +449,7 @@ def RasterMeanValue(path, file1):
 
     NPixels = LSDMap_IO.GetNPixelsInRaster(raster_file1)
 
-    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(raster_file1,raster_band=1)
+    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(raster_file1,raster_band=1, read_only = True)
 
     mean_value = np.sum(Raster1)/float(NPixels)
 
@@ -440,7 +497,7 @@ def SimpleSwath(path, file1, axis):
         NDV = -9999
         print("No NDV defined")
 
-    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(raster_file1,raster_band=1)
+    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(raster_file1,raster_band=1, read_only = True)
 
 
     #nan_raster = Raster1[Raster1==NDV]=np.nan
@@ -476,20 +533,53 @@ def SimpleSwath(path, file1, axis):
 # This does a basic mass balance.
 # Assumes all units are metres
 #==============================================================================
-def BasicMassBalance(path, file1, file2):
+def BasicMassBalance(path, file1, file2, tile_rows = 512, n_threads = 4):
     """This function checks the difference in "volume" between two rasters.
+    The rasters are differenced in tiles (see lsdmap_gdalio.TiledRasterDifference) so they can be bigger than memory.
 
     Args:
         path (str): The path to the files
         file1 (str): The name of the first raster.
         file2 (str): The name of the second raster
+        tile_rows (int): The number of rows in each tile
+        n_threads (int): The number of threads
 
     Returns:
-        float: The differnece in the volume betweeen the two rasters
+        float: The differnece in the volume betweeen the two rasters. As before, this is nan if either raster has nodata:
+        use MassBalanceStatistics if you want the volume of the pixels with data.
 
     Author: SMM
     """
 
+    stats = MassBalanceStatistics(path, file1, file2, tile_rows = tile_rows, n_threads = n_threads)
+
+    if stats["n_nodata"] > 0:
+        mass_balance = np.nan
+    else:
+        mass_balance = stats["volume"]
+
+    print("linear dif " + str(stats["linear_difference"]))
+
+    return mass_balance
+#==============================================================================
+
+#==============================================================================
+def MassBalanceStatistics(path, file1, file2, tile_rows = 512, n_threads = 4):
+    """This gets the volume change between two rasters (file2 - file1), split into cut and fill.
+    Pixels that are nodata in either raster are left out.
+
+    Args:
+        path (str): The path to the files
+        file1 (str): The name of the first raster.
+        file2 (str): The name of the second raster
+        tile_rows (int): The number of rows in each tile
+        n_threads (int): The number of threads
+
+    Returns:
+        dict: with the keys volume, cut_volume, fill_volume (all in m^3), linear_difference (the sum of the differences),
+        min and max (the extreme differences in m), n_valid and n_nodata (numbers of pixels)
+    """
+
     # make sure names are in correct format
     NewPath = LSDOst.AppendSepToDirectoryPath(path)
 
@@ -500,13 +590,16 @@ def BasicMassBalance(path, file1, file2):
     print("PixelArea is: " + str(PixelArea))
 
     print("The formatted path is: " + NewPath)
-    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(raster_file1,raster_band=1)
-    Raster2 = LSDMap_IO.ReadRasterArrayBlocks(raster_file2,raster_band=1)
-
-    NewRaster = np.subtract(Raster2,Raster1)
-
-    mass_balance = np.sum(NewRaster)*PixelArea
-
-    print("linear dif " + str(np.sum(NewRaster)))
+    stats = LSDMap_IO.TiledRasterDifference(raster_file2, raster_file1, raster_band = 1, OutFileName = None,
+                                            tile_rows = tile_rows, n_threads = n_threads)
+
+    mass_balance = {"volume": stats["sum"]*PixelArea,
+                    "cut_volume": stats["cut"]*PixelArea,
+                    "fill_volume": stats["fill"]*PixelArea,
+                    "linear_difference": stats["sum"],
+                    "min": stats["min"],
+                    "max": stats["max"],
+                    "n_valid": stats["n_valid"],
+                    "n_nodata": stats["n_nodata"]}
 
     return mass_balance
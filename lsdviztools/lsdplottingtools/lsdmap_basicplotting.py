@@ -18,6 +18,8 @@ from scipy import signal
 import matplotlib.pyplot as plt
 from lsdviztools.lsdplottingtools import colours
 
+from lsdviztools.lsdplottingtools import lsdmap_hillshade as LSDMap_HS
+
 
 def TickSpineFormatter(ax, sizeformat = "esurf"):
     """This formats the line weights on the bounding box and ticks.
@@ -515,7 +517,7 @@ def BasicDensityPlot(FileName, thiscmap='gray',colorbarlabel='Elevation in meter
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
 
     if is_log:
         # get the log of the raster
@@ -650,7 +652,7 @@ def BasicDrapedPlotGridPlot(FileName, DrapeName, thiscmap='gray',drape_cmap='gra
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
 
     from scipy import ndimage
     if DrapeName == "None":
@@ -658,7 +660,7 @@ def BasicDrapedPlotGridPlot(FileName, DrapeName, thiscmap='gray',drape_cmap='gra
         #filtered = signal.wiener(raster)
         raster_drape = Hillshade(raster)
     else:
-        raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+        raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -786,7 +788,7 @@ def DrapedOverHillshade(FileName, DrapeName, thiscmap='gray',drape_cmap='gray',
     # than reading directly from a file. Should not break anyone's code)
     # (You can't overload functions in Python...)
     if isinstance(DrapeName, str):
-      raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+      raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
     elif isinstance(DrapeName, np.ndarray):
       raster_drape = DrapeName
     else:
@@ -918,7 +920,7 @@ def DrapedOverHillshade_Categories(FileName, DrapeName, nCategories,
     # than reading directly from a file. Should not break anyone's code)
     # (You can't overload functions in Python...)
     if isinstance(DrapeName, str):
-        raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+        raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
     elif isinstance(DrapeName, np.ndarray):
         raster_drape = DrapeName
     else:
@@ -1038,9 +1040,9 @@ def DrapedOverFancyHillshade(FileName, HSName, DrapeName, thiscmap='gray',drape_
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_HS = LSDMap_IO.ReadRasterArrayBlocks(HSName)
-    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_HS = LSDMap_IO.ReadRasterArrayBlocks(HSName, read_only = True)
+    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -1175,8 +1177,8 @@ def BasinsOverFancyHillshade(FileName, HSName, BasinName, Basin_csv_name, basin_
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_HS = LSDMap_IO.ReadRasterArrayBlocks(HSName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_HS = LSDMap_IO.ReadRasterArrayBlocks(HSName, read_only = True)
     raster_drape = LSDMap_IO.ReadRasterArrayBlocks(BasinName)
 
     # now get the extent
@@ -1394,9 +1396,54 @@ def BasinsOverFancyHillshade(FileName, HSName, BasinName, Basin_csv_name, basin_
 
 
 
+#==============================================================================
+# The hillshade of a raster file, a strip at a time
+def HillshadeStrips(raster_file, azimuth = 315, angle_altitude = 45, z_factor = 1, strip_rows = 1024, backend = "numpy",
+                    method = "zevenbergen_thorne", multidirectional = False, dtype = np.float64):
+    """Calculates the hillshade of a raster file in strips of rows, so you never need the whole DEM in memory.
+    Each strip is read with a one pixel halo above and below, so the gradients (and therefore the
+    hillshade) are exactly the same as if you had done the whole raster at once.
+
+    Args:
+        raster_file (str): The name of the raster file with path and extension.
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): vertical exaggeration
+        strip_rows (int): The number of rows in each strip
+        backend, method, multidirectional, dtype: see lsdmap_hillshade.HillshadeArray
+
+    Yields:
+        row_offset (int): the first row of the strip
+        HSArray (numpy.array): The hillshade of the strip
+    """
+    import rasterio as rio
+    from rasterio.windows import Window
+
+    LSDMap_IO.RecordFileRead(raster_file)
+    with rio.open(raster_file) as src:
+        resolution = src.res[0]
+        n_rows = src.height
+        n_cols = src.width
+
+        for row_start in range(0, n_rows, strip_rows):
+            row_end = min(row_start+strip_rows, n_rows)
+
+            # add the halo, unless we are at the edge of the raster
+            halo_start = max(row_start-1, 0)
+            halo_end = min(row_end+1, n_rows)
+
+            array = src.read(1, window = Window(0, halo_start, n_cols, halo_end-halo_start))
+            hs = LSDMap_HS.HillshadeArray(array, resolution, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor,
+                                          method = method, multidirectional = multidirectional, dtype = dtype,
+                                          backend = backend, NoDataValue = src.nodata)
+
+            yield row_start, hs[row_start-halo_start:row_end-halo_start, :]
+#==============================================================================
+
 #==============================================================================
 # Make a simple hillshade plot
-def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1, resolution = 30.0):
+def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1, resolution = 30.0, strip_rows = 1024, backend = "numpy",
+              method = "zevenbergen_thorne", multidirectional = False, dtype = np.float64):
     """Creates a hillshade raster
 
     Args:
@@ -1404,6 +1451,12 @@ def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -99
         azimuth (float): Azimuth of sunlight
         angle_altitude (float): Angle altitude of sun
         NoDataValue (float): The nodata value of the raster
+        strip_rows (int): If you pass a filename, the hillshade is calculated in strips of this many rows (see HillshadeStrips)
+            so the only big array is the hillshade itself.
+        backend (str): "numpy" or "cython" (the same hillshade, multithreaded)
+        method (str): "zevenbergen_thorne" or "horn". See lsdmap_hillshade.HillshadeArray
+        multidirectional (bool): If True blend the hillshades from several azimuths
+        dtype (numpy.dtype): The precision of the calculation. float32 is faster but not quite the same as float64
 
     Returns:
         HSArray (numpy.array): The hillshade array
@@ -1418,11 +1471,13 @@ def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -99
 
     # You have passed a filepath to be read in as a raster
     if isinstance(raster_file, str):
-      src =  rio.open(raster_file)
-      rX,rY = src.res
-      resolution = rX
-      array = src.read(1)
-      #array = LSDMap_IO.ReadRasterArrayBlocks(,raster_band=1)
+      with rio.open(raster_file) as src:
+        hs = np.empty((src.height, src.width), dtype = dtype)
+      for row_start, hs_strip in HillshadeStrips(raster_file, azimuth = azimuth, angle_altitude = angle_altitude,
+                                                 z_factor = z_factor, strip_rows = strip_rows, backend = backend,
+                                                 method = method, multidirectional = multidirectional, dtype = dtype):
+        hs[row_start:row_start+hs_strip.shape[0], :] = hs_strip
+      return hs
 
     # You already have an array and just want the hill shade
     elif isinstance(raster_file, np.ndarray):
@@ -1430,30 +1485,9 @@ def Hillshade(raster_file, azimuth = 315, angle_altitude = 45, NoDataValue = -99
     else:
         print("raster_file must be either a filepath (string) or a numpy array. Try again.")
 
-    # masking nodata vals
-    #print("The dtype of the data is")
-    #print(array.dtype)
-    array = array.astype(float)
-    resolution = float(resolution)
-    #print("The dtype of the data should not be float")
-    #print(array.dtype)
-    array[array < 0] = np.nan
-
-    x, y = np.true_divide(np.gradient(array),resolution)
-    slope = np.pi/2. - np.arctan(np.multiply(z_factor,np.sqrt(x*x + y*y)))
-    aspect = np.arctan2(-x, y)
-    azimuthrad = azimuth*np.pi / 180.
-    altituderad = angle_altitude*np.pi / 180.
-
-
-    shaded = np.sin(altituderad) * np.sin(slope)\
-     + np.cos(altituderad) * np.cos(slope)\
-     * np.cos(azimuthrad - aspect)
-
-
-
-    #this_array = 255*(shaded + 1)/2
-    return 255*(shaded + 1)/2
+    return LSDMap_HS.HillshadeArray(array, resolution, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor,
+                                    method = method, multidirectional = multidirectional, dtype = dtype,
+                                    backend = backend, NoDataValue = NoDataValue)
 #==============================================================================
 
 
@@ -198,8 +198,8 @@ def BasicChiPlotGridPlotKirby(FileName, DrapeName, chi_csv_fname, thiscmap='gray
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -362,8 +362,8 @@ def BasicChiPlotGridPlot(FileName, DrapeName, chi_csv_fname, thisPointData, this
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -526,7 +526,7 @@ def BasicChiCoordinatePlot(FileName, DrapeName, csvfile, thiscmap='gray',drape_c
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
     raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
 
     raster_drape = LSDMap_BM.NanBelowThreshold(raster_drape,0)
@@ -615,7 +615,7 @@ def BasicChiCoordinatePlot(FileName, DrapeName, csvfile, thiscmap='gray',drape_c
             thisPointData.ThinDataSelection('basin_junction',basin_junction_list)
 
             if basin_raster_name != "None":
-                basin_raster = LSDMap_IO.ReadRasterArrayBlocks(basin_raster_name)
+                basin_raster = LSDMap_IO.ReadRasterArrayBlocks(basin_raster_name, read_only = True)
                 LSDMap_BM.MaskByCategory(raster_drape,basin_raster,basin_junction_list)
 
 
@@ -705,8 +705,8 @@ def BasicChannelPlotGridPlotCategories(FileName, DrapeName, chi_csv_fname, thisc
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -870,8 +870,8 @@ def BasicChannelPlotByBasin(FileName, DrapeName, chi_csv_fname, thiscmap='gray',
     rcParams['font.size'] = label_size
 
     # get the data
-    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName)
-    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName)
+    raster = LSDMap_IO.ReadRasterArrayBlocks(FileName, read_only = True)
+    raster_drape = LSDMap_IO.ReadRasterArrayBlocks(DrapeName, read_only = True)
 
     # now get the extent
     extent_raster = LSDMap_IO.GetRasterExtent(FileName)
@@ -15,11 +15,332 @@ import osgeo
 from osgeo import osr
 from osgeo import ogr
 import os
+import math
 from os.path import exists
 from osgeo.gdalconst import GA_ReadOnly
 import rasterio as rio
 from lsdviztools.lsdplottingtools import lsdmap_basicplotting as bm
 import utm
+import threading
+from collections import OrderedDict
+
+#==============================================================================
+class RasterCache(object):
+    """
+    A least recently used cache of raster arrays, shared by everything in the process.
+    The readers in this module look in here before going to disk, so making lots of figures
+    from the same DEM only reads it once. The arrays are stored as they are (not copied) and
+    marked read-only, so the cache costs no extra memory while someone is using the array.
+    Only whole rasters at full resolution are cached, and only when they are read with read_only = True.
+
+    Args:
+        max_bytes (int): The most memory the cached arrays can use. The least recently used arrays are dropped to stay under this.
+    """
+    def __init__(self, max_bytes = 1024**3):
+        self._max_bytes = max_bytes
+        self._arrays = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def n_bytes(self):
+        return self._n_bytes
+
+    def get(self, key):
+        """
+        Returns the cached array for this key (and marks it as recently used) or None if it isn't there.
+        """
+        with self._lock:
+            if key not in self._arrays:
+                return None
+            self._arrays.move_to_end(key)
+            return self._arrays[key]
+
+    def put(self, key, array):
+        """
+        Adds an array to the cache. The array itself is kept and made read-only, so
+        don't keep writing to it. Arrays bigger than the cap are not stored.
+        """
+        if array.nbytes > self._max_bytes:
+            return
+        array.setflags(write = False)
+        with self._lock:
+            if key in self._arrays:
+                self._n_bytes -= self._arrays.pop(key).nbytes
+            self._arrays[key] = array
+            self._n_bytes += array.nbytes
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._arrays.clear()
+            self._n_bytes = 0
+
+    def _evict(self):
+        while self._n_bytes > self._max_bytes and len(self._arrays) > 0:
+            key, array = self._arrays.popitem(last = False)
+            self._n_bytes -= array.nbytes
+
+_RasterArrayCache = RasterCache()
+
+#==============================================================================
+def SetRasterCacheSize(max_bytes):
+    """Sets the memory cap of the raster cache. Set it to 0 to turn the cache off.
+
+    Args:
+        max_bytes (int): the maximum size of the cache in bytes
+    """
+    _RasterArrayCache.set_max_bytes(max_bytes)
+
+#==============================================================================
+def ClearRasterCache():
+    """Empties the raster cache.
+    """
+    _RasterArrayCache.clear()
+
+#==============================================================================
+def GetRasterFileKey(FileName):
+    """This gets a key that identifies a raster file on disk: its absolute path and the size and modification
+    time of the file and of its ENVI header, if it has one. If the file changes so does the key.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+
+    Return:
+        tuple: the key
+    """
+    abs_path = os.path.abspath(FileName)
+    stat = os.stat(abs_path)
+    key = (abs_path, stat.st_mtime_ns, stat.st_size)
+
+    header_file = os.path.splitext(abs_path)[0]+".hdr"
+    if header_file != abs_path and exists(header_file):
+        key = key + (os.stat(header_file).st_mtime_ns,)
+    return key
+
+#==============================================================================
+# Recording the files that are read and written
+#==============================================================================
+# The FileRecorders that are active in this process
+_FileRecorders = []
+
+# The files that go with a raster or shapefile. If one of them changes, so does what is read.
+_CompanionExtensions = [".hdr", ".dbf", ".shx", ".prj", ".cpg"]
+
+class FileRecorder(object):
+    """
+    Records the files that lsdviztools reads and writes while it is active. Use it in a with statement:
+
+        with FileRecorder() as recorder:
+            make_a_figure()
+        print(recorder.inputs, recorder.outputs)
+
+    Rasters and vector files are opened by gdal, rasterio, fiona and geopandas, which don't go through python,
+    so every place in lsdviztools that opens one calls RecordFileRead or RecordFileWrite.
+    The figure job runner (lsdmapwrappers_jobs.RunFigureJobs) uses this to keep its manifest.
+    """
+    def __init__(self):
+        self.inputs = set()
+        self.outputs = set()
+
+    def __enter__(self):
+        _FileRecorders.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _FileRecorders.remove(self)
+        return False
+
+#==============================================================================
+def IsRecordingFiles():
+    """Checks if there is an active FileRecorder.
+
+    Return:
+        bool: True if the files that are read and written are being recorded
+    """
+    return len(_FileRecorders) > 0
+
+#==============================================================================
+def _GetFileAndCompanions(FileName):
+    """The absolute path of a file, and of the files that go with it (the ENVI header of a raster, the
+    .dbf, .shx and .prj of a shapefile, a .aux.xml) that exist.
+    """
+    abs_path = os.path.abspath(FileName)
+    paths = [abs_path]
+    prefix = os.path.splitext(abs_path)[0]
+    for companion in [prefix+extension for extension in _CompanionExtensions]+[abs_path+".aux.xml"]:
+        if companion != abs_path and exists(companion):
+            paths.append(companion)
+    return paths
+
+#==============================================================================
+def RecordFileRead(FileName):
+    """Tells the active FileRecorders (if there are any) that a file, and the files that go with it, are being read.
+    Call this wherever a raster or vector file is opened for reading.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the file.
+    """
+    if len(_FileRecorders) == 0:
+        return
+    for path in _GetFileAndCompanions(FileName):
+        for recorder in _FileRecorders:
+            recorder.inputs.add(path)
+
+#==============================================================================
+def RecordFileWrite(FileName):
+    """Tells the active FileRecorders (if there are any) that a file, and the files that go with it, have been written.
+    Call this once a raster or vector file has been made.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the file.
+    """
+    if len(_FileRecorders) == 0:
+        return
+    for path in _GetFileAndCompanions(FileName):
+        for recorder in _FileRecorders:
+            recorder.outputs.add(path)
+
+#==============================================================================
+class RasterInfo(object):
+    """
+    The metadata of a raster. The dataset is opened once, when the object is made, and
+    everything else (extent, EPSG, etc) is worked out from that the first time it is asked for.
+    Use GetRasterInfo rather than making these directly: it keeps one per file and makes a new one if the file changes.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+    """
+    def __init__(self, FileName):
+        if exists(FileName) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
+
+        SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
+        if SourceDS == None:
+            raise Exception("Unable to read the data file")
+
+        band = SourceDS.GetRasterBand(1)
+        self._FileName = FileName
+        self._NoDataValue = band.GetNoDataValue()
+        self._xsize = SourceDS.RasterXSize
+        self._ysize = SourceDS.RasterYSize
+        self._n_bands = SourceDS.RasterCount
+        self._GeoT = SourceDS.GetGeoTransform()
+        self._ProjectionWkt = SourceDS.GetProjectionRef()
+        self._DataType = gdal.GetDataTypeName(band.DataType)
+        self._GDALDataType = band.DataType
+        self._BlockSize = band.GetBlockSize()
+        SourceDS = None
+
+        self._EPSGString = None
+
+    @property
+    def filename(self):
+        return self._FileName
+
+    @property
+    def nodata(self):
+        return self._NoDataValue
+
+    @property
+    def xsize(self):
+        return self._xsize
+
+    @property
+    def ysize(self):
+        return self._ysize
+
+    @property
+    def n_bands(self):
+        return self._n_bands
+
+    @property
+    def geotransform(self):
+        return self._GeoT
+
+    @property
+    def cellsize(self):
+        return self._GeoT[1]
+
+    @property
+    def projection_wkt(self):
+        return self._ProjectionWkt
+
+    @property
+    def data_type_name(self):
+        return self._DataType
+
+    @property
+    def dtype(self):
+        return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(self._GDALDataType))
+
+    @property
+    def block_size(self):
+        return self._BlockSize
+
+    @property
+    def extent(self):
+        """[XMin,XMax,YMin,YMax], assuming square pixels as the rest of this module does"""
+        XMin = self._GeoT[0]
+        XMax = XMin+self.cellsize*self._xsize
+        YMax = self._GeoT[3]
+        YMin = YMax-self.cellsize*self._ysize
+        return [XMin,XMax,YMin,YMax]
+
+    @property
+    def EPSG(self):
+        """The EPSG string, as rasterio reports it (e.g. EPSG:32630)"""
+        if self._EPSGString is None:
+            if len(self._ProjectionWkt) == 0:
+                self._EPSGString = "None"
+            else:
+                self._EPSGString = str(rio.crs.CRS.from_wkt(self._ProjectionWkt))
+        return self._EPSGString
+
+    def get_projection(self):
+        """
+        Returns a new osr SpatialReference of the raster (a new one each time since they can be modified)
+        """
+        Projection = osr.SpatialReference()
+        Projection.ImportFromWkt(self._ProjectionWkt)
+        return Projection
+
+_RasterInfoCache = OrderedDict()
+_RasterInfoLock = threading.Lock()
+
+#==============================================================================
+def GetRasterInfo(FileName):
+    """Gets the RasterInfo of a raster. These are kept for the life of the process so each file is only opened once,
+    unless it changes on disk.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+
+    Return:
+        RasterInfo: the metadata of the raster
+    """
+    if exists(FileName) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
+
+    RecordFileRead(FileName)
+    key = GetRasterFileKey(FileName)
+    with _RasterInfoLock:
+        if key in _RasterInfoCache:
+            _RasterInfoCache.move_to_end(key)
+            return _RasterInfoCache[key]
+
+    this_info = RasterInfo(FileName)
+    with _RasterInfoLock:
+        _RasterInfoCache[key] = this_info
+        # these are small but we don't want them to pile up forever
+        while len(_RasterInfoCache) > 256:
+            _RasterInfoCache.popitem(last = False)
+    return this_info
 
 #==============================================================================
 def getNoDataValue(rasterfn):
@@ -33,9 +354,7 @@ def getNoDataValue(rasterfn):
 
     Author: SMM
     """
-    raster = gdal.Open(rasterfn)
-    band = raster.GetRasterBand(1)
-    return band.GetNoDataValue()
+    return GetRasterInfo(rasterfn).nodata
 #==============================================================================
 
 #==============================================================================
@@ -79,13 +398,9 @@ def GetUTMMaxMin(FileName):
     if exists(FileName) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
-    CellSize = GeoT[1]
-    XMin = GeoT[0]
-    XMax = XMin+CellSize*xsize
-
-    YMax = GeoT[3]
-    YMin = YMax-CellSize*ysize
+    this_info = GetRasterInfo(FileName)
+    CellSize = this_info.cellsize
+    XMin,XMax,YMin,YMax = this_info.extent
 
     return CellSize,XMin,XMax,YMin,YMax
 #==============================================================================
@@ -108,8 +423,7 @@ def GetPixelArea(FileName):
     if exists(FileName) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
-    CellSize = GeoT[1]
+    CellSize = GetRasterInfo(FileName).cellsize
 
     return CellSize*CellSize
 #==============================================================================
@@ -145,12 +459,10 @@ def GetUTMMaxMinFromRowsCol(FileName,x_max_col,x_min_col,y_max_row,y_min_row):
     if exists(FileName) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
-    CellSize = GeoT[1]
-    XMin = GeoT[0]
-
-    YMax = GeoT[3]
-    YMin = YMax-CellSize*ysize
+    this_info = GetRasterInfo(FileName)
+    ysize = this_info.ysize
+    CellSize = this_info.cellsize
+    XMin,XMax,YMin,YMax = this_info.extent
 
     xmax_UTM = XMin+x_max_col*CellSize
     xmin_UTM = XMin+x_min_col*CellSize
@@ -189,12 +501,8 @@ def GetLocationVectors(FileName):
 
 
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
-
     CellSize,XMin,XMax,YMin,YMax = GetUTMMaxMin(FileName)
 
-
-
     x_vec = np.arange(XMin,XMax,CellSize)
     y_vec = np.arange(YMin,YMax,CellSize)
 
@@ -225,10 +533,71 @@ def GetRasterExtent(FileName):
 
     Author: SMM
     """
-    CellSize,XMin,XMax,YMin,YMax = GetUTMMaxMin(FileName)
-    extent = [XMin,XMax,YMin,YMax]
+    extent = GetRasterInfo(FileName).extent
     return extent
 
+#==============================================================================
+def GetRasterWindowFromExtent(FileName, extent):
+    """This gets the pixel window of a raster that covers a bounding box. The window is
+    snapped outwards to whole pixels and clipped to the edges of the raster.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        extent (list): [XMin,XMax,YMin,YMax] of the area you want, in the coordinates of the raster
+
+    Return:
+        tuple: The window as (col_offset, row_offset, n_cols, n_rows), which is the order used by gdal's ReadAsArray
+        list: The extent of the window, as [XMin,XMax,YMin,YMax], which is what you pass to imshow
+    """
+    this_info = GetRasterInfo(FileName)
+    xsize = this_info.xsize
+    ysize = this_info.ysize
+    GeoT = this_info.geotransform
+    XMin_req,XMax_req,YMin_req,YMax_req = extent
+
+    col_min = int(np.floor((XMin_req-GeoT[0])/GeoT[1]))
+    col_max = int(np.ceil((XMax_req-GeoT[0])/GeoT[1]))
+    # GeoT[5] is negative for north up rasters
+    row_min = int(np.floor((YMax_req-GeoT[3])/GeoT[5]))
+    row_max = int(np.ceil((YMin_req-GeoT[3])/GeoT[5]))
+
+    col_min = max(col_min,0)
+    row_min = max(row_min,0)
+    col_max = min(col_max,xsize)
+    row_max = min(row_max,ysize)
+
+    if col_max <= col_min or row_max <= row_min:
+        raise Exception("The extent "+str(extent)+" does not overlap the raster "+FileName)
+
+    window = (col_min, row_min, col_max-col_min, row_max-row_min)
+
+    XMin = GeoT[0]+col_min*GeoT[1]
+    XMax = GeoT[0]+col_max*GeoT[1]
+    YMax = GeoT[3]+row_min*GeoT[5]
+    YMin = GeoT[3]+row_max*GeoT[5]
+
+    return window, [XMin,XMax,YMin,YMax]
+
+#==============================================================================
+def GetDecimationForPixelBudget(n_cols, n_rows, max_cols):
+    """This works out how much a raster can be decimated before it has fewer pixels than will be drawn.
+
+    Args:
+        n_cols (int): The number of columns in the raster (or window)
+        n_rows (int): The number of rows in the raster (or window)
+        max_cols (int): The number of pixels across the output image, e.g. figure width in inches times the dpi
+
+    Return:
+        int: the decimation factor (1 means read at full resolution)
+        tuple: the (n_rows, n_cols) of the decimated raster
+    """
+    decimation = 1
+    if max_cols is not None and max_cols > 0:
+        decimation = max(int(n_cols // max_cols), 1)
+
+    out_shape = (int(np.ceil(n_rows/float(decimation))), int(np.ceil(n_cols/float(decimation))))
+    return decimation, out_shape
+
 #==============================================================================
 # Function to read the original file's projection:
 def GetGeoInfo(FileName):
@@ -250,22 +619,14 @@ def GetGeoInfo(FileName):
     """
 
 
-    if exists(FileName) is False:
-            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
-
-
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
+    this_info = GetRasterInfo(FileName)
 
-    NDV = SourceDS.GetRasterBand(1).GetNoDataValue()
-    xsize = SourceDS.RasterXSize
-    ysize = SourceDS.RasterYSize
-    GeoT = SourceDS.GetGeoTransform()
-    Projection = osr.SpatialReference()
-    Projection.ImportFromWkt(SourceDS.GetProjectionRef())
-    DataType = SourceDS.GetRasterBand(1).DataType
-    DataType = gdal.GetDataTypeName(DataType)
+    NDV = this_info.nodata
+    xsize = this_info.xsize
+    ysize = this_info.ysize
+    GeoT = this_info.geotransform
+    Projection = this_info.get_projection()
+    DataType = this_info.data_type_name
 
     return NDV, xsize, ysize, GeoT, Projection, DataType
 #==============================================================================
@@ -283,21 +644,8 @@ def GetUTMEPSG(FileName):
 
     Author: SMM
     """
-    if exists(FileName) is False:
-            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
-
-    # see if the file exists and get the dataset
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
-
-    EPSG_string = 'NULL'
-
-
-    with rio.open(FileName) as src:
-        EPSG_string = src.crs
-        EPSG_string = str(EPSG_string)
-        print("Yoyoyoyo the EPSG is :"+EPSG_string)
+    # The dataset is only opened the first time we ask about this file
+    EPSG_string = GetRasterInfo(FileName).EPSG
 
     if ":327" not in EPSG_string:
         if ":326" not in EPSG_string:
@@ -385,9 +733,9 @@ def GetNPixelsInRaster(FileName):
     Author: SMM
     """
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
+    this_info = GetRasterInfo(FileName)
 
-    return xsize*ysize
+    return this_info.xsize*this_info.ysize
 
 #==============================================================================
 
@@ -410,10 +758,7 @@ def CheckNoData(FileName):
         raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
     # read the file, and check if there is a no data value
-    SourceDS = gdal.Open(FileName, gdal.GA_ReadOnly)
-    if SourceDS == None:
-        raise Exception("Unable to read the data file")
-    NoDataValue = SourceDS.GetRasterBand(1).GetNoDataValue()
+    NoDataValue = GetRasterInfo(FileName).nodata
 
     print("In the check nodata routine. Nodata is: ")
     print(NoDataValue)
@@ -438,19 +783,33 @@ def CheckNoData(FileName):
 
             this_file.close()
 
-    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
+    # the header has changed so this gets a fresh RasterInfo
+    this_info = GetRasterInfo(FileName)
 
-    return xsize*ysize
+    return this_info.xsize*this_info.ysize
 
 #==============================================================================
 
 
 #==============================================================================
-def ReadRasterArrayBlocks(raster_file,raster_band=1):
-    """This reads a raster file (from GDAL) into an array. The "blocks" bit makes it efficient.
+def ReadRasterArrayBlocks(raster_file,raster_band=1,window=None,out_shape=None,resample="nearest",dtype=np.float64,read_only=False):
+    """This reads a raster file (from GDAL) into an array.
+    The data is read with a single ReadAsArray call straight into a preallocated array of the type you want,
+    so the only memory used is the returned array.
+
     Args:
         FileName (str): The filename (with path and extension) of the raster.
         raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        window (tuple): (col_offset, row_offset, n_cols, n_rows) if you only want part of the raster (see GetRasterWindowFromExtent). None reads everything.
+        out_shape (tuple): (n_rows, n_cols) of the returned array. If this is smaller than the window you get a decimated raster:
+            gdal uses the overviews if the file has them, otherwise it resamples on the fly. None reads at full resolution.
+        resample (str): "nearest" or "average". Only used with out_shape. Use nearest for categorical rasters like basins.
+        dtype (np.dtype): The data type of the returned array. The default, float64, is what this has always returned;
+            np.float32 is plenty for plotting and halves the memory. If None, you get the native data type of the raster.
+            Nodata is only set to nan for floating point types: integer arrays keep the nodata value.
+        read_only (bool): If true, you get a read-only array that is shared through the raster cache (see RasterCache),
+            so reading the same raster again costs no memory or time. Copy it if you need to change it. If false,
+            you get your own writeable array (a copy of the cached one if the raster is in the cache).
 
     Return:
         np.array: A numpy array with the data from the raster.
@@ -461,187 +820,295 @@ def ReadRasterArrayBlocks(raster_file,raster_band=1):
 
     if exists(raster_file) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+    RecordFileRead(raster_file)
+
+    # Windows and decimated reads (e.g., for web tiles) are small and rarely read twice,
+    # so only whole rasters are cached
+    use_cache = window is None and out_shape is None
+    if use_cache:
+        if dtype is None:
+            dtype_key = None
+        else:
+            dtype_key = np.dtype(dtype).str
+        cache_key = GetRasterFileKey(raster_file)+("gdal", raster_band, resample, dtype_key)
+        cached_array = _RasterArrayCache.get(cache_key)
+        if cached_array is not None:
+            if read_only:
+                return cached_array
+            return cached_array.copy()
 
     dataset = gdal.Open(raster_file, GA_ReadOnly )
     if dataset == None:
         raise Exception("Unable to read the data file")
 
     band = dataset.GetRasterBand(raster_band)
-    NoDataValue = dataset.GetRasterBand(1).GetNoDataValue()
+    NoDataValue = band.GetNoDataValue()
 
-    block_sizes = band.GetBlockSize()
-    x_block_size = block_sizes[0]
-    y_block_size = block_sizes[1]
-
-    #If the block y size is 1, as in a GeoTIFF image, the gradient can't be calculated,
-    #so more than one block is used. In this case, using8 lines gives a similar
-    #result as taking the whole array.
-    if y_block_size < 8:
-        y_block_size = 8
+    if window is None:
+        x_off = 0
+        y_off = 0
+        xsize = band.XSize
+        ysize = band.YSize
+    else:
+        x_off, y_off, xsize, ysize = window
 
-    xsize = band.XSize
-    ysize = band.YSize
+    if out_shape is None:
+        out_shape = (ysize,xsize)
 
     print("xsize: " +str(xsize)+" and y size: " + str(ysize))
 
-    max_value = band.GetMaximum()
-    min_value = band.GetMinimum()
+    if dtype is None:
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+    dtype = np.dtype(dtype)
 
-    # now initiate the array
-    data_array = np.zeros((ysize,xsize))
+    if resample == "average":
+        resample_alg = gdal.GRIORA_Average
+    else:
+        resample_alg = gdal.GRIORA_NearestNeighbour
 
-    #print "data shape is: "
-    #print data_array.shape
+    # gdal converts the data type and, if out_shape is smaller than the window,
+    # picks the overview level as it fills the buffer
+    data_array = np.empty(out_shape, dtype = dtype)
+    band.ReadAsArray(x_off, y_off, xsize, ysize,
+                     buf_xsize = out_shape[1], buf_ysize = out_shape[0],
+                     buf_obj = data_array, resample_alg = resample_alg)
 
-    if max_value == None or min_value == None:
-        stats = band.GetStatistics(0, 1)
-        max_value = stats[1]
-        min_value = stats[0]
+    print("NoData is:", NoDataValue)
+    if NoDataValue is not None and dtype.kind == "f":
+        data_array[data_array == dtype.type(NoDataValue)] = np.nan
 
-    for i in range(0, ysize, y_block_size):
-        if i + y_block_size < ysize:
-            rows = y_block_size
-        else:
-            rows = ysize - i
+    if use_cache and read_only:
+        _RasterArrayCache.put(cache_key, data_array)
 
-        for j in range(0, xsize, x_block_size):
-            if j + x_block_size < xsize:
-                cols = x_block_size
-            else:
-                cols = xsize - j
+    return data_array
+#==============================================================================
 
-            # get the values for this block
-            values = band.ReadAsArray(j, i, cols, rows)
+#==============================================================================
+def ReadENVIHeader(raster_file):
+    """
+    This parses the ENVI header (.hdr) that sits next to a .bil raster.
 
-            # move these values to the data array
-            data_array[i:i+rows,j:j+cols] = values
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster. The header is the same name with a .hdr extension.
 
-    print("NoData is:", NoDataValue)
-    if NoDataValue is not None:
-        nodata_mask = data_array == NoDataValue
-        data_array[nodata_mask] = np.nan
+    Return:
+        dict: A dictionary with the keys "samples", "lines", "data_type" (a numpy dtype, with the byte order of the file),
+        "header_offset", "nodata" (None if the header has no data ignore value), "x_min", "y_max", "x_res" and "y_res".
+    """
 
-    return data_array
+    header_file = os.path.splitext(raster_file)[0]+".hdr"
+    if exists(header_file) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + header_file + '\'')
+
+    #The type of data representation:
+    #1 = Byte: 8-bit unsigned integer
+    #2 = Integer: 16-bit signed integer
+    #3 = Long: 32-bit signed integer
+    #4 = Floating-point: 32-bit single-precision
+    #5 = Double-precision: 64-bit double-precision floating-point
+    #12 = Unsigned integer: 16-bit
+    #13 = Unsigned long integer: 32-bit
+    #14 = 64-bit long integer (signed)
+    #15 = 64-bit unsigned long integer (unsigned)
+    # The complex types (6 and 9) are not supported
+    envi_dtypes = {1:'uint8', 2:'int16', 3:'int32', 4:'float32', 5:'float64',
+                   12:'uint16', 13:'uint32', 14:'int64', 15:'uint64'}
+
+    header = {"header_offset": 0, "nodata": None, "byte_order": 0, "bands": 1,
+              "x_min": None, "y_max": None, "x_res": None, "y_res": None}
+    info_dtype = None
+    with open(header_file,"r") as hdr_file:
+        for line in hdr_file:
+            if "=" not in line:
+                continue
+            key,value = line.split("=",1)
+            key = key.strip().lower()
+            value = value.strip()
+            if key == "data type":
+                info_dtype = int(value)
+            elif key == "samples":
+                header["samples"] = int(value)
+            elif key == "lines":
+                header["lines"] = int(value)
+            elif key == "bands":
+                header["bands"] = int(value)
+            elif key == "header offset":
+                header["header_offset"] = int(value)
+            elif key == "byte order":
+                header["byte_order"] = int(value)
+            elif key == "data ignore value":
+                header["nodata"] = float(value)
+            elif key == "map info":
+                info = value.strip("{}").split(",")
+                header["x_min"] = float(info[3])
+                header["y_max"] = float(info[4])
+                header["x_res"] = float(info[5])
+                header["y_res"] = float(info[6])
+
+    if info_dtype not in envi_dtypes:
+        raise Exception("The ENVI data type "+str(info_dtype)+" in "+header_file+" is not supported")
+
+    data_type = np.dtype(envi_dtypes[info_dtype])
+    if header["byte_order"] == 1:
+        data_type = data_type.newbyteorder(">")
+    else:
+        data_type = data_type.newbyteorder("<")
+    header["data_type"] = data_type
+
+    return header
 #==============================================================================
 
 #==============================================================================
-def ReadRasterArrayBlocks_numpy(raster_file,raster_band=1):
+def ReadRasterArrayMemmap(raster_file,raster_band=1,default_nodata=-9999):
     """
-    This reads a raster file into an array using numpy. The "blocks" bit makes it efficient.
+    This maps an ENVI .bil raster into memory with numpy.memmap. Nothing is read until
+    you index the array, so it loads in constant time and memory regardless of the size of the raster.
+    The array is read-only and is in the native data type of the file. Nodata is NOT converted to nan:
+    use MemmapWindowToArray to convert the bit you actually need.
+
     Args:
-        FileName (str): The filename (with path and extension) of the raster.
-        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster) Doesn't work yet for more than one band.
+        raster_file (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        default_nodata (float): The nodata value if the header doesn't have one. -9999 is what NFF_opti has always used;
+            None gives no nodata, which is what gdal does.
 
     Return:
-        np.array: A numpy array with the data from the raster.
+        np.memmap: a read-only (lines, samples) view of the raster
+        float: the nodata value
 
     Author: SMM
     """
 
-    print("I will now use numpy.fromfile to load your raster, I still need to be tested, If something goes wrong switch back to the classic method by switching NFF_opti = False. Classic method = unefficient.")
     if exists(raster_file) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
 
-    with open(raster_file[:-3]+"hdr","r") as hdr_file:
-        print("I am opening your raster info")
-        no_data_hdr = -9999 # setting the default noData in case there is no value setted in the hdr file
-        for line in hdr_file:
-            #testing the data type
-            if(line[0:9] == "data type"):
-                info_dtype = line[-2:]
-                info_dtype = int(info_dtype)
-            else:
-                if(line[0:8] == "map info"):
-                    info = line[12:-2]
-                    info = info.split(",")
-                    x_min = float(info[3])
-                    y_max = float(info[4])
-                    x_res = float(info[5])
-                    y_res = float(info[6])
-                    utm_zone = int(info[7])
-                    utm_hemisphere = info[8]
-                else:
-                    if(line[0:7] == "samples"):
-                        num_col = line.replace(" ","").split("=")[1]
-                        print("there are " + str(num_col) + " columns")
-                        num_col = int(num_col)
-                    else:
-                        if(line[0:5] == "lines"):
-                            num_lines = line.replace(" ","").split("=")[1]
-                            print("there are " + str(num_lines) + " lines")
-                            num_lines = int(num_lines)
-                        else:
-                            if(line[0:17] == "data ignore value"):
-                                no_data_hdr = line.replace(" ","").split("=")[1]
-                                print("No data value is: " + str(no_data_hdr) )
-                                no_data_hdr = float(no_data_hdr)
-
-
-        #The type of data representation:
-        #1 = Byte: 8-bit unsigned integer
-        #2 = Integer: 16-bit signed integer
-        #3 = Long: 32-bit signed integer
-        #4 = Floating-point: 32-bit single-precision
-        #5 = Double-precision: 64-bit double-precision floating-point
-        #6 = Complex: Real-imaginary pair of single-precision floating-point
-        #9 = Double-precision complex: Real-imaginary pair of double precision floating-point
-        #12 = Unsigned integer: 16-bit
-        #13 = Unsigned long integer: 32-bit
-        #14 = 64-bit long integer (signed)
-        #15 = 64-bit unsigned long integer (unsigned)
-
-    if(info_dtype == 1):
-        data_type = np.dtype('uint8')
-    else:
-        if(info_dtype == 2):
-            data_type = np.dtype('int16')
-        else:
-            if(info_dtype == 3):
-                data_type = np.dtype('int32')
-            else:
-                if(info_dtype == 4):
-                    data_type = np.dtype('Float32')
-                else:
-                    if(info_dtype == 5):
-                        data_type = np.dtype('Float64')
-                    else:
-                        if(info_dtype == 12):
-                            data_type = np.dtype('uint16')
-    print("your data type is "  + str(data_type))
-    # Alright now loading and converting the data
-    print("I am now ingesting your raster")
-    data_array = np.fromfile(raster_file,data_type).reshape(num_lines,num_col)
-    if(info_dtype in [1,2,3,12]):
-        data_array = data_array.astype(float)
-    print("I nailed it")
-    x_max = x_min + x_res*num_col
-    y_min = y_max - y_res*num_lines
-    print("I am returning the raster array and info")
-    NoDataValue = no_data_hdr
+    RecordFileRead(raster_file)
+    header = ReadENVIHeader(raster_file)
+    if raster_band > header["bands"]:
+        raise Exception("The raster "+raster_file+" only has "+str(header["bands"])+" band(s)")
+
+    # In band interleaved by line format the bands of each line sit next to each other
+    data_array = np.memmap(raster_file, dtype = header["data_type"], mode = "r",
+                           offset = header["header_offset"],
+                           shape = (header["lines"], header["bands"], header["samples"]))
+    data_array = data_array[:, raster_band-1, :]
+
+    NoDataValue = header["nodata"]
+    if NoDataValue is None:
+        NoDataValue = default_nodata
+
+    return data_array, NoDataValue
+#==============================================================================
+
+#==============================================================================
+def GetNoDataMask(data_array, NoDataValue, window = None):
+    """
+    Gets a boolean mask of the nodata pixels in a (possibly memory mapped) raster array.
+
+    Args:
+        data_array (np.array): The raster array, usually from ReadRasterArrayMemmap
+        NoDataValue (float): The nodata value
+        window (tuple): (col_offset, row_offset, n_cols, n_rows) in pixels, same order as gdal's ReadAsArray. If None you get the whole raster
+
+    Return:
+        np.array: boolean array which is True where there is nodata
+    """
+
+    if window is not None:
+        col_off, row_off, n_cols, n_rows = window
+        data_array = data_array[row_off:row_off+n_rows, col_off:col_off+n_cols]
+
+    if NoDataValue is None:
+        return np.zeros(data_array.shape, dtype = bool)
+    return data_array == NoDataValue
+#==============================================================================
+
+#==============================================================================
+def MemmapWindowToArray(data_array, NoDataValue, window = None, dtype = np.float32):
+    """
+    Converts a window of a memory mapped raster to a floating point array with nodata set to nan.
+    Only the pixels in the window are read from disk.
+
+    Args:
+        data_array (np.array): The raster array, usually from ReadRasterArrayMemmap
+        NoDataValue (float): The nodata value
+        window (tuple): (col_offset, row_offset, n_cols, n_rows) in pixels, same order as gdal's ReadAsArray. If None you get the whole raster
+        dtype (np.dtype): a floating point data type for the output
+
+    Return:
+        np.array: A new, writeable numpy array with the data from the window.
+    """
+
+    if window is not None:
+        col_off, row_off, n_cols, n_rows = window
+        data_array = data_array[row_off:row_off+n_rows, col_off:col_off+n_cols]
+
+    # a single copy straight into the output type, in native byte order
+    out_array = np.array(data_array, dtype = np.dtype(dtype).newbyteorder("="))
     if NoDataValue is not None:
-        data_array[data_array == NoDataValue] = np.nan
+        # compared after the conversion, as ReadRasterArrayBlocks does
+        out_array[out_array == out_array.dtype.type(NoDataValue)] = np.nan
 
+    return out_array
+#==============================================================================
 
-    return data_array
 #==============================================================================
+def ReadRasterArrayBlocks_numpy(raster_file,raster_band=1,read_only=False):
+    """
+    This reads an ENVI .bil raster file into an array using numpy. The file is memory mapped
+    and then copied once into a floating point array, so it only needs the memory of the output array.
+    If you don't need the whole raster as floats use ReadRasterArrayMemmap and MemmapWindowToArray instead.
 
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster (almost all uses with LSDTopoTools will have a 1 band raster)
+        read_only (bool): If true, you get a read-only array shared through the raster cache (see ReadRasterArrayBlocks)
+
+    Return:
+        np.array: A numpy array with the data from the raster. Integer rasters are returned as float64, floating point rasters keep their precision.
+
+    Author: SMM
+    """
+
+    data_array, NoDataValue = ReadRasterArrayMemmap(raster_file,raster_band)
+
+    cache_key = GetRasterFileKey(raster_file)+("memmap", raster_band)
+    cached_array = _RasterArrayCache.get(cache_key)
+    if cached_array is not None:
+        if read_only:
+            return cached_array
+        return cached_array.copy()
+
+    if data_array.dtype.kind == "f":
+        out_dtype = data_array.dtype
+    else:
+        out_dtype = np.float64
+
+    out_array = MemmapWindowToArray(data_array, NoDataValue, dtype = out_dtype)
+    if read_only:
+        _RasterArrayCache.put(cache_key, out_array)
+
+    return out_array
 #==============================================================================
-def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue = -9999):
-    """Takes an array and writes to a GDAL compatible raster. It needs another raster to map the dimensions.
+
+#==============================================================================
+def CreateRasterLike(rasterfn,newRasterfn,driver_name = "ENVI", noDataValue = -9999):
+    """Creates an empty single band Float32 raster with the same dimensions, georeferencing and projection as another raster.
+    You can then write to it a block at a time with WriteArray(block, col_offset, row_offset) on the band.
+    Call FinishRasterLike when you are done.
 
     Args:
-        FileName (str): The filename (with path and extension) of a raster that has the same dimensions as the raster to be written.
+        rasterfn (str): The filename (with path and extension) of a raster that has the same dimensions as the raster to be written.
         newRasterfn (str): The filename (with path and extension) of the new raster.
-        array (np.array): The array to be written
         driver_name (str): The type of raster to write. Default is ENVI since that is the LSDTOpoTools format
         noDataValue (float): The no data value
 
     Return:
-        np.array: A numpy array with the data from the raster.
+        gdal.Dataset: the new raster, open for writing
 
     Author: SMM
     """
-
+    RecordFileRead(rasterfn)
     raster = gdal.Open(rasterfn)
     geotransform = raster.GetGeoTransform()
     originX = geotransform[0]
@@ -656,13 +1123,26 @@ def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue =
     outRaster = driver.Create(newRasterfn, cols, rows, 1, gdal.GDT_Float32)
     outRaster.SetGeoTransform((originX, pixelWidth, 0, originY, 0, pixelHeight))
     outRaster.GetRasterBand(1).SetNoDataValue( noDataValue )
-    outband = outRaster.GetRasterBand(1)
-    outband.WriteArray(array)
     outRasterSRS = osr.SpatialReference()
     outRasterSRS.ImportFromWkt(raster.GetProjectionRef())
     outRaster.SetProjection(outRasterSRS.ExportToWkt())
-    outband.FlushCache()
     raster=None
+    RecordFileWrite(newRasterfn)
+
+    return outRaster
+#==============================================================================
+
+#==============================================================================
+def FinishRasterLike(outRaster,newRasterfn,driver_name = "ENVI", noDataValue = -9999):
+    """Flushes and closes a raster made with CreateRasterLike. For ENVI rasters it also adds the nodata value to the header.
+
+    Args:
+        outRaster (gdal.Dataset): the raster from CreateRasterLike
+        newRasterfn (str): The filename (with path and extension) of the new raster.
+        driver_name (str): The type of raster
+        noDataValue (float): The no data value
+    """
+    outRaster.GetRasterBand(1).FlushCache()
     outRaster=None
 
     # Get the raster prefix
@@ -676,72 +1156,182 @@ def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue =
         with open(hdrname,"a") as f:
             #print("Appending data div to "+hdrname)
             f.write('data ignore value = '+str(noDataValue)+"\n")
-
+#==============================================================================
 
 #==============================================================================
+def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue = -9999):
+    """Takes an array and writes to a GDAL compatible raster. It needs another raster to map the dimensions.
+
+    Args:
+        FileName (str): The filename (with path and extension) of a raster that has the same dimensions as the raster to be written.
+        newRasterfn (str): The filename (with path and extension) of the new raster.
+        array (np.array): The array to be written
+        driver_name (str): The type of raster to write. Default is ENVI since that is the LSDTOpoTools format
+        noDataValue (float): The no data value
 
+    Return:
+        np.array: A numpy array with the data from the raster.
 
-def RasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName="Test.outfile", OutFileType="ENVI"):
-    """
-    Takes two rasters of same size and subtracts second from first,
-    e.g. Raster1 - Raster2 = raster_of_difference
-    then writes it out to file
+    Author: SMM
     """
 
-    Raster1 = gdal.Open(RasterFile1)
-    Raster2 = gdal.Open(RasterFile2)
+    outRaster = CreateRasterLike(rasterfn,newRasterfn,driver_name = driver_name, noDataValue = noDataValue)
+    outRaster.GetRasterBand(1).WriteArray(array)
+    FinishRasterLike(outRaster,newRasterfn,driver_name = driver_name, noDataValue = noDataValue)
 
-    print("RASTER 1: ")
-    print(Raster1.GetGeoTransform())
-    print(Raster1.RasterCount)
-    print(Raster1.GetRasterBand(1).XSize)
-    print(Raster1.GetRasterBand(1).YSize)
-    print(Raster1.GetRasterBand(1).DataType)
 
-    print("RASTER 2: ")
-    print(Raster2.GetGeoTransform())
-    print(Raster2.RasterCount)
-    print(Raster2.GetRasterBand(1).XSize)
-    print(Raster2.GetRasterBand(1).YSize)
-    print(Raster2.GetRasterBand(1).DataType)
+#==============================================================================
 
-    raster_array1 = np.array(Raster1.GetRasterBand(raster_band).ReadAsArray())
-    raster_array2 = np.array(Raster2.GetRasterBand(raster_band).ReadAsArray())
 
-    assert(raster_array1.shape == raster_array2.shape )
-    print("Shapes: ", raster_array1.shape, raster_array2.shape)
+def TiledRasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName=None, OutFileType="ENVI", tile_rows=512, n_threads=4):
+    """
+    Takes two rasters of same size and subtracts second from first (Raster1 - Raster2) a tile of rows at a time,
+    with the tiles spread over a pool of threads. Only a few tiles are in memory at once, so this works on rasters
+    that are bigger than memory. The difference is written to OutFileName as it is calculated, and statistics of the
+    difference are added up tile by tile.
 
-    difference_raster_array = raster_array1 - raster_array2
+    Args:
+        RasterFile1 (str): The filename (with path and extension) of the first raster.
+        RasterFile2 (str): The filename (with path and extension) of the second raster, which is subtracted from the first
+        raster_band (int): The band
+        OutFileName (str): The filename of the difference raster. If None, only the statistics are calculated.
+        OutFileType (str): The gdal driver of the difference raster.
+        tile_rows (int): The number of rows in each tile
+        n_threads (int): The number of threads. gdal and numpy release the GIL so this does speed things up.
 
-#    import matplotlib.pyplot as plt
-#
-#    plt.imshow(difference_raster_array)
-#
+    Return:
+        dict: The statistics of the difference, ignoring pixels that are nodata in either raster:
+
+            * n_valid: The number of pixels with data in both rasters
+            * n_nodata: The number of pixels that are nodata in one or both rasters
+            * sum: The sum of the differences
+            * cut: The sum of the negative differences (a negative number)
+            * fill: The sum of the positive differences
+            * min, max: The smallest and largest differences
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-    driver = gdal.GetDriverByName(OutFileType)
+    for FileName in [RasterFile1, RasterFile2]:
+        if exists(FileName) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
 
-    dsOut = driver.Create(OutFileName,
-                          Raster1.GetRasterBand(1).XSize,
-                          Raster1.GetRasterBand(1).YSize,
-                          1,
-                          gdal.GDT_Float32)
-                          #Raster1.GetRasterBand(raster_band).DataType)
+    Info1 = GetRasterInfo(RasterFile1)
+    Info2 = GetRasterInfo(RasterFile2)
+    print("Raster 1 is "+str(Info1.xsize)+" by "+str(Info1.ysize)+" and raster 2 is "+str(Info2.xsize)+" by "+str(Info2.ysize))
+    if Info1.xsize != Info2.xsize or Info1.ysize != Info2.ysize:
+        raise Exception("The rasters "+RasterFile1+" and "+RasterFile2+" are not the same size")
+
+    xsize = Info1.xsize
+    ysize = Info1.ysize
+
+    # gdal datasets can't be shared between threads, so each thread opens its own
+    thread_data = threading.local()
+
+    def difference_of_tile(row_start):
+        if not hasattr(thread_data, "bands"):
+            thread_data.datasets = [gdal.Open(RasterFile1, GA_ReadOnly), gdal.Open(RasterFile2, GA_ReadOnly)]
+            thread_data.bands = [ds.GetRasterBand(raster_band) for ds in thread_data.datasets]
+        band1, band2 = thread_data.bands
+
+        n_rows = min(tile_rows, ysize-row_start)
+        tile1 = band1.ReadAsArray(0, row_start, xsize, n_rows)
+        tile2 = band2.ReadAsArray(0, row_start, xsize, n_rows)
+
+        # The raster that is written out has the same arithmetic (in the native data types) as the whole
+        # raster version did. The statistics are of the differences in float64, as the mass balance always was.
+        difference = None
+        if OutFileName is not None:
+            difference = tile1 - tile2
+        difference64 = tile1.astype(np.float64) - tile2.astype(np.float64)
+
+        valid = np.ones(difference64.shape, dtype = bool)
+        if band1.GetNoDataValue() is not None:
+            valid &= tile1 != band1.GetNoDataValue()
+        if band2.GetNoDataValue() is not None:
+            valid &= tile2 != band2.GetNoDataValue()
+        valid_difference = difference64[valid]
+        valid_difference = valid_difference[np.isfinite(valid_difference)]
+
+        tile_stats = {"n_valid": valid_difference.size,
+                      "n_nodata": difference64.size - valid_difference.size,
+                      "sum": np.sum(valid_difference),
+                      "cut": np.sum(valid_difference[valid_difference < 0]),
+                      "fill": np.sum(valid_difference[valid_difference > 0]),
+                      "min": np.min(valid_difference) if valid_difference.size > 0 else np.nan,
+                      "max": np.max(valid_difference) if valid_difference.size > 0 else np.nan}
+        return row_start, difference, tile_stats
+
+    dsOut = None
+    if OutFileName is not None:
+        Raster1 = gdal.Open(RasterFile1, GA_ReadOnly)
+        driver = gdal.GetDriverByName(OutFileType)
+        dsOut = driver.Create(OutFileName, xsize, ysize, 1, gdal.GDT_Float32)
+        gdal_array.CopyDatasetInfo(Raster1,dsOut)
+        Raster1 = None
+        bandOut = dsOut.GetRasterBand(1)
+
+    stats = {"n_valid": 0, "n_nodata": 0, "min": np.nan, "max": np.nan}
+    # The sums of the tiles are added up with math.fsum at the end, so rounding doesn't build up over the tiles.
+    # If the raster is one tile this is the same np.sum of the whole raster that the mass balance always used.
+    partial_sums = {"sum": [], "cut": [], "fill": []}
+    row_starts = list(range(0, ysize, tile_rows))
+
+    # we only hand out a couple of tiles per thread at a time so the finished tiles don't pile up in memory
+    n_in_flight = max(2*n_threads, 1)
+    with ThreadPoolExecutor(max_workers = n_threads) as executor:
+        for first in range(0, len(row_starts), n_in_flight):
+            for row_start, difference, tile_stats in executor.map(difference_of_tile, row_starts[first:first+n_in_flight]):
+                if dsOut is not None:
+                    bandOut.WriteArray(difference.astype(np.float32), 0, row_start)
+                for key in ["n_valid", "n_nodata"]:
+                    stats[key] += tile_stats[key]
+                for key in partial_sums:
+                    partial_sums[key].append(tile_stats[key])
+                stats["min"] = np.fmin(stats["min"], tile_stats["min"])
+                stats["max"] = np.fmax(stats["max"], tile_stats["max"])
+
+    for key in partial_sums:
+        stats[key] = math.fsum(partial_sums[key])
+
+    if dsOut is not None:
+        bandOut.FlushCache()
+        dsOut = None
+        RecordFileWrite(OutFileName)
+
+    return stats
+#==============================================================================
 
+#==============================================================================
+def RasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName="Test.outfile", OutFileType="ENVI", tile_rows=512, n_threads=4):
+    """
+    Takes two rasters of same size and subtracts second from first,
+    e.g. Raster1 - Raster2 = raster_of_difference
+    then writes it out to file.
+    This is done in tiles (see TiledRasterDifference) so the rasters are never all in memory.
+
+    Returns:
+        dict: The statistics of the difference, see TiledRasterDifference
+    """
 
-    gdal_array.CopyDatasetInfo(Raster1,dsOut)
-    bandOut = dsOut.GetRasterBand(1)
-    gdal_array.BandWriteArray(bandOut, difference_raster_array)
+    return TiledRasterDifference(RasterFile1, RasterFile2, raster_band=raster_band, OutFileName=OutFileName,
+                                 OutFileType=OutFileType, tile_rows=tile_rows, n_threads=n_threads)
 
 #==============================================================================
-def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
+def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons', simplify_tolerance = None):
     """
     This function takes in a raster and converts to a polygon shapefile using rasterio
     from https://gis.stackexchange.com/questions/187877/how-to-polygonize-raster-to-shapely-polygons/187883#187883?newreg=8b1f507529724a8488ce4789ba787363
 
+    If a raster value has more than one polygon, only the largest is kept. The polygons are
+    made in one pass over the shapes rasterio finds, and written to the shapefile in one go.
+
     Args:
         DataDirectory (str): the data directory with the basin raster
         RasterFile (str): the name of the raster
         OutputShapefile (str): the name of the output shapefile WITHOUT EXTENSION. Default = 'polygons'
+        simplify_tolerance (float): If this is given the polygons are simplified (keeping their topology) with this tolerance,
+            in the units of the raster. Something like the size of a pixel in the final figure shrinks the shapefile a lot.
+            None keeps every pixel edge.
 
     Returns:
         Dictionary where key is the raster value and the value is a shapely polygon
@@ -749,7 +1339,6 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
     Author: FJC
     """
     # import modules
-    import rasterio
     from rasterio.features import shapes
     from shapely.geometry import shape, Polygon, mapping
     import fiona
@@ -761,79 +1350,52 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
     # get raster no data value
     NDV = getNoDataValue(DataDirectory+RasterFile)
 
+    # This is necessary to filter the basin results: for each value keep the polygon with the largest area
+    PolygonDict = {}
+    area_dict = {}
+    n_shapes = 0
+
     # load in the raster using rasterio
+    RecordFileRead(DataDirectory+RasterFile)
     with rio.open(DataDirectory+RasterFile) as src:
         image = src.read(raster_band, masked=False)
-
         msk = src.read_masks(1)
+        crs = src.crs
+
+        for s, v in shapes(image, mask=msk, transform=src.transform):
+            n_shapes += 1
+            this_val = float(v)
+            this_shape = Polygon(shape(s))
+            this_area = this_shape.area
+            if this_val not in area_dict or area_dict[this_val] < this_area:
+                PolygonDict[this_val] = this_shape
+                area_dict[this_val] = this_area
 
-        results = (
-        {'properties': {'raster_val': v}, 'geometry': s}
-        for i, (s, v)
-        in enumerate(
-            shapes(image, mask=msk, transform=src.transform)))
+    n_repeats = n_shapes - len(PolygonDict)
+    if n_repeats > 0:
+        print("Whoops. Found "+str(n_repeats)+" polygons with repeated IDs. I kept the largest polygon of each ID.")
+
+    if simplify_tolerance is not None:
+        for this_val, this_shape in PolygonDict.items():
+            PolygonDict[this_val] = this_shape.simplify(simplify_tolerance, preserve_topology = True)
 
     # define shapefile attributes
     print("Let me grab the coordinate reference system.")
-    crs = src.crs
     print (crs)
-
-    #crs = GetUTMEPSG(DataDirectory+RasterFile)
     schema = {'geometry': 'Polygon',
               'properties': { 'ID': 'float'}}
 
-
-
-    # This is necessary to filter the basin results
-    geoms = list(results)
-    #print("Geom size is: "+str(len(geoms)))
-
-    filtered_geoms = {}
-    area_dict = {}
-    for f in geoms:
-        this_shape = Polygon(shape(f['geometry']))
-        this_val = float(f['properties']['raster_val'])
-        #print("ID is: "+str(this_val))
-        this_area = this_shape.area
-        if this_val in filtered_geoms.keys():
-            print("Whoops. Found a repeated ID. Getting rid of the smaller one.")
-            if area_dict[this_val] < this_area:
-                filtered_geoms[this_val] = f
-                area_dict[this_val] = this_area
-                print("Found a repeated ID. Keeping the one with area of "+str(this_area))
-            else:
-                print("Keeping the initial ID.")
-        else:
-            filtered_geoms[this_val] = f
-            area_dict[this_val] = this_area
-
-    new_geoms = []
-    for key,item in filtered_geoms.items():
-        this_shape = Polygon(shape(item['geometry']))
-        this_val = float(item['properties']['raster_val'])
-        #print("ID is: "+str(this_val))
-        this_area = this_shape.area
-        #print("Area is: "+str(this_area))
-        new_geoms.append(item)
-    #print("Geom size is: "+str(len(new_geoms)))
-
-    # transform results into shapely geometries and write to shapefile using fiona
-    PolygonDict = {}
-
     # We use the internal fiona crs module since this is really buggy and depends on
     # the proj version
     print("I need to convert the crs to wkt format so it is resistant to stupid proj errors.")
     this_crs_in_wkt = crs.to_wkt()
 
-
+    # write the shapefile using fiona
     with fiona.open(DataDirectory+OutputShapefile, 'w', crs=this_crs_in_wkt, driver='ESRI Shapefile', schema=schema) as output:
-        for f in new_geoms:
-            this_shape = Polygon(shape(f['geometry']))
-            this_val = float(f['properties']['raster_val'])
-            print("ID is: "+str(this_val))
-            if this_val != NDV: # remove no data values
-                output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
-            PolygonDict[this_val] = this_shape
+        output.writerecords({'geometry': mapping(this_shape), 'properties':{'ID': this_val}}
+                            for this_val, this_shape in PolygonDict.items() if this_val != NDV) # remove no data values
+    RecordFileWrite(DataDirectory+OutputShapefile)
+    print("I wrote "+str(len([v for v in PolygonDict if v != NDV]))+" polygons to "+DataDirectory+OutputShapefile)
 
     return PolygonDict
 
@@ -871,6 +1433,7 @@ def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons')
     NDV = getNoDataValue(DataDirectory+RasterFile)
 
     # load in the raster using rasterio
+    RecordFileRead(DataDirectory+RasterFile)
     with rasterio.open(DataDirectory+RasterFile) as src:
         image = src.read(raster_band, masked=False)
 
@@ -906,6 +1469,7 @@ def PolygoniseRasterMerge(DataDirectory, RasterFile, OutputShapefile='polygons')
                 output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
 
             PolygonDict[this_val] = this_shape
+    RecordFileWrite(DataDirectory+OutputShapefile)
 
     return PolygonDict
 
@@ -1019,6 +1583,7 @@ def CreateShapefileOfRasterFootprint(DataDirectory, RasterFile):
     # Clean up
     feature = None
     datasource  = None
+    RecordFileWrite(OutFileName)
 
 
 def GetCentreAndExtentOfRaster(DataDirectory, RasterFile):
@@ -1146,6 +1711,7 @@ def convert2bil(DataDirectory, RasterFile,minimum_elevation=0.01):
 
     fname = DataDirectory+RasterFile
 
+    RecordFileRead(fname)
     src =  rio.open(fname)
     rast = src.read(1)
     nodatavalue = -9999
@@ -1201,6 +1767,7 @@ def convert2UTM(DataDirectory, RasterFile,minimum_elevation=0.01,resolution=30):
 
     # First get the source coordinate system
     # open dataset
+    RecordFileRead(filename)
     ds = gdal.Open(filename)
     prj=ds.GetProjection()
     print("The projections is:")
@@ -1299,6 +1866,7 @@ def convert2UTM(DataDirectory, RasterFile,minimum_elevation=0.01,resolution=30):
                     dst_transform=transform,
                     dst_crs=dst_crs,
                     resampling=Resampling.cubic)
+    RecordFileWrite(output_filename)
     dem_datam2 = rio.open(output_filename)
 
     print(dem_datam2.meta)
@@ -1346,14 +1914,21 @@ def convert4lsdtt(DataDirectory, RasterFile,minimum_elevation=0.01,resolution=30
 
 #==============================================================================
 # Make a simple hillshade plot
-def write_hillshade_bil(DataDirectory, RasterFile, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1, resolution = 30.0):
-    """Creates a hillshade raster
+def write_hillshade_bil(DataDirectory, RasterFile, azimuth = 315, angle_altitude = 45, NoDataValue = -9999,z_factor = 1, resolution = 30.0,
+                        strip_rows = 1024, OutFileType = "ENVI", backend = "numpy", method = "zevenbergen_thorne", dtype = np.float64):
+    """Creates a hillshade raster. The DEM is shaded and written a strip of rows at a time (see HillshadeStrips)
+    so the memory used depends on strip_rows, not on the size of the DEM.
 
     Args:
         raster_file (str): The name of the raster file with path and extension.
         azimuth (float): Azimuth of sunlight
         angle_altitude (float): Angle altitude of sun
         NoDataValue (float): The nodata value of the raster
+        strip_rows (int): The number of rows shaded and written at a time
+        OutFileType (str): ENVI (you get a _hs.bil) or GTiff (you get a _hs.tif)
+        backend (str): "numpy" or "cython" (the same hillshade, multithreaded; see lsdmap_hillshade.HillshadeArray)
+        method (str): The gradient kernel, "zevenbergen_thorne" or "horn" (see lsdmap_hillshade.HillshadeArray)
+        dtype (numpy.dtype): The precision of the calculation. float32 is opt in.
 
     Returns:
         HSArray (numpy.array): The hillshade array
@@ -1377,8 +1952,16 @@ def write_hillshade_bil(DataDirectory, RasterFile, azimuth = 315, angle_altitude
     RasterName = DataDirectory+RasterFile
 
 
-    hs = bm.Hillshade(RasterName, azimuth = azimuth, angle_altitude = angle_altitude, NoDataValue = NoDataValue,z_factor = z_factor, resolution = resolution)
+    if OutFileType == "GTiff":
+        outname = DataDirectory+RasterPrefix+"_hs.tif"
+    else:
+        outname = DataDirectory+RasterPrefix+"_hs.bil"
 
-    outname = DataDirectory+RasterPrefix+"_hs.bil"
-    array2raster(RasterName,outname,hs)
+    outRaster = CreateRasterLike(RasterName,outname,driver_name = OutFileType)
+    outband = outRaster.GetRasterBand(1)
+    for row_start, hs_strip in bm.HillshadeStrips(RasterName, azimuth = azimuth, angle_altitude = angle_altitude,
+                                                  z_factor = z_factor, strip_rows = strip_rows, backend = backend,
+                                                  method = method, dtype = dtype):
+        outband.WriteArray(hs_strip, 0, row_start)
+    FinishRasterLike(outRaster,outname,driver_name = OutFileType)
 
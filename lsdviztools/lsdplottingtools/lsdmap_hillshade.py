@@ -0,0 +1,208 @@
+## LSDMap_Hillshade.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## The hillshade engine. Everything in lsdviztools that shades a DEM
+## (Hillshade, write_hillshade_bil, zevenbergen_thorne_hillshade,
+## Hillshade_Smooth) comes through here.
+##
+## There are two kernels for the gradients:
+##   zevenbergen_thorne: central differences (np.gradient). This is what the
+##                       python hillshades have always used, and the default.
+##   horn: the 3x3 kernel used by LSDRaster in the C++ code.
+## and one illumination model, which can be single or multidirectional.
+## Single direction hillshades with either kernel can also run in the compiled,
+## multithreaded fast_hillshade extension, which does the same calculation.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+# The compiled hillshade is optional (see setup.py). If it isn't there we use numpy.
+try:
+    from lsdviztools.lsdplottingtools import fast_hillshade
+except ImportError:
+    fast_hillshade = None
+
+# The azimuths that are blended in the multidirectional hillshade
+MULTIDIRECTIONAL_AZIMUTHS = [225, 270, 315, 360]
+
+
+#==============================================================================
+def HillshadeGradients(array, resolution, method = "zevenbergen_thorne"):
+    """Calculates the elevation gradients used by the hillshade.
+
+    Args:
+        array (numpy.array): The elevation array, in the precision you want to do the calculation in.
+        resolution (float): The pixel size
+        method (str): "zevenbergen_thorne" (central differences, the edges use one sided differences)
+            or "horn" (3x3 kernel, the edges are nan)
+
+    Returns:
+        d_row (numpy.array): the gradient in the row direction (down the raster)
+        d_col (numpy.array): the gradient in the column direction (across the raster)
+    """
+    resolution = array.dtype.type(resolution)
+
+    if method == "zevenbergen_thorne":
+        d_row, d_col = np.gradient(array)
+        d_row /= resolution
+        d_col /= resolution
+
+    elif method == "horn":
+        d_row = np.full(array.shape, np.nan, dtype = array.dtype)
+        d_col = np.full(array.shape, np.nan, dtype = array.dtype)
+        if array.shape[0] > 2 and array.shape[1] > 2:
+            t = array
+            eight_res = 8*resolution
+            d_row[1:-1,1:-1] = ((t[2:,:-2] + 2*t[2:,1:-1] + t[2:,2:]) - (t[:-2,:-2] + 2*t[:-2,1:-1] + t[:-2,2:])) / eight_res
+            d_col[1:-1,1:-1] = ((t[:-2,2:] + 2*t[1:-1,2:] + t[2:,2:]) - (t[:-2,:-2] + 2*t[1:-1,:-2] + t[2:,:-2])) / eight_res
+    else:
+        raise ValueError("The hillshade method must be zevenbergen_thorne or horn, you gave me: "+str(method))
+
+    return d_row, d_col
+#==============================================================================
+
+#==============================================================================
+def ShadeFromGradients(d_row, d_col, azimuth = 315, angle_altitude = 45, z_factor = 1, multidirectional = False, out = None):
+    """Calculates the illumination (cosine of the angle between the surface normal and the sun) from the gradients.
+    This is the usual hillshade formula, but written in terms of the gradients so there
+    is no arctan, cos or sin of whole arrays.
+
+    Args:
+        d_row, d_col (numpy.array): the gradients from HillshadeGradients
+        azimuth (float): Azimuth of sunlight. Ignored if multidirectional is True
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): vertical exaggeration
+        multidirectional (bool): If True, blends the hillshades from MULTIDIRECTIONAL_AZIMUTHS, weighting each by how
+            side-on the slope is to that light, like the gdaldem multidirectional hillshade.
+        out (numpy.array): an array to put the answer in. If None a new one is made.
+
+    Returns:
+        numpy.array: the illumination, from -1 to 1
+    """
+    dtype = d_row.dtype
+    if out is None:
+        out = np.empty(d_row.shape, dtype = dtype)
+
+    altituderad = np.deg2rad(angle_altitude)
+    sin_alt = dtype.type(np.sin(altituderad))
+    cos_alt_z = dtype.type(np.cos(altituderad)*z_factor)
+
+    # 1/sqrt(1+tan(slope)^2) is cos(slope)
+    inv_norm = d_row*d_row
+    inv_norm += d_col*d_col
+    if multidirectional:
+        grad_mag = np.sqrt(inv_norm)
+    inv_norm *= dtype.type(z_factor*z_factor)
+    inv_norm += 1
+    np.sqrt(inv_norm, out = inv_norm)
+    np.reciprocal(inv_norm, out = inv_norm)
+
+    if not multidirectional:
+        azimuthrad = np.deg2rad(azimuth)
+        # sin(alt)*cos(slope) + cos(alt)*sin(slope)*cos(azimuth - aspect)
+        np.multiply(d_col, dtype.type(np.cos(azimuthrad))*cos_alt_z, out = out)
+        out -= d_row*(dtype.type(np.sin(azimuthrad))*cos_alt_z)
+        out += sin_alt
+        out *= inv_norm
+        return out
+
+    # The aspect, as a unit vector. Flat pixels get an arbitrary aspect, which doesn't matter since they have no slope
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        cos_aspect = d_col/grad_mag
+        sin_aspect = -d_row/grad_mag
+    flat = ~(grad_mag > 0)
+    cos_aspect[flat] = 1
+    sin_aspect[flat] = 0
+    cos_2aspect = cos_aspect*cos_aspect - sin_aspect*sin_aspect
+    sin_2aspect = 2*sin_aspect*cos_aspect
+
+    out[...] = 0
+    for this_azimuth in MULTIDIRECTIONAL_AZIMUTHS:
+        azimuthrad = np.deg2rad(this_azimuth)
+        shaded = d_col*(dtype.type(np.cos(azimuthrad))*cos_alt_z)
+        shaded -= d_row*(dtype.type(np.sin(azimuthrad))*cos_alt_z)
+        shaded += sin_alt
+
+        # the weight is sin^2(aspect - azimuth). For these four azimuths they add up to 2
+        weight = cos_2aspect*dtype.type(np.cos(2*azimuthrad))
+        weight += sin_2aspect*dtype.type(np.sin(2*azimuthrad))
+        np.subtract(1, weight, out = weight)
+        weight *= dtype.type(0.5)
+
+        shaded *= weight
+        out += shaded
+
+    out *= dtype.type(0.5)
+    out *= inv_norm
+    return out
+#==============================================================================
+
+#==============================================================================
+def HillshadeArray(array, resolution, azimuth = 315, angle_altitude = 45, z_factor = 1, method = "zevenbergen_thorne", multidirectional = False,
+                   dtype = np.float64, out = None, backend = "numpy", NoDataValue = -9999, mask_negative = True):
+    """Calculates the hillshade of an elevation array.
+
+    Args:
+        array (numpy.array): The elevation array. It is not modified.
+        resolution (float): The pixel size
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): vertical exaggeration
+        method (str): The gradient kernel: "zevenbergen_thorne" (the default) or "horn". zevenbergen_thorne is scaled so
+            that -1 to 1 illumination maps to 0 to 255 (as the python hillshades always have been); horn is clipped at 0
+            (as in LSDRaster), and its edges are nan. None is zevenbergen_thorne. The kernel doesn't depend on the backend.
+        multidirectional (bool): If True blend the hillshades from several azimuths (see ShadeFromGradients)
+        dtype (numpy.dtype): The precision of the calculation. float32 is about twice as fast with numpy, and differs
+            from float64 by about 1e-4 of a grey level.
+        out (numpy.array): An array of the same shape to put the hillshade in. If None a new one is made.
+        backend (str): "numpy" or "cython". cython uses the multithreaded fast_hillshade extension (which always works in
+            float64) if it has been built, and numpy if not. It gives the same answer as numpy. Multidirectional
+            hillshades are always done with numpy.
+        NoDataValue (float): The nodata value. These pixels are nan in the hillshade. None if there isn't one.
+        mask_negative (bool): If True, negative elevations are treated as nodata
+
+    Returns:
+        HSArray (numpy.array): The hillshade array, scaled from 0 to 255
+    """
+    if backend not in ["numpy","cython"]:
+        raise ValueError("The hillshade backend must be numpy or cython, you gave me: "+str(backend))
+    if method is None:
+        method = "zevenbergen_thorne"
+    if method not in ["zevenbergen_thorne","horn"]:
+        raise ValueError("The hillshade method must be zevenbergen_thorne or horn, you gave me: "+str(method))
+
+    dtype = np.dtype(dtype)
+
+    # we copy the array once, into the precision we want, and mask that
+    z = np.array(array, dtype = dtype)
+    if mask_negative:
+        z[z < 0] = np.nan
+    if NoDataValue is not None:
+        z[z == NoDataValue] = np.nan
+
+    if backend == "cython" and not multidirectional:
+        if fast_hillshade is not None:
+            hs = fast_hillshade.Hillshade(z.astype(np.float64, copy = False), float(resolution), azimuth = azimuth,
+                                          angle_altitude = angle_altitude, z_factor = z_factor, method = method)
+            if out is None:
+                return hs.astype(dtype, copy = False)
+            out[...] = hs
+            return out
+        else:
+            print("The fast_hillshade extension isn't built, so I am using the numpy version of the same hillshade.")
+
+    d_row, d_col = HillshadeGradients(z, resolution, method = method)
+    del z
+    out = ShadeFromGradients(d_row, d_col, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor,
+                             multidirectional = multidirectional, out = out)
+
+    if method == "horn":
+        np.maximum(out, 0, out = out)
+        out *= 255
+    else:
+        out += 1
+        out *= 127.5
+
+    return out
+#==============================================================================
@@ -164,6 +164,7 @@ def ReadChannelData(DataDirectory, FilenamePrefix):
 
     elif os.path.isfile(DataDirectory+Filename+".geojson"):
         # read in the dataframe using pandas
+        LSDP.RecordFileRead(DataDirectory+Filename+".geojson")
         ChannelData = gpd.read_file(DataDirectory+Filename+".geojson")
     else:
         print("No file named "+DataDirectory+Filename+".* found")
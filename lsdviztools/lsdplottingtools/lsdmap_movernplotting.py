@@ -3032,7 +3032,7 @@ def PlotMOverNByBasin(DataDirectory, fname_prefix, basin_list = [], size_format=
 # Functions that interface with LSDMapFigure to plot the m/n analysis with
 # spatial data.
 #=============================================================================
-def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigFormat='png', parallel=False):
+def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigFormat='png', parallel=False, n_jobs=1):
     """
     This function makes a shaded relief plot of the DEM with the basins coloured
     by the basin ID.
@@ -3042,6 +3042,8 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
         fname_prefix (str): The prefix for the m/n csv files
         size_format (str): Can be "big" (16 inches wide), "geomorphology" (6.25 inches wide), or "ESURF" (4.92 inches wide) (defualt esurf).
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
+        parallel (bool): If true the basins come from the rasters of each basin written by the parallel chi mapping tool.
+        n_jobs (int): The number of processes used to polygonise those basin rasters (see LSDMapFigure.add_basin_plot).
 
     Returns:
         Shaded relief plot with the basins coloured by basin ID
@@ -3100,7 +3102,7 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
     MF.add_basin_plot(BasinsName,fname_prefix,DataDirectory,
                       use_keys_not_junctions = True, show_colourbar = True,
                       discrete_cmap=True, n_colours=len(basin_keys), colorbarlabel = "Basin ID",
-                      colourmap = cmap, adjust_text = False, parallel=parallel)
+                      colourmap = cmap, adjust_text = False, parallel=parallel, n_jobs=n_jobs)
 
     # add the basin outlines ### need to parallelise
     if not parallel:
@@ -3132,7 +3134,7 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
     ImageName = raster_directory+fname_prefix+'_basin_keys.'+FigFormat
     MF.save_fig(fig_width_inches = fig_width_inches, FigFileName = ImageName, FigFormat=FigFormat, Fig_dpi = 300)
 
-def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_movern=7, d_movern=0.1, movern_method='Chi_full', size_format='ESURF', FigFormat='png',lith = False, parallel=False):
+def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_movern=7, d_movern=0.1, movern_method='Chi_full', size_format='ESURF', FigFormat='png',lith = False, parallel=False, n_jobs=1):
     """
     This function makes a shaded relief plot of the DEM with the basins coloured
     by the best fit m/n
@@ -3146,6 +3148,8 @@ def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_mover
         size_format (str): Can be "big" (16 inches wide), "geomorphology" (6.25 inches wide), or "ESURF" (4.92 inches wide) (defualt esurf).
         FigFormat (str): The format of the figure. Usually 'png' or 'pdf'. If "show" then it calls the matplotlib show() command.
         lith (bool): the lithologic information if available. You need to follow the lithologic documentation to generate the right files. (This last does not exists yet).
+        parallel (bool): If true the basins come from the rasters of each basin written by the parallel chi mapping tool.
+        n_jobs (int): The number of processes used to polygonise those basin rasters (see LSDMapFigure.add_basin_plot).
 
     Returns:
         Shaded relief plot with the basins coloured by best fit m/n
@@ -3290,7 +3294,7 @@ def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_mover
         MF.add_basin_plot(BasinsName,fname_prefix,DataDirectory, value_dict = MOverNDict,
                           use_keys_not_junctions = True, show_colourbar = False,
                           discrete_cmap=True, n_colours=n_colours, colorbarlabel = "$m/n$",
-                          colourmap = mn_cmap, adjust_text = False, cbar_dict=cbar_dict, parallel=parallel)
+                          colourmap = mn_cmap, adjust_text = False, cbar_dict=cbar_dict, parallel=parallel, n_jobs=n_jobs)
 
     # add the basin outlines
     if not parallel:
@@ -87,6 +87,91 @@ def ConvertAllCSVToShapefile(path):
         thisPointData.TranslateToReducedShapefile(FileName)
 
 
+# Transformers from WGS84 to projected coordinates, by EPSG string. They are slow to make
+# and the same few are used over and over.
+_TransformersFromWGS84 = {}
+
+def GetTransformerFromWGS84(EPSG_string):
+    """Gets a pyproj transformer from latitude and longitude (WGS84) to a coordinate system.
+    They are only made once for each EPSG string.
+
+    Args:
+        EPSG_string (str): The EPSG code of the coordinates you want, e.g. EPSG:32630
+
+    Returns:
+        pyproj.Transformer: the transformer. It takes longitude then latitude.
+    """
+    if EPSG_string not in _TransformersFromWGS84:
+        crs_4326 = CRS("EPSG:4326")
+        crs_proj = CRS(EPSG_string)
+        _TransformersFromWGS84[EPSG_string] = Transformer.from_crs(crs_4326, crs_proj,always_xy=True)
+    return _TransformersFromWGS84[EPSG_string]
+
+
+#==============================================================================
+# This bins points onto a grid of pixels
+#==============================================================================
+def AggregatePointsToGrid(easting, northing, values, extent, n_rows, n_cols, reduction = "mean"):
+    """This bins points onto a grid and reduces the values of the points in each pixel to one number.
+    It is used to draw very dense point data (e.g., channel networks with millions of nodes) as one image,
+    which is much faster to draw and much smaller in pdf and svg figures than a marker for every point.
+
+    Args:
+        easting (array): The x coordinates of the points
+        northing (array): The y coordinates of the points
+        values (array): The values of the points. Can be None for reduction = "count"
+        extent (list): [XMin,XMax,YMin,YMax] of the grid
+        n_rows (int): The number of rows in the grid
+        n_cols (int): The number of columns in the grid
+        reduction (str): How the values in a pixel are reduced: "mean", "max", "min", "sum" or "count".
+            nan values are ignored except by count, which counts all the points.
+
+    Returns:
+        np.array: The grid, with the first row at the north (as imshow wants it with this extent). Pixels without points are nan.
+    """
+    if reduction not in ["mean","max","min","sum","count"]:
+        raise Exception("The reduction must be mean, max, min, sum or count, you gave me: "+str(reduction))
+
+    easting = np.asarray(easting, dtype = float)
+    northing = np.asarray(northing, dtype = float)
+    XMin,XMax,YMin,YMax = extent
+
+    cols = np.floor((easting-XMin)/(XMax-XMin)*n_cols)
+    rows = np.floor((YMax-northing)/(YMax-YMin)*n_rows)
+    inside = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+    if reduction != "count":
+        values = np.asarray(values, dtype = float)
+        inside &= ~np.isnan(values)
+        values = values[inside]
+    pixel = rows[inside].astype(np.int64)*n_cols + cols[inside].astype(np.int64)
+    n_pixels = n_rows*n_cols
+
+    grid = np.full(n_pixels, np.nan)
+    counts = np.bincount(pixel, minlength = n_pixels)
+    has_points = counts > 0
+    if reduction == "count":
+        grid[has_points] = counts[has_points]
+    elif reduction == "sum" or reduction == "mean":
+        sums = np.bincount(pixel, weights = values, minlength = n_pixels)
+        if reduction == "sum":
+            grid[has_points] = sums[has_points]
+        else:
+            grid[has_points] = sums[has_points]/counts[has_points]
+    else:
+        # sort by pixel then value: the max is the last of each pixel and the min the first
+        order = np.lexsort((values, pixel))
+        sorted_pixel = pixel[order]
+        sorted_values = values[order]
+        if reduction == "max":
+            pick = np.append(sorted_pixel[1:] != sorted_pixel[:-1], True)
+        else:
+            pick = np.insert(sorted_pixel[1:] != sorted_pixel[:-1], 0, True)
+        if sorted_pixel.size > 0:
+            grid[sorted_pixel[pick]] = sorted_values[pick]
+
+    return grid.reshape(n_rows, n_cols)
+
+
 class LSDMap_PointData(object):
 
     # The constructor: it needs a filename to read
@@ -109,6 +194,9 @@ class LSDMap_PointData(object):
 
         self.PANDEX = PANDEX
 
+        # The projected coordinates of the points, by EPSG string, along with the latitude and
+        # longitude they came from so we can tell if the data have changed since.
+        self._ProjectedCoordinates = {}
 
         ######################### THIS PART OF THE CODE IS ONLY USING PANDAS #########################
         if(self.PANDEX == True):
@@ -273,17 +361,24 @@ class LSDMap_PointData(object):
 
         print(EPSG_string)
         # The lat long are in epsg 4326 which is WGS84
-        crs_4326 = CRS("EPSG:4326")
-        crs_proj = CRS(EPSG_string)
-
-        transformer = Transformer.from_crs(crs_4326, crs_proj,always_xy=True)
+        transformer = GetTransformerFromWGS84(EPSG_string)
 
         easting =[]
         northing = []
         if(self.PANDEX == True):
-            Lon_array = np.asarray(self.Longitude)
-            Lat_array = np.asarray(self.Latitude)
-            easting,northing = transformer.transform(Lon_array,Lat_array)
+            # The coordinates are only projected once for each EPSG, unless the data are thinned
+            # (and thinning keeps the projected coordinates of the points that are left)
+            projected = self._ProjectedCoordinates.get(EPSG_string)
+            if projected is None or projected[0] is not self.Latitude or projected[1] is not self.Longitude:
+                Lon_array = np.asarray(self.Longitude)
+                Lat_array = np.asarray(self.Latitude)
+                easting,northing = transformer.transform(Lon_array,Lat_array)
+                projected = (self.Latitude, self.Longitude, np.asarray(easting), np.asarray(northing))
+                self._ProjectedCoordinates[EPSG_string] = projected
+            else:
+                print("I have already projected these points")
+            easting = projected[2].copy()
+            northing = projected[3].copy()
         else:
             for idx, Lon in enumerate(self.Longitude):
                 Lat = self.Latitude[idx]
@@ -315,26 +410,15 @@ class LSDMap_PointData(object):
         print("WARNING you must have a recent (>=6) version of proj and pyproj (>=2.4) for this to work ")
 
         # The lat long are in epsg 4326 which is WGS84
-        crs_4326 = CRS("EPSG:4326")
-        crs_proj = CRS(EPSG_string)
-
-        transformer = Transformer.from_crs(crs_4326, crs_proj,always_xy=True)
+        transformer = GetTransformerFromWGS84(EPSG_string)
 
 
         this_Lat = self.QueryData(Latitude_string)
         this_Lon = self.QueryData(Longitude_string)
 
+        easting,northing = transformer.transform(np.asarray(this_Lon, dtype = float),np.asarray(this_Lat, dtype = float))
 
-        easting =[]
-        northing = []
-
-        for idx, Lon in enumerate(this_Lon):
-            Lat = this_Lat[idx]
-            ea,no = transformer.transform(Lon,Lat)
-            easting.append(ea)
-            northing.append(no)
-
-        return easting,northing
+        return np.atleast_1d(easting).tolist(),np.atleast_1d(northing).tolist()
 
 
 
@@ -343,6 +427,27 @@ class LSDMap_PointData(object):
 ## Data manipulation
 ##==============================================================================
 ##==============================================================================
+    def _KeepRows(self, row_mask):
+        """Keeps the rows of the data where row_mask is true. Only for PANDEX mode.
+        The projected coordinates are thinned as well so they don't need to be worked out again.
+
+        Args:
+            row_mask (array of bool): True for the rows to keep
+        """
+        row_mask = np.asarray(row_mask, dtype = bool)
+        old_Latitude = self.Latitude
+        old_Longitude = self.Longitude
+
+        self.PointData = self.PointData[row_mask]
+        self.Longitude = self.PointData["longitude"]
+        self.Latitude = self.PointData["latitude"]
+
+        projected = {}
+        for EPSG_string, coordinates in self._ProjectedCoordinates.items():
+            if coordinates[0] is old_Latitude and coordinates[1] is old_Longitude:
+                projected[EPSG_string] = (self.Latitude, self.Longitude, coordinates[2][row_mask], coordinates[3][row_mask])
+        self._ProjectedCoordinates = projected
+
     def ThinData(self,data_name,Threshold_value):
         """This removes data from a point function that is below a threshold value
 
@@ -366,9 +471,7 @@ class LSDMap_PointData(object):
                 this_data = self.PointData[data_name]
 
         if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name]<Threshold_value]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+            self._KeepRows(self.PointData[data_name]<Threshold_value)
         else:
             this_data = [float(x) for x in this_data]
 
@@ -429,9 +532,7 @@ class LSDMap_PointData(object):
             if(self.PANDEX == False):
                 this_data = self.PointData[data_name]
         if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name].isin(data_for_selection_list)]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+            self._KeepRows(self.PointData[data_name].isin(data_for_selection_list))
         else:
             this_data = [int(x) for x in this_data]
             #print("The original data I need to thin is: ")
@@ -506,22 +607,20 @@ class LSDMap_PointData(object):
             if(operator == "=="):
                 if(isinstance(value,list) == False):
                     value = [value]
-                self.PointData = self.PointData[self.PointData[data_name].isin(value)]
+                self._KeepRows(self.PointData[data_name].isin(value))
             else:
                 if(operator ==">" and isinstance(value,list)==False):
-                    self.PointData = self.PointData[self.PointData[data_name]>value]
+                    self._KeepRows(self.PointData[data_name]>value)
                 else:
                     if(operator =="<" and isinstance(value,list)==False):
-                        self.PointData = self.PointData[self.PointData[data_name]<value]
+                        self._KeepRows(self.PointData[data_name]<value)
                     else:
                         if(operator == "!="):
                             if(isinstance(value,list) == False):
                                 value = [value]
-                            self.PointData = self.PointData[~self.PointData[data_name].isin(value)]
+                            self._KeepRows(~self.PointData[data_name].isin(value))
                         else:
                             print("Something wrong happened, are you trying to select your data using < or > with a list rather than a single value??? in this case I cannot do it yet I am so sorry.")
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
 
 
     def ThinDataFromKey(self,data_name,data_key):
@@ -546,9 +645,7 @@ class LSDMap_PointData(object):
         else:
             this_data = self.PointData[data_name]
 
-        self.PointData = self.PointData[self.PointData[data_name].isin(data_key)]
-        self.Longitude = self.PointData["longitude"]
-        self.Latitude = self.PointData["latitude"]
+        self._KeepRows(self.PointData[data_name].isin(data_key))
 
 
 
@@ -68,7 +68,7 @@ def field_sites(DataDirectory, N_HSFiles, NRows, NCols, n_target_ticks):
         # change the value of N_HSFiles
             print("The hillshade file name is: ", HSFiles[i])
 
-            hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFiles[i])
+            hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFiles[i], read_only = True)
             hillshade_raster = np.ma.masked_where(hillshade_raster == -9999, hillshade_raster)
 
             # now get the extent
@@ -170,8 +170,8 @@ def multiple_flood_maps(DataDirectory):
         HSFile = DataDirectory+split_fname[1]+'_'+split_fname[2]+"_HS.bil"
         print(HSFile)
 
-        hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFile)
-        FP_raster = LSDMap_IO.ReadRasterArrayBlocks(FPFiles[i])
+        hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFile, read_only = True)
+        FP_raster = LSDMap_IO.ReadRasterArrayBlocks(FPFiles[i], read_only = True)
         FP_raster = np.ma.masked_where(FP_raster <= 0, FP_raster)
 
         # now get the extent
@@ -249,7 +249,7 @@ def flood_maps_with_shapefile(DataDirectory):
         split_fname = FPFiles[i].split('_FP')
         print(split_fname[0])
 
-        hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFiles[i])
+        hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFiles[i], read_only = True)
 
         # now get the extent
         extent_raster = LSDMap_IO.GetRasterExtent(HSFiles[i])
@@ -316,7 +316,7 @@ def findmaxval_multirasters(FileList):
 
     for i in range (len(FileList)):
 
-        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i])
+        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i], read_only = True)
         this_max_val = np.nanmax(raster_as_array)
 
         if this_max_val > overall_max_val:
@@ -334,7 +334,7 @@ def findminval_multirasters(FileList):
 
     for i in range (len(FileList)):
 
-        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i])
+        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i], read_only = True)
         this_min_val = np.nanmin(raster_as_array)
 
         if this_min_val > overall_min_val:
@@ -22,11 +22,190 @@ import rasterio
 from rasterio import features
 from rasterio.features import shapes
 import csv
+from collections import OrderedDict
+import hashlib
+import threading
 
 #=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 # BASIN FUNCTIONS
 # These functions do various operations on basin polygons
 #=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+class BasinPolygons(object):
+    """
+    The polygons of the basins in a basin raster, with the area, centroid and representative
+    point (guaranteed to be within the polygon) of each one. These are all worked out once,
+    when it is made. Use GetBasinPolygons rather than making these directly.
+
+    The keys of all the dicts are the raster values, which are usually junction indices.
+
+    Args:
+        polygons (dict): key is the raster value, value is the shapely polygon of the basin
+    """
+    def __init__(self, polygons):
+        self.polygons = dict(polygons)
+        self.areas = {}
+        self.centroids = {}
+        self.representative_points = {}
+        for basin_key, basin in self.polygons.items():
+            self.areas[basin_key] = basin.area
+            self.centroids[basin_key] = Point(basin.centroid)
+            self.representative_points[basin_key] = Point(basin.representative_point())
+
+    def to_geodataframe(self, raster_hash = "", crs = None, raster_stat = ""):
+        """
+        Puts the basins in a GeoDataFrame: one row per basin with the ID (the raster value),
+        the area, the centroid, the representative point and the hash, sizes and modification
+        times (see GetRasterFileStat) of the raster they came from.
+        """
+        basin_keys = list(self.polygons.keys())
+        return gpd.GeoDataFrame({"ID": basin_keys,
+                                 "area": [self.areas[k] for k in basin_keys],
+                                 "centroid_x": [self.centroids[k].x for k in basin_keys],
+                                 "centroid_y": [self.centroids[k].y for k in basin_keys],
+                                 "point_x": [self.representative_points[k].x for k in basin_keys],
+                                 "point_y": [self.representative_points[k].y for k in basin_keys],
+                                 "raster_hash": [raster_hash]*len(basin_keys),
+                                 "raster_stat": [raster_stat]*len(basin_keys)},
+                                geometry = [self.polygons[k] for k in basin_keys], crs = crs)
+
+    @classmethod
+    def from_geodataframe(cls, gdf):
+        """
+        Makes the basins from a GeoDataFrame written by to_geodataframe, without working anything out again.
+        """
+        these_basins = cls.__new__(cls)
+        basin_keys = [float(k) for k in gdf["ID"]]
+        these_basins.polygons = dict(zip(basin_keys, gdf.geometry))
+        these_basins.areas = dict(zip(basin_keys, [float(a) for a in gdf["area"]]))
+        these_basins.centroids = dict(zip(basin_keys, [Point(x,y) for x,y in zip(gdf["centroid_x"],gdf["centroid_y"])]))
+        these_basins.representative_points = dict(zip(basin_keys, [Point(x,y) for x,y in zip(gdf["point_x"],gdf["point_y"])]))
+        return these_basins
+
+
+# The basins of each raster, kept for the life of the process and keyed by LSDMap_IO.GetRasterFileKey
+_BasinPolygonCache = OrderedDict()
+_BasinPolygonLock = threading.Lock()
+
+def GetRasterContentHash(FileName):
+    """
+    Gets the sha1 of the contents of a raster and of its ENVI header, if it has one.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+
+    Returns:
+        str: the hash
+    """
+    sha1 = hashlib.sha1()
+    header_file = os.path.splitext(FileName)[0]+".hdr"
+    for this_file in [FileName, header_file]:
+        if this_file == FileName or (header_file != FileName and exists(header_file)):
+            with open(this_file, "rb") as f:
+                for chunk in iter(lambda: f.read(2**22), b""):
+                    sha1.update(chunk)
+    return sha1.hexdigest()
+
+def GetRasterFileStat(FileName):
+    """
+    Gets the size and modification time of a raster and of its ENVI header, if it has one.
+    If these haven't changed the raster is taken to be the same, without hashing it.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+
+    Returns:
+        str: the sizes and modification times
+    """
+    header_file = os.path.splitext(FileName)[0]+".hdr"
+    stats = []
+    for this_file in [FileName, header_file]:
+        if this_file == FileName or (header_file != FileName and exists(header_file)):
+            stat = os.stat(this_file)
+            stats.append([stat.st_size, stat.st_mtime_ns])
+    return repr(stats)
+
+def GetBasinPolygons(DataDirectory, basins_fname, use_sidecar = False):
+    """
+    This gets the basin polygons of a basin raster. The raster is only polygonised once: the
+    polygons are kept for the life of the process.
+
+    If use_sidecar is true they are also saved in a GeoPackage next to the raster (the raster
+    prefix followed by _BasinPolygons.gpkg), so the next run just reads them back if the raster
+    is the same. The raster is the same if its size and modification time haven't changed; if
+    they have, it is hashed and compared with the hash saved with the basins.
+
+    Args:
+        DataDirectory (str): the data directory with the basin raster
+        basins_fname (str): the basin raster
+        use_sidecar (bool): If true, the basins are read from and saved to the GeoPackage. False by default, so
+            nothing is written next to the raster unless you ask for it.
+
+    Returns:
+        BasinPolygons: the polygons, areas, centroids and representative points of the basins
+    """
+    raster_file = DataDirectory+basins_fname
+    if exists(raster_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    LSDMap_IO.RecordFileRead(raster_file)
+    key = LSDMap_IO.GetRasterFileKey(raster_file)
+    with _BasinPolygonLock:
+        if key in _BasinPolygonCache:
+            _BasinPolygonCache.move_to_end(key)
+            return _BasinPolygonCache[key]
+
+    this_fname = basins_fname.split('.')
+    OutputShapefile = this_fname[0]+'.shp'
+    sidecar_file = DataDirectory+this_fname[0]+"_BasinPolygons.gpkg"
+
+    these_basins = None
+    raster_hash = None
+    if use_sidecar:
+        raster_stat = GetRasterFileStat(raster_file)
+        if exists(sidecar_file):
+            try:
+                gdf = gpd.read_file(sidecar_file, layer = "basins")
+                is_same_raster = False
+                if len(gdf) > 0:
+                    if "raster_stat" in gdf.columns and gdf["raster_stat"].iloc[0] == raster_stat:
+                        is_same_raster = True
+                    else:
+                        # the raster has been touched or copied, but it might not have changed
+                        raster_hash = GetRasterContentHash(raster_file)
+                        is_same_raster = (gdf["raster_hash"].iloc[0] == raster_hash)
+                if is_same_raster:
+                    print("I've already polygonised "+basins_fname+", so I'm reading the basins from "+sidecar_file)
+                    these_basins = BasinPolygons.from_geodataframe(gdf)
+                    # the shapefile is written when the raster is polygonised, so make sure it is still there
+                    if exists(DataDirectory+OutputShapefile) is False:
+                        NDV = LSDMap_IO.getNoDataValue(raster_file)
+                        gdf.loc[gdf["ID"] != NDV, ["ID", "geometry"]].to_file(DataDirectory+OutputShapefile)
+                        LSDMap_IO.RecordFileWrite(DataDirectory+OutputShapefile)
+            except Exception as e:
+                print("I couldn't read the basins from "+sidecar_file+" ("+str(e)+"), so I'll polygonise the raster.")
+                these_basins = None
+
+    if these_basins is None:
+        print(basins_fname)
+        these_basins = BasinPolygons(LSDMap_IO.PolygoniseRaster(DataDirectory, basins_fname, OutputShapefile))
+        if use_sidecar:
+            try:
+                with rasterio.open(raster_file) as src:
+                    crs = src.crs.to_wkt() if src.crs is not None else None
+                if raster_hash is None:
+                    raster_hash = GetRasterContentHash(raster_file)
+                these_basins.to_geodataframe(raster_hash, crs, raster_stat).to_file(sidecar_file, layer = "basins", driver = "GPKG")
+                LSDMap_IO.RecordFileWrite(sidecar_file)
+            except Exception as e:
+                print("I couldn't save the basins to "+sidecar_file+": "+str(e))
+
+    with _BasinPolygonLock:
+        _BasinPolygonCache[key] = these_basins
+        # each of these can hold a lot of polygons
+        while len(_BasinPolygonCache) > 32:
+            _BasinPolygonCache.popitem(last = False)
+    return these_basins
+
 def GetBasinOutlines(DataDirectory, basins_fname):
     """
     This function takes in the raster of basins and gets a dict of basin polygons,
@@ -36,6 +215,8 @@ def GetBasinOutlines(DataDirectory, basins_fname):
         this function will use the raster values as keys and in general
         the basin rasters are output based on junction indices rather than keys
 
+    The raster is only polygonised the first time: see GetBasinPolygons.
+
     Args:
         DataDirectory (str): the data directory with the basin raster
         basins_fname (str): the basin raster
@@ -45,16 +226,31 @@ def GetBasinOutlines(DataDirectory, basins_fname):
 
     Author: FJC
     """
-    # read in the basins raster
-    this_fname = basins_fname.split('.')
-    print(basins_fname)
-    OutputShapefile = this_fname[0]+'.shp'
-
-    # polygonise the raster
-    BasinDict = LSDMap_IO.PolygoniseRaster(DataDirectory, basins_fname, OutputShapefile)
+    # this is a copy, so the callers can drop basins from it
+    BasinDict = dict(GetBasinPolygons(DataDirectory, basins_fname).polygons)
     return BasinDict
 
-def GetMultipleBasinOutlines(DataDirectory):
+def _GetSingleBasinOutline(DataDirectory, outlet_jn):
+  """
+    Polygonises the basin raster of one outlet junction from the parallel chi mapping tool
+    and keys its polygon by the outlet junction. This is what the worker processes of
+    GetMultipleBasinOutlines run, so it has to be a module level function.
+
+    Returns:
+        dict where the key is the outlet junction and the value is a shapely polygon of the basin
+    """
+  this_fname = "basin"+str(outlet_jn)+"_AllBasins.bil"
+  TempBasins = GetBasinOutlines(DataDirectory,this_fname)
+
+  if len(TempBasins) > 1:
+    print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
+  # every basin in the file is keyed by the outlet, so the last one wins
+  BasinDict = {}
+  for temp_outlet in TempBasins:
+    BasinDict[int(outlet_jn)] = TempBasins[temp_outlet]
+  return BasinDict
+
+def GetMultipleBasinOutlines(DataDirectory, n_jobs = 1):
   """
     This function takes in multiple rasters of basins and gets a dict of basin polygons,
     where the key is the basin key derived from the file name and the value is a shapely polygon of the basin.
@@ -63,30 +259,50 @@ def GetMultipleBasinOutlines(DataDirectory):
         this function will use the raster values as keys and in general
         the basin rasters are output based on junction indices rather than keys
 
+    The basin rasters can be polygonised in a pool of processes.
+
     Args:
         DataDirectory (str): the data directory with the basin raster
+        n_jobs (int): The number of processes. 1 (the default) does them one after another in this process.
+            None uses one per cpu; don't use that if you are already running in a pool of figure jobs.
 
     Returns:
         list of shapely polygons with the basins
 
     Author: MDH
     """
+  from concurrent.futures import ProcessPoolExecutor, as_completed
+
   # get a list of basins and declare the dictionary to populate
   basin_dict = Helper.MapBasinsToKeys(DataDirectory)
+  outlet_junctions = list(basin_dict.keys())
+  n_basins = len(outlet_junctions)
+  if n_jobs is None:
+    n_jobs = os.cpu_count() or 1
+  n_jobs = max(1, min(n_jobs, n_basins))
+
+  # report progress about every 5 percent
+  report_every = max(1, n_basins//20)
+  print("I am polygonising "+str(n_basins)+" basin rasters on "+str(n_jobs)+" processes.")
+
+  BasinsByOutlet = {}
+  if n_jobs == 1:
+    for n,outlet_jn in enumerate(outlet_junctions):
+      BasinsByOutlet[outlet_jn] = _GetSingleBasinOutline(DataDirectory, outlet_jn)
+      if (n+1) % report_every == 0 or n+1 == n_basins:
+        print("Polygonised "+str(n+1)+" of "+str(n_basins)+" basin rasters")
+  else:
+    with ProcessPoolExecutor(max_workers = n_jobs) as executor:
+      futures = {executor.submit(_GetSingleBasinOutline, DataDirectory, outlet_jn): outlet_jn for outlet_jn in outlet_junctions}
+      for n,future in enumerate(as_completed(futures)):
+        BasinsByOutlet[futures[future]] = future.result()
+        if (n+1) % report_every == 0 or n+1 == n_basins:
+          print("Polygonised "+str(n+1)+" of "+str(n_basins)+" basin rasters")
+
+  # merge them in the order of the basin keys so the result doesn't depend on which process finished first
   BasinsDict = {}
-
-  #loop across the basins
-  for outlet_jn, basin_key in basin_dict.iteritems():
-    this_fname = "basin"+str(outlet_jn)+"_AllBasins.bil"
-
-    TempBasins = GetBasinOutlines(DataDirectory,this_fname)
-
-    for temp_outlet, temp_basin_key in TempBasins.iteritems():
-      if len(TempBasins) > 1:
-        print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
-      TempBasins[int(outlet_jn)] = TempBasins.pop(temp_outlet)
-
-    BasinsDict.update(TempBasins)
+  for outlet_jn in outlet_junctions:
+    BasinsDict.update(BasinsByOutlet[outlet_jn])
 
   return BasinsDict
 
@@ -108,13 +324,8 @@ def GetBasinCentroids(DataDirectory, basins_fname):
 
     Author: FJC
     """
-    # get the basin polygons
-    BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-    # get the centroids
-    CentroidDict = {}
-    for basin_key, basin in BasinDict.iteritems():
-        CentroidDict[basin_key] = Point(basin.centroid)
+    # the centroids are worked out when the basins are polygonised
+    CentroidDict = dict(GetBasinPolygons(DataDirectory, basins_fname).centroids)
 
     return CentroidDict
 
@@ -137,13 +348,8 @@ def GetPointWithinBasins(DataDirectory,basins_fname):
 
     Author: FJC
     """
-    # get the basin polygons
-    BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-    # get the centroids
-    PointDict = {}
-    for basin_key, basin in BasinDict.items():
-        PointDict[basin_key] = Point(basin.representative_point())
+    # the representative points are worked out when the basins are polygonised
+    PointDict = dict(GetBasinPolygons(DataDirectory, basins_fname).representative_points)
 
     return PointDict
 
@@ -173,7 +379,7 @@ def GetPointsWithinMultipleBasins(DataDirectory,basins_fname):
 
   # get the centroids
   PointDict = {}
-  for basin_key, basin in BasinDict.iteritems():
+  for basin_key, basin in BasinDict.items():
     PointDict[basin_key] = Point(basin.representative_point())
 
   print("POINT DICT IS")
@@ -207,11 +413,11 @@ def GetPointWithinBasinsBuffered(DataDirectory,basins_fname, basin_list = [], bu
     Author: FJC
     """
     # get the basin polygons
-    BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
+    BasinDict = GetBasinPolygons(DataDirectory, basins_fname).polygons
 
     # buffer and get the centre of the buffered polygons
     PointDict = {}
-    for basin_key, basin in BasinDict.iteritems():
+    for basin_key, basin in BasinDict.items():
         # get the x and y lengths of the basin and append to list
         print("This basin key is: "+str(basin_key))
         lengths = []
@@ -235,6 +441,7 @@ def GetPointWithinBasinsBuffered(DataDirectory,basins_fname, basin_list = [], bu
 def readFile(filename):
     print("Hey buddy, Reading the file: "+filename)
 
+    LSDMap_IO.RecordFileRead(filename)
     filehandle = gdal.Open(filename, GA_ReadOnly )
     if filehandle == None:
         raise Exception("Unable to read the data file")
@@ -262,6 +469,8 @@ def writeFile(filename,geotransform,geoprojection,data):
     dst_ds.GetRasterBand(1).SetNoDataValue( noDataValue )
     dst_ds.SetGeoTransform(geotransform)
     dst_ds.SetProjection(geoprojection)
+    dst_ds = None
+    LSDMap_IO.RecordFileWrite(filename)
     return 1
 
 
@@ -280,6 +489,7 @@ def Rasterize_BGS_geologic_maps(shapefile_name):
     # now get the the fields from the shapefile
     daShapefile = shapefile_name
 
+    LSDMap_IO.RecordFileRead(daShapefile)
     dataSource = ogr.Open(daShapefile)
     daLayer = dataSource.GetLayer(0)
 
@@ -348,12 +558,14 @@ def rasterize_to_binary(shapefilename,template_raster_filename,output_raster_fil
     """
 
     # Open the raster and get its metadata
+    LSDMap_IO.RecordFileRead(template_raster_filename)
     rst = rasterio.open(template_raster_filename)
     meta = rst.meta.copy()
     meta.update(nodata=-9999)
     print(meta)
 
     # Now get the shapefile and its data columns
+    LSDMap_IO.RecordFileRead(shapefilename)
     channel = gpd.read_file(shapefilename)
     columns = channel.columns
 
@@ -386,6 +598,7 @@ def Rasterize_geologic_maps_pythonic(shapefile_name, raster_resolution = 400, ge
     # now get the the fields from the shapefile
     daShapefile = shapefile_name
 
+    LSDMap_IO.RecordFileRead(daShapefile)
     dataSource = ogr.Open(daShapefile)
     daLayer = dataSource.GetLayer(0)
 
@@ -420,6 +633,7 @@ def Rasterize_geologic_maps_pythonic(shapefile_name, raster_resolution = 400, ge
 
     # Rasterize
     gdal.RasterizeLayer(rasterDS, [1], daLayer, options = ["ATTRIBUTE=GEOL_CODE"])
+    LSDMap_IO.RecordFileWrite(outraster)
 
     # Make a key for the bedrock
     geol_dict = dict()
@@ -525,7 +739,8 @@ def geologic_maps_modify_shapefile(shapefile_name, geol_field = "xx"):
     print(geol_dict)
 
     print("All done")
-
+    dataSource = None
+    LSDMap_IO.RecordFileWrite(new_shapefile_name)
 
     return new_shapefile_name, geol_dict
 
@@ -543,6 +758,7 @@ def Copy_Shapefile(shapefile_name,new_shapefile_name):
     print("The shortname is: "+shapefileshortname)
 
     # read in the data
+    LSDMap_IO.RecordFileRead(shapefile_name)
     src = ogr.Open(shapefile_name)
     daLayer = src.GetLayer(0)
 
@@ -599,6 +815,7 @@ def Copy_Shapefile(shapefile_name,new_shapefile_name):
 
         out_lyr.CreateFeature(outFeature)
         #out_ds.Destroy()
+    LSDMap_IO.RecordFileWrite(new_shapefile_name)
 
 
 def rasterize_shapefile(path_to_shp, res = 30, field = ""):
@@ -1,11 +1,13 @@
 from distutils.core import setup
 from distutils.extension import Extension
 from Cython.Build import cythonize
+import numpy as np
 
 ext_modules = [
     Extension(
         "fast_hillshade",
         ["fast_hillshade.pyx"],
+        include_dirs=[np.get_include()],
         extra_compile_args=['-fopenmp'],
         extra_link_args=['-fopenmp'],
     )
@@ -16,3 +18,4 @@ setup(
     ext_modules=cythonize(ext_modules),
 )
 # build with python setup_cython.py build_ext --inplace
+# The main setup.py also builds this (as lsdviztools.lsdplottingtools.fast_hillshade) if Cython is installed
@@ -6,28 +6,24 @@ Created on Sat Feb 11 11:40:41 2017
 @author: dav
 """
 
-from lsdviztools.lsdplottingtools import lsdmap_gdalio as lsdio
+from lsdviztools.lsdplottingtools import lsdmap_hillshade as LSDMap_HS
 
 import numpy as np
-import scipy as sp
 
 
-Zenith = 45
-Azimuth = 315
-ZFactor = 1
+def Hillshade_Smooth(RasterData, altitude, azimuth, z_factor, resolution = 1.0, multidirectional = False):
+    """Plots a Hillshade a la LSDRaster
 
-Directory = "/mnt/SCRATCH/Analyses/HydrogeomorphPaper/erode_diff/test_raster_diff_func/"
-BackgroundRasterName = "BoscastleElevations0.asc"
+    Args:
+        RasterData (numpy.array): The elevation array, e.g. from lsdmap_gdalio.ReadRasterArrayBlocks
+        altitude (float): Angle altitude of sun
+        azimuth (float): Azimuth of sunlight
+        z_factor (float): vertical exaggeration
+        resolution (float): The pixel size
+        multidirectional (bool): If True blend the hillshades from several azimuths
 
-File = Directory + BackgroundRasterName
-
-RasterData = lsdio.ReadRasterArrayBlocks(File)
-
-def Hillshade_Smooth(RasterData, altitude, azimuth, z_factor):
-    """Plots a Hillshade a la LSDRaster"""
-    
-    zenith_rad = sp.deg2rad(altitude)
-    azimuth_rad = sp.deg2rad(azimuth)
-    
-    
-    
\ No newline at end of file
+    Returns:
+        HSArray (numpy.array): The hillshade array (the LSDRaster kernel, see lsdmap_hillshade.HillshadeArray)
+    """
+    return LSDMap_HS.HillshadeArray(RasterData, resolution, azimuth = azimuth, angle_altitude = altitude, z_factor = z_factor,
+                                    method = "horn", multidirectional = multidirectional, dtype = np.float64)
@@ -17,6 +17,7 @@ import os
 from decimal import Decimal
 from lsdviztools.lsdplottingtools import lsdmap_movernplotting as MN
 from lsdviztools.lsdplottingtools import lsdmap_saplotting as SA
+import lsdviztools.lsdmapwrappers as LSDMW
 from lsdviztools.lsdmapfigure import plottinghelpers as Helper
 
 #=============================================================================
@@ -211,8 +212,14 @@ def main(args=None):
     parser.add_argument("-keep_pngs", "--keep_pngs", type=bool, default=False, help="If this is true I will delete the png files when I animate the figures. Must be used with the -animate flag set to True.")
     parser.add_argument("-parallel", "--parallel", type=bool, default=False, help="If this is true I'll assume you ran the code in parallel and append all your CSVs together before plotting.")
 
+    parser.add_argument("-jobs", "--jobs", type=int, default=1, help="The number of processes used to make the figures. Independent figures are made at the same time. Default = 1 (one figure after another).")
+    parser.add_argument("-incremental", "--incremental", action="store_true", help="If you pass this, I'll only make the figures whose options or input files have changed since the last time. What each figure used is recorded in figure_manifest.json in the base directory.")
+
     args = parser.parse_args()
 
+    # The figures are collected here and made at the end, possibly in parallel
+    figure_jobs = []
+
     if not args.fname_prefix:
         if not args.parallel:
             print("WARNING! You haven't supplied your DEM name. Please specify this with the flag '-fname'")
@@ -303,149 +310,158 @@ def main(args=None):
         simple_format = args.FigFormat
 
 
+    # With -parallel each raster figure polygonises every basin raster. The figures are made
+    # at the same time, so they share the processes rather than each starting args.jobs more.
+    # This is the same for every option, so the raster figures they ask for are still made once.
+    if Using_disorder_metric_only:
+        n_raster_figures = 3
+    else:
+        n_raster_figures = 5
+    basin_jobs = max(1, args.jobs // n_raster_figures)
+
     # make the plots depending on your choices
     if args.plot_rasters:
-        MN.MakeRasterPlotsBasins(this_dir, args.fname_prefix, args.size_format, args.FigFormat,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsBasins, this_dir, args.fname_prefix, args.size_format, args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
         if not Using_disorder_metric_only:
-            MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="Chi_full", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
-            MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="Chi_points", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
-        MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="SA", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
-        MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern,
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern,
                                  d_movern, movern_method="Chi_disorder",
-                                 size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel)
+                                 size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
 
     if args.plot_basic_chi:
-        MN.MakePlotsWithMLEStats(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.MakePlotsWithMLEStats, this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel))
 
     if args.plot_chi_profiles:
         if Using_disorder_metric_only:
-            MN.MakeChiPlotsChi(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsChi, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                            start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,
-                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel)
+                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel))
         else:
-            MN.MakeChiPlotsMLE(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsMLE, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                            start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,
-                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel)
+                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel))
 
     if args.plot_chi_by_K:
-        MN.MakeChiPlotsColouredByK(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs, parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsColouredByK, this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs, parallel=args.parallel))
     if args.plot_chi_by_lith:
-        MN.MakeChiPlotsColouredByLith(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsColouredByLith, this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat=simple_format, animate=args.animate, keep_pngs=args.keep_pngs,parallel=args.parallel))
     if args.plot_outliers:
-        MN.PlotProfilesRemovingOutliers(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.PlotProfilesRemovingOutliers, this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel))
     if args.plot_MLE_movern:
-        MN.PlotMLEWithMOverN(this_dir, args.fname_prefix,basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat =simple_format,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.PlotMLEWithMOverN, this_dir, args.fname_prefix,basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, size_format=args.size_format, FigFormat =simple_format,parallel=args.parallel))
     if args.plot_SA_data:
-        SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = simple_format,size_format=args.size_format,
-                        show_raw = args.show_SA_raw, show_segments = args.show_SA_segments,basin_keys = these_basin_keys, parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(SA.SAPlotDriver, this_dir, args.fname_prefix, FigFormat = simple_format,size_format=args.size_format,
+                        show_raw = args.show_SA_raw, show_segments = args.show_SA_segments,basin_keys = these_basin_keys, parallel=args.parallel))
     if args.test_SA_regression:
         #SA.TestSARegression(this_dir, args.fname_prefix)
-        SA.LinearRegressionRawDataByChannel(this_dir,args.fname_prefix, basin_list=these_basin_keys, parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(SA.LinearRegressionRawDataByChannel, this_dir,args.fname_prefix, basin_list=these_basin_keys, parallel=args.parallel))
         #SA.LinearRegressionSegmentedData(this_dir, args.fname_prefix, basin_list=these_basin_keys)
     if args.plot_MCMC:
-        MN.plot_MCMC_analysis(this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat= simple_format, size_format=args.size_format,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.plot_MCMC_analysis, this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat= simple_format, size_format=args.size_format,parallel=args.parallel))
     if args.point_uncertainty:
-        MN.PlotMCPointsUncertainty(this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat=simple_format, size_format=args.size_format,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.PlotMCPointsUncertainty, this_dir, args.fname_prefix,basin_list=these_basin_keys, FigFormat=simple_format, size_format=args.size_format,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,parallel=args.parallel))
+    # All of the plots that read the summary csv go in one sequence, after the job that writes it
+    # (if any of the options need it written), so no job reads the csv while another is writing it.
+    summary_jobs = []
+    compute_summary = False
+
     if args.plot_histogram:
-        MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=simple_format, size_format=args.size_format, show_legend=args.show_legend,Chi_disorder=True)
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryHistogram, this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=simple_format, size_format=args.size_format, show_legend=args.show_legend,Chi_disorder=True))
 
     if args.plot_summary:
-        # This function creates a csv that has the concavity statistics in it
-        MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys,
-                                            start_movern=start_movern, d_movern=d_movern,
-                                            n_movern=n_movern, parallel=args.parallel, Chi_disorder=True)
+        # This needs the csv that has the concavity statistics in it
+        compute_summary = True
 
-        MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryPlot, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                                  start_movern=start_movern, d_movern=d_movern,
-                                 n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True)
+                                 n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True))
 
         # This only prints the summary plots for bootstrap and disorder metrics
-        MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryPlot, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                                  start_movern=start_movern, d_movern=d_movern,
                                  n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format,
                                  show_legend=args.show_legend,parallel=args.parallel,
                                  Chi_all = False, SA_raw = False, SA_segmented = False,
-                                 SA_channels = False, Chi_bootstrap = True, Chi_disorder=True)
+                                 SA_channels = False, Chi_bootstrap = True, Chi_disorder=True))
 
-        MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryHistogram, this_dir, args.fname_prefix,basin_list=these_basin_keys,
                                       start_movern=start_movern, d_movern=d_movern,
-                                      n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True)
+                                      n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True))
+
     if args.plot_disorder:
-        MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="Chi_disorder", size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel)
+        compute_summary = True
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern, movern_method="Chi_disorder", size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
-        # This function creates a csv that has the concavity statistics in it
-        MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys, start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, parallel=args.parallel, Chi_disorder=True)
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryPlot, this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True))
 
-        MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True)
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryHistogram, this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True))
 
-        MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,start_movern=start_movern, d_movern=d_movern, n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True)
 
     if args.all_movern_estimates:
+        compute_summary = True
         print("I am going to print out loads and loads of figures for you.")
         # plot the rasters
-        MN.MakeRasterPlotsBasins(this_dir, args.fname_prefix, args.size_format, args.FigFormat,parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsBasins, this_dir, args.fname_prefix, args.size_format, args.FigFormat,parallel=args.parallel))
 
         if not Using_disorder_metric_only:
-            MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="Chi_full", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
-            MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="Chi_points", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
-        MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern, d_movern,
                                  movern_method="SA", size_format=args.size_format,
-                                 FigFormat=args.FigFormat,parallel=args.parallel)
-        MN.MakeRasterPlotsMOverN(this_dir, args.fname_prefix, start_movern, n_movern,
+                                 FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
+        figure_jobs.append(LSDMW.FigureJob(MN.MakeRasterPlotsMOverN, this_dir, args.fname_prefix, start_movern, n_movern,
                                  d_movern, movern_method="Chi_disorder",
-                                 size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel)
+                                 size_format=args.size_format, FigFormat=args.FigFormat,parallel=args.parallel, n_jobs=basin_jobs))
 
         # make the chi plots
         if Using_disorder_metric_only:
-            MN.MakeChiPlotsChi(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsChi, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                            start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,
-                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel)
+                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel))
         else:
-            MN.MakeChiPlotsMLE(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+            figure_jobs.append(LSDMW.FigureJob(MN.MakeChiPlotsMLE, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                            start_movern=start_movern, d_movern=d_movern, n_movern=n_movern,
-                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel)
+                           size_format=args.size_format, FigFormat = args.FigFormat, animate=True, keep_pngs=True,parallel=args.parallel))
 
         # make the SA plots
-        SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
-                        show_raw = args.show_SA_raw, show_segments = True, basin_keys = these_basin_keys, parallel=args.parallel)
-        SA.SAPlotDriver(this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
-                        show_raw = args.show_SA_raw, show_segments = False, basin_keys = these_basin_keys, parallel=args.parallel)
+        figure_jobs.append(LSDMW.FigureJob(SA.SAPlotDriver, this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
+                        show_raw = args.show_SA_raw, show_segments = True, basin_keys = these_basin_keys, parallel=args.parallel))
+        figure_jobs.append(LSDMW.FigureJob(SA.SAPlotDriver, this_dir, args.fname_prefix, FigFormat = args.FigFormat,size_format=args.size_format,
+                        show_raw = args.show_SA_raw, show_segments = False, basin_keys = these_basin_keys, parallel=args.parallel))
 
         #summary plots
-        # This function creates a csv that has the concavity statistics in it
-        MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys,
-                                            start_movern=start_movern, d_movern=d_movern,
-                                            n_movern=n_movern, parallel=args.parallel, Chi_disorder=True)
-
-        MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryPlot, this_dir, args.fname_prefix, basin_list=these_basin_keys,start_movern=start_movern,
                                  d_movern=d_movern,
-                                 n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True)
+                                 n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format, show_legend=args.show_legend,parallel=args.parallel, Chi_disorder=True))
 
         # This only prints the summary plots for bootstrap and disorder metrics
-        MN.MakeMOverNSummaryPlot(this_dir, args.fname_prefix, basin_list=these_basin_keys,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryPlot, this_dir, args.fname_prefix, basin_list=these_basin_keys,
                                  start_movern=start_movern, d_movern=d_movern,
                                  n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format,
                                  show_legend=args.show_legend,parallel=args.parallel,
                                  Chi_all = False, SA_raw = False, SA_segmented = False,
-                                 SA_channels = False, Chi_bootstrap = True, Chi_disorder=True)
+                                 SA_channels = False, Chi_bootstrap = True, Chi_disorder=True))
 
-        MN.MakeMOverNSummaryHistogram(this_dir, args.fname_prefix,basin_list=these_basin_keys,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNSummaryHistogram, this_dir, args.fname_prefix,basin_list=these_basin_keys,
                                       start_movern=start_movern, d_movern=d_movern,
-                                      n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True)
+                                      n_movern=n_movern, FigFormat=args.FigFormat, size_format=args.size_format, show_legend=args.show_legend, Chi_disorder=True))
+
 
 
 
@@ -463,24 +479,42 @@ def main(args=None):
         SummaryPrefix = args.fname_prefix+"_movern_summary.csv"
         SummaryFileName = this_dir+"summary_plots/"+SummaryPrefix
         print("The summary filename is: "+SummaryFileName)
-        if os.path.isfile(SummaryFileName):
+        if compute_summary:
+            print("The other plots you asked for make a new summary file, so I will use that one.")
+        elif os.path.isfile(SummaryFileName):
             print("There is already a summary file")
         else:
             print("No summray csv found. I will calculate a new one.")
-            MN.CompareMOverNEstimatesAllMethods(this_dir, args.fname_prefix, basin_list=these_basin_keys,
-                                            start_movern=start_movern, d_movern=d_movern,
-                                            n_movern=n_movern, parallel=args.parallel, Chi_disorder=True)
+            compute_summary = True
 
         # Okay, now we plot the metrics as a function of distance
         print("I am going to print the following lists of basins: ")
         print(basin_stack_list)
 
-        MN.MakeMOverNDisorderDistancePlot(this_dir, args.fname_prefix, basin_list_list=basin_stack_list,
+        summary_jobs.append(LSDMW.FigureJob(MN.MakeMOverNDisorderDistancePlot, this_dir, args.fname_prefix, basin_list_list=basin_stack_list,
                                  start_movern=start_movern, d_movern=d_movern,
                                  n_movern=n_movern, FigFormat = simple_format,size_format=args.size_format,
-                                 show_legend=args.show_legend,parallel=args.parallel,group_names=basin_stack_names)
+                                 show_legend=args.show_legend,parallel=args.parallel,group_names=basin_stack_names))
 
 
+    # The summary plots need the summary csv, so they are run in order as one job
+    if compute_summary:
+        # This function creates a csv that has the concavity statistics in it
+        summary_jobs.insert(0, LSDMW.FigureJob(MN.CompareMOverNEstimatesAllMethods, this_dir, args.fname_prefix, basin_list=these_basin_keys,
+                                               start_movern=start_movern, d_movern=d_movern,
+                                               n_movern=n_movern, parallel=args.parallel, Chi_disorder=True))
+    if len(summary_jobs) > 0:
+        figure_jobs.append(LSDMW.FigureJobSequence(*LSDMW.UniqueFigureJobs(summary_jobs)))
+
+    # Several options ask for the same figures (e.g. the Chi_disorder rasters); make each one once
+    figure_jobs = LSDMW.UniqueFigureJobs(figure_jobs)
+
+    # Now make the figures
+    if args.incremental:
+        manifest_file = this_dir+"figure_manifest.json"
+    else:
+        manifest_file = None
+    LSDMW.RunFigureJobs(figure_jobs, n_jobs = args.jobs, manifest_file = manifest_file)
 
 
 #=============================================================================
@@ -2,7 +2,9 @@
 
 """The setup script."""
 
-from setuptools import setup, find_packages
+import sys
+from setuptools import setup, find_packages, Extension
+from setuptools.command.build_ext import build_ext
 
 with open('README.rst') as readme_file:
     readme = readme_file.read()
@@ -16,6 +18,51 @@ setup_requirements = ['pytest-runner', ]
 
 test_requirements = ['pytest>=3', ]
 
+
+# The fast_hillshade extension is optional. Cython and numpy are build requirements
+# in pyproject.toml, so pip installs them into the build environment; if they aren't
+# there (e.g. an old pip running setup.py directly) or the extension fails to compile
+# we carry on without it: lsdviztools falls back to numpy.
+def get_ext_modules():
+    try:
+        from Cython.Build import cythonize
+        import numpy as np
+    except ImportError:
+        return []
+
+    if sys.platform == 'win32':
+        openmp_flags = ['/openmp']
+        openmp_link_flags = []
+    else:
+        openmp_flags = ['-fopenmp']
+        openmp_link_flags = ['-fopenmp']
+
+    ext_modules = [
+        Extension(
+            'lsdviztools.lsdplottingtools.fast_hillshade',
+            ['lsdviztools/lsdplottingtools/fast_hillshade.pyx'],
+            include_dirs=[np.get_include()],
+            extra_compile_args=openmp_flags,
+            extra_link_args=openmp_link_flags,
+        )
+    ]
+    return cythonize(ext_modules)
+
+
+class OptionalBuildExt(build_ext):
+    """Builds the extensions but doesn't stop the install if they fail."""
+    def run(self):
+        try:
+            build_ext.run(self)
+        except Exception as e:
+            print("Could not build the optional fast_hillshade extension: " + str(e))
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except Exception as e:
+            print("Could not build the optional fast_hillshade extension: " + str(e))
+
 setup(
     author="Simon Marius Mudd",
     author_email='simon.m.mudd@ed.ac.uk',
@@ -44,6 +91,8 @@ setup(
         ],
     },
     install_requires=requirements,
+    ext_modules=get_ext_modules(),
+    cmdclass={'build_ext': OptionalBuildExt},
     license="MIT",
     long_description=readme + '\n\n' + history,
     long_description_content_type='text/x-rst',    
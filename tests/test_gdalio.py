@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+'''
+Tests for the raster readers and the polygoniser in lsdmap_gdalio.
+The rasters are small synthetic ones written to a temporary directory.
+'''
+
+import os
+import numpy as np
+import pytest
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+
+
+def write_envi(path, array, data_type, nodata = -9999, byte_order = 0, resolution = 30.0):
+    """Writes a single band ENVI .bil raster and its header."""
+    dtype = np.dtype(array.dtype).newbyteorder(">" if byte_order == 1 else "<")
+    array.astype(dtype).tofile(path)
+    header_file = os.path.splitext(path)[0]+".hdr"
+    with open(header_file, "w") as f:
+        f.write("ENVI\n")
+        f.write("description = {test raster}\n")
+        f.write("samples = "+str(array.shape[1])+"\n")
+        f.write("lines = "+str(array.shape[0])+"\n")
+        f.write("bands = 1\n")
+        f.write("header offset = 0\n")
+        f.write("file type = ENVI Standard\n")
+        f.write("data type = "+str(data_type)+"\n")
+        f.write("interleave = bil\n")
+        f.write("byte order = "+str(byte_order)+"\n")
+        f.write("map info = {UTM, 1, 1, 500000, 4000000, "+str(resolution)+", "+str(resolution)+", 30, North, WGS-84}\n")
+        if nodata is not None:
+            f.write("data ignore value = "+str(nodata)+"\n")
+    return path
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    LSDMap_IO.ClearRasterCache()
+    yield
+    LSDMap_IO.ClearRasterCache()
+
+
+@pytest.fixture
+def elevation():
+    rng = np.random.RandomState(7)
+    array = (rng.rand(37, 53)*1000).astype(np.float32)
+    array[3, 4] = -9999
+    array[10:12, 20:25] = -9999
+    array[-1, -1] = -9999
+    return array
+
+
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_memmap_matches_gdal_float(tmp_path, elevation, byte_order):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), elevation, 4, byte_order = byte_order)
+
+    gdal_array = LSDMap_IO.ReadRasterArrayBlocks(raster_file, dtype = np.float32)
+    numpy_array = LSDMap_IO.ReadRasterArrayBlocks_numpy(raster_file)
+
+    assert numpy_array.dtype == np.float32
+    assert np.isnan(gdal_array[3, 4])
+    np.testing.assert_array_equal(np.isnan(gdal_array), elevation == -9999)
+    np.testing.assert_array_equal(numpy_array, gdal_array)
+
+
+def test_memmap_matches_gdal_integer(tmp_path):
+    array = np.arange(-20, 20, dtype = np.int16).reshape(5, 8)*100
+    array[0, 0] = -9999
+    raster_file = write_envi(str(tmp_path/"ints.bil"), array, 2)
+
+    gdal_array = LSDMap_IO.ReadRasterArrayBlocks(raster_file)
+    numpy_array = LSDMap_IO.ReadRasterArrayBlocks_numpy(raster_file)
+
+    assert gdal_array.dtype == np.float64
+    assert numpy_array.dtype == np.float64
+    assert np.isnan(numpy_array[0, 0])
+    np.testing.assert_array_equal(numpy_array, gdal_array)
+
+
+def test_memmap_window_matches_gdal(tmp_path, elevation):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), elevation, 4)
+    window = (15, 5, 20, 12)
+
+    gdal_window = LSDMap_IO.ReadRasterArrayBlocks(raster_file, window = window, dtype = np.float32)
+    data_array, NoDataValue = LSDMap_IO.ReadRasterArrayMemmap(raster_file)
+    memmap_window = LSDMap_IO.MemmapWindowToArray(data_array, NoDataValue, window = window)
+
+    assert NoDataValue == -9999
+    assert memmap_window.shape == (12, 20)
+    np.testing.assert_array_equal(memmap_window, gdal_window)
+    np.testing.assert_array_equal(LSDMap_IO.GetNoDataMask(data_array, NoDataValue, window = window),
+                                  np.isnan(gdal_window))
+
+
+def test_memmap_without_nodata_matches_gdal(tmp_path, elevation):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), elevation, 4, nodata = None)
+
+    # NFF_opti has always used -9999 if the header doesn't give a nodata value
+    data_array, NoDataValue = LSDMap_IO.ReadRasterArrayMemmap(raster_file)
+    assert NoDataValue == -9999
+
+    # gdal doesn't, and neither do the figure workers
+    data_array, NoDataValue = LSDMap_IO.ReadRasterArrayMemmap(raster_file, default_nodata = None)
+    assert NoDataValue is None
+    memmap_array = LSDMap_IO.MemmapWindowToArray(data_array, NoDataValue)
+    gdal_array = LSDMap_IO.ReadRasterArrayBlocks(raster_file, dtype = np.float32)
+
+    assert not np.any(np.isnan(gdal_array))
+    np.testing.assert_array_equal(memmap_array, gdal_array)
+
+
+def test_nodata_is_compared_after_conversion(tmp_path):
+    # the pixel isn't exactly the nodata value, but it is once they are both float32 (as gdal compares them)
+    array = np.array([[1.0, -9999.1000001], [2.0, 3.0]])
+    raster_file = write_envi(str(tmp_path/"doubles.bil"), array, 5, nodata = -9999.1)
+
+    data_array, NoDataValue = LSDMap_IO.ReadRasterArrayMemmap(raster_file)
+    memmap_array = LSDMap_IO.MemmapWindowToArray(data_array, NoDataValue, dtype = np.float32)
+    gdal_array = LSDMap_IO.ReadRasterArrayBlocks(raster_file, dtype = np.float32)
+
+    np.testing.assert_array_equal(memmap_array, gdal_array)
+    assert np.isnan(memmap_array[0, 1])
+
+
+@pytest.fixture
+def two_surveys(tmp_path, elevation):
+    rng = np.random.RandomState(17)
+    later = elevation + rng.normal(0, 3, elevation.shape).astype(np.float32)
+    later[elevation == -9999] = -9999
+    later[20, 30] = -9999
+    first_file = write_envi(str(tmp_path/"first.bil"), elevation, 4)
+    later_file = write_envi(str(tmp_path/"later.bil"), later, 4)
+    return first_file, later_file
+
+
+def whole_raster_difference(RasterFile1, RasterFile2):
+    """The differences the mass balance used before it was tiled: both rasters as float64, subtracted in one go."""
+    difference = np.subtract(LSDMap_IO.ReadRasterArrayBlocks(RasterFile1), LSDMap_IO.ReadRasterArrayBlocks(RasterFile2))
+    return difference[np.isfinite(difference)]
+
+
+def test_one_tile_difference_is_the_whole_raster_difference(two_surveys):
+    first_file, later_file = two_surveys
+    expected = whole_raster_difference(later_file, first_file)
+
+    stats = LSDMap_IO.TiledRasterDifference(later_file, first_file, tile_rows = 1000, n_threads = 1)
+
+    assert stats["n_valid"] == expected.size
+    assert stats["sum"] == np.sum(expected)
+    assert stats["cut"] == np.sum(expected[expected < 0])
+    assert stats["fill"] == np.sum(expected[expected > 0])
+    assert stats["min"] == np.min(expected)
+    assert stats["max"] == np.max(expected)
+
+
+@pytest.mark.parametrize("tile_rows, n_threads", [(1, 1), (5, 3), (16, 8)])
+def test_tiled_difference_matches_the_whole_raster(two_surveys, tile_rows, n_threads):
+    first_file, later_file = two_surveys
+    expected = whole_raster_difference(later_file, first_file)
+
+    stats = LSDMap_IO.TiledRasterDifference(later_file, first_file, tile_rows = tile_rows, n_threads = n_threads)
+
+    assert stats["n_valid"] == expected.size
+    assert stats["n_nodata"] == 37*53 - expected.size
+    assert stats["min"] == np.min(expected)
+    assert stats["max"] == np.max(expected)
+    # the tiles are summed separately, so only the rounding can be different
+    assert stats["sum"] == pytest.approx(np.sum(expected), rel = 1e-12)
+    assert stats["cut"] == pytest.approx(np.sum(expected[expected < 0]), rel = 1e-12)
+
+    # and the answer doesn't depend on which thread finishes first
+    assert LSDMap_IO.TiledRasterDifference(later_file, first_file, tile_rows = tile_rows, n_threads = 1) == stats
+
+
+def test_mass_balance_matches_the_whole_raster_version(tmp_path):
+    rng = np.random.RandomState(23)
+    first = (rng.rand(30, 40)*100).astype(np.float32)
+    later = first + rng.normal(0, 1, first.shape).astype(np.float32)
+    write_envi(str(tmp_path/"first.bil"), first, 4)
+    write_envi(str(tmp_path/"later.bil"), later, 4)
+    from lsdviztools.lsdplottingtools import lsdmap_basicmanipulation as LSDMap_BM
+
+    # this is BasicMassBalance before it was tiled
+    Raster1 = LSDMap_IO.ReadRasterArrayBlocks(str(tmp_path/"first.bil"))
+    Raster2 = LSDMap_IO.ReadRasterArrayBlocks(str(tmp_path/"later.bil"))
+    expected = np.sum(np.subtract(Raster2, Raster1))*30.0*30.0
+
+    assert LSDMap_BM.BasicMassBalance(str(tmp_path), "first.bil", "later.bil", tile_rows = 100) == expected
+    assert LSDMap_BM.BasicMassBalance(str(tmp_path), "first.bil", "later.bil", tile_rows = 7) == pytest.approx(expected, rel = 1e-12)
+
+
+def test_difference_raster_is_in_the_native_type(tmp_path, two_surveys):
+    first_file, later_file = two_surveys
+    out_file = str(tmp_path/"difference.bil")
+
+    LSDMap_IO.RasterDifference(later_file, first_file, OutFileName = out_file, tile_rows = 8)
+
+    # the raw float32 values, nodata and all, since the difference raster has no nodata value
+    expected = np.fromfile(later_file, dtype = "<f4") - np.fromfile(first_file, dtype = "<f4")
+    np.testing.assert_array_equal(np.fromfile(out_file, dtype = "<f4"), expected)
+
+
+def test_read_only_arrays_are_shared(tmp_path, elevation):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), elevation, 4)
+
+    first = LSDMap_IO.ReadRasterArrayBlocks(raster_file, read_only = True)
+    second = LSDMap_IO.ReadRasterArrayBlocks(raster_file, read_only = True)
+    assert first is second
+    assert not first.flags.writeable
+
+    mine = LSDMap_IO.ReadRasterArrayBlocks(raster_file)
+    assert mine.flags.writeable
+    mine[0, 0] = 12345
+    assert first[0, 0] != 12345
+
+
+def test_polygonise_keeps_the_largest_polygon_of_each_value(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+    fiona = pytest.importorskip("fiona")
+
+    # basin 1 is a 3x3 block and a separate single pixel, basin 2 is the rest. The bottom row is nodata.
+    basins = np.full((8, 8), 2, dtype = np.int32)
+    basins[0:3, 0:3] = 1
+    basins[6, 7] = 1
+    basins[7, :] = -9999
+    raster_file = str(tmp_path/"basins.tif")
+    with rasterio.open(raster_file, "w", driver = "GTiff", height = 8, width = 8, count = 1, dtype = "int32",
+                       crs = "EPSG:32630", transform = from_origin(500000, 4000000, 10, 10), nodata = -9999) as dst:
+        dst.write(basins, 1)
+
+    DataDirectory = str(tmp_path)+os.sep
+    PolygonDict = LSDMap_IO.PolygoniseRaster(DataDirectory, "basins.tif", "basins.shp")
+
+    assert sorted(PolygonDict.keys()) == [1.0, 2.0]
+    assert PolygonDict[1.0].area == pytest.approx(9*100)
+    with fiona.open(DataDirectory+"basins.shp") as shapefile:
+        ids = sorted(feature["properties"]["ID"] for feature in shapefile)
+    assert ids == [1.0, 2.0]
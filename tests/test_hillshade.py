@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+'''
+Tests for the hillshade engine in lsdmap_hillshade. The hillshades are checked
+against the formulas the python and LSDRaster hillshades have always used.
+'''
+
+import numpy as np
+import pytest
+from lsdviztools.lsdplottingtools import lsdmap_hillshade as LSDMap_HS
+
+
+def original_hillshade(array, resolution, azimuth = 315, angle_altitude = 45, z_factor = 1):
+    """The hillshade from lsdmap_basicplotting.Hillshade before it used the hillshade engine."""
+    array = array.astype(float)
+    array[array < 0] = np.nan
+    x, y = np.true_divide(np.gradient(array), float(resolution))
+    slope = np.pi/2. - np.arctan(np.multiply(z_factor, np.sqrt(x*x + y*y)))
+    aspect = np.arctan2(-x, y)
+    azimuthrad = azimuth*np.pi / 180.
+    altituderad = angle_altitude*np.pi / 180.
+    shaded = np.sin(altituderad) * np.sin(slope) + np.cos(altituderad) * np.cos(slope) * np.cos(azimuthrad - aspect)
+    return 255*(shaded + 1)/2
+
+
+def original_horn_hillshade(array, resolution, azimuth = 315, angle_altitude = 45, z_factor = 1):
+    """The LSDRaster hillshade, one pixel at a time, as in fast_hillshade.pyx."""
+    zenith_rad = (90 - angle_altitude) * np.pi / 180.0
+    azimuth_math = 360 - azimuth + 90
+    if azimuth_math >= 360.0:
+        azimuth_math = azimuth_math - 360
+    azimuth_rad = azimuth_math * np.pi / 180.0
+
+    t = array.astype(float)
+    t[t < 0] = np.nan
+    hs = np.full(t.shape, np.nan)
+    for i in range(1, t.shape[0]-1):
+        for j in range(1, t.shape[1]-1):
+            dzdx = (((t[i+1, j-1] + 2*t[i+1, j] + t[i+1, j+1]) -
+                     (t[i-1, j-1] + 2*t[i-1, j] + t[i-1, j+1])) / (8 * resolution))
+            dzdy = (((t[i-1, j+1] + 2*t[i, j+1] + t[i+1, j+1]) -
+                     (t[i-1, j-1] + 2*t[i, j-1] + t[i+1, j-1])) / (8 * resolution))
+            slope_rad = np.arctan(z_factor * np.sqrt(dzdx*dzdx + dzdy*dzdy))
+            aspect_rad = np.arctan2(dzdy, -dzdx)
+            value = 255.0 * (np.cos(zenith_rad) * np.cos(slope_rad) +
+                             np.sin(zenith_rad) * np.sin(slope_rad) * np.cos(azimuth_rad - aspect_rad))
+            hs[i, j] = max(value, 0) if not np.isnan(value) else np.nan
+    return hs
+
+
+@pytest.fixture
+def dem():
+    rng = np.random.RandomState(3)
+    x, y = np.meshgrid(np.arange(40)*10.0, np.arange(30)*10.0)
+    array = 300 + 80*np.sin(x/70.0)*np.cos(y/50.0) + rng.normal(0, 2, x.shape)
+    array[12, 17] = -9999
+    return array
+
+
+@pytest.mark.parametrize("azimuth, angle_altitude, z_factor", [(315, 45, 1), (90, 30, 2.5), (200, 60, 0.5)])
+def test_matches_original_hillshade(dem, azimuth, angle_altitude, z_factor):
+    expected = original_hillshade(dem, 10.0, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor)
+    hs = LSDMap_HS.HillshadeArray(dem, 10.0, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor)
+
+    assert hs.dtype == np.float64
+    np.testing.assert_allclose(hs, expected, rtol = 0, atol = 1e-9, equal_nan = True)
+
+
+def test_float32_is_close(dem):
+    expected = original_hillshade(dem, 10.0)
+    hs = LSDMap_HS.HillshadeArray(dem, 10.0, dtype = np.float32)
+
+    assert hs.dtype == np.float32
+    np.testing.assert_allclose(hs, expected, rtol = 0, atol = 1e-2, equal_nan = True)
+
+
+@pytest.mark.parametrize("azimuth, angle_altitude, z_factor", [(315, 45, 1), (90, 30, 2.5)])
+def test_horn_matches_lsdraster(dem, azimuth, angle_altitude, z_factor):
+    expected = original_horn_hillshade(dem, 10.0, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor)
+    hs = LSDMap_HS.HillshadeArray(dem, 10.0, azimuth = azimuth, angle_altitude = angle_altitude, z_factor = z_factor,
+                                  method = "horn")
+
+    np.testing.assert_allclose(hs, expected, rtol = 0, atol = 1e-9, equal_nan = True)
+
+
+def test_input_is_not_modified(dem):
+    original = dem.copy()
+    LSDMap_HS.HillshadeArray(dem, 10.0)
+    np.testing.assert_array_equal(dem, original)
+
+
+@pytest.mark.parametrize("method", ["zevenbergen_thorne", "horn"])
+def test_cython_backend_matches_numpy(dem, method):
+    hs_numpy = LSDMap_HS.HillshadeArray(dem, 10.0, method = method)
+    # if the extension isn't built this falls back to numpy, which also has to give the same answer
+    hs_cython = LSDMap_HS.HillshadeArray(dem, 10.0, method = method, backend = "cython")
+
+    np.testing.assert_allclose(hs_cython, hs_numpy, rtol = 0, atol = 1e-9, equal_nan = True)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        LSDMap_HS.HillshadeArray(np.ones((4, 4)), 1.0, method = "sobel")
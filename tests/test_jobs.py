@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+'''
+Tests for running figure jobs with lsdmapwrappers_jobs: failures, job keys and the manifest.
+The job functions are at module level so they can be sent to the worker processes.
+'''
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib import colors
+import numpy as np
+import os
+import pytest
+from lsdviztools.lsdmapwrappers import lsdmapwrappers_jobs as LSDMW_J
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+from tests.test_gdalio import write_envi
+
+
+def write_text(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return text
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def draw(cmap = None, norm = None):
+    return None
+
+
+def write_maximum(raster_file, path):
+    # gdal reads the raster, so python's open never sees it
+    return write_text(path, str(np.nanmax(LSDMap_IO.ReadRasterArrayBlocks(raster_file, read_only = True))))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_failed_job_does_not_stop_the_others(tmp_path, n_jobs):
+    first = str(tmp_path/"first.txt")
+    last = str(tmp_path/"last.txt")
+    jobs = [LSDMW_J.FigureJob(write_text, first, "a"),
+            LSDMW_J.FigureJob(fail, "boom"),
+            LSDMW_J.FigureJob(write_text, last, "b")]
+
+    with pytest.raises(Exception) as error:
+        LSDMW_J.RunFigureJobs(jobs, n_jobs = n_jobs)
+
+    assert "fail" in str(error.value)
+    assert os.path.exists(first)
+    assert os.path.exists(last)
+
+
+def test_results_are_in_job_order(tmp_path):
+    jobs = [LSDMW_J.FigureJob(write_text, str(tmp_path/(str(n)+".txt")), str(n)) for n in range(5)]
+    assert LSDMW_J.RunFigureJobs(jobs, n_jobs = 2) == ["0", "1", "2", "3", "4"]
+
+
+def test_manifest_keeps_finished_jobs_after_a_failure(tmp_path):
+    output = str(tmp_path/"output.txt")
+    manifest_file = str(tmp_path/"figure_manifest.json")
+    jobs = [LSDMW_J.FigureJob(write_text, output, "a"), LSDMW_J.FigureJob(fail, "boom")]
+
+    with pytest.raises(Exception):
+        LSDMW_J.RunFigureJobs(jobs, manifest_file = manifest_file)
+    assert os.path.exists(manifest_file)
+
+    # the job that worked is skipped the next time, since its output is still there
+    assert LSDMW_J.RunFigureJobs(jobs[:1], manifest_file = manifest_file) == [None]
+
+    # and run again if its output goes missing
+    os.remove(output)
+    assert LSDMW_J.RunFigureJobs(jobs[:1], manifest_file = manifest_file) == ["a"]
+
+
+def test_job_keys_of_colourmaps_and_norms():
+    job1 = LSDMW_J.FigureJob(draw, cmap = plt.get_cmap("viridis"), norm = colors.Normalize(vmin = 0, vmax = 10))
+    job2 = LSDMW_J.FigureJob(draw, cmap = plt.get_cmap("viridis"), norm = colors.Normalize(vmin = 0, vmax = 10))
+    job3 = LSDMW_J.FigureJob(draw, cmap = plt.get_cmap("viridis"), norm = colors.Normalize(vmin = 0, vmax = 20))
+
+    assert LSDMW_J.GetFigureJobKey(job1) == LSDMW_J.GetFigureJobKey(job2)
+    assert LSDMW_J.GetFigureJobKey(job1) != LSDMW_J.GetFigureJobKey(job3)
+    assert len(LSDMW_J.UniqueFigureJobs([job1, job2, job3])) == 2
+
+
+def test_jobs_that_cannot_be_keyed_are_always_kept():
+    job = LSDMW_J.FigureJob(draw, cmap = object())
+    with pytest.raises(Exception):
+        LSDMW_J.GetFigureJobKey(job)
+    assert len(LSDMW_J.UniqueFigureJobs([job, job])) == 2
+
+
+def test_rasters_are_recorded_inside_a_recorder(tmp_path):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), np.ones((4, 5), dtype = np.float32), 4)
+    header_file = str(tmp_path/"dem.hdr")
+
+    LSDMap_IO.ReadRasterArrayBlocks(raster_file, read_only = True)
+    with LSDMap_IO.FileRecorder() as recorder:
+        # this one comes from the raster cache, but it is still a read
+        LSDMap_IO.ReadRasterArrayBlocks(raster_file, read_only = True)
+    LSDMap_IO.RecordFileRead(str(tmp_path/"after.bil"))
+
+    assert recorder.inputs == {raster_file, header_file}
+    assert recorder.outputs == set()
+    assert not LSDMap_IO.IsRecordingFiles()
+
+
+def test_job_is_run_again_when_its_raster_changes(tmp_path):
+    raster_file = write_envi(str(tmp_path/"dem.bil"), np.ones((4, 5), dtype = np.float32), 4)
+    output = str(tmp_path/"maximum.txt")
+    manifest_file = str(tmp_path/"figure_manifest.json")
+    jobs = [LSDMW_J.FigureJob(write_maximum, raster_file, output)]
+
+    assert LSDMW_J.RunFigureJobs(jobs, manifest_file = manifest_file) == ["1.0"]
+    assert LSDMW_J.RunFigureJobs(jobs, manifest_file = manifest_file) == [None]
+
+    write_envi(raster_file, np.full((4, 5), 2, dtype = np.float32), 4)
+    os.utime(raster_file, ns = (0, os.stat(raster_file).st_mtime_ns+10**9))
+    assert LSDMW_J.RunFigureJobs(jobs, manifest_file = manifest_file) == ["2.0"]
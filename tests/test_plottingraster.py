@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+'''
+Tests for the rasters and map figures in plottingraster. The rasters are small
+synthetic ENVI rasters written to a temporary directory.
+'''
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib import colors
+import numpy as np
+import os
+import pytest
+from lsdviztools.lsdmapfigure import plottingraster as LSDMF_PR
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+from tests.test_gdalio import write_envi
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    LSDMap_IO.ClearRasterCache()
+    yield
+    LSDMap_IO.ClearRasterCache()
+
+
+@pytest.fixture
+def raster(tmp_path):
+    rng = np.random.RandomState(13)
+    array = (rng.rand(20, 30)*1000).astype(np.float32)
+    array[2, 3] = -9999
+    write_envi(str(tmp_path/"dem.bil"), array, 4)
+    return LSDMF_PR.BaseRaster("dem.bil", str(tmp_path)+os.sep)
+
+
+def colour_map(raster, norm, cmap = "gray"):
+    """The image get_rgba should give, worked out from scratch."""
+    A = np.ma.masked_invalid(raster._RasterArray)
+    rgba = plt.get_cmap(cmap)(norm(A), bytes = True)
+    rgba[np.ma.getmaskarray(A),3] = 0
+    return rgba
+
+
+#==============================================================================
+# Raster statistics
+#==============================================================================
+@pytest.mark.parametrize("block_pixels", [2**20, 7])
+def test_stats_match_numpy(block_pixels):
+    rng = np.random.RandomState(19)
+    array = rng.randint(0, 50, size = (40, 25)).astype(np.float64)
+    array[5, :] = np.nan
+    array[10:20, 3] = np.nan
+    valid = array[~np.isnan(array)]
+
+    stats = LSDMF_PR.RasterStats(array, block_pixels = block_pixels)
+
+    assert stats.count == valid.size
+    assert stats.min == valid.min()
+    assert stats.max == valid.max()
+    assert stats.mean == pytest.approx(valid.mean(), rel = 1e-12)
+    np.testing.assert_array_equal(stats.unique, np.unique(valid))
+    np.testing.assert_array_equal(stats.percentile([5, 50, 95]), np.percentile(valid, [5, 50, 95]))
+    counts, edges = stats.histogram(bins = 10)
+    np.testing.assert_array_equal(counts, np.histogram(valid, bins = 10, range = (valid.min(), valid.max()))[0])
+
+
+def test_stats_of_an_empty_raster():
+    stats = LSDMF_PR.RasterStats(np.full((3, 4), np.nan))
+    assert stats.count == 0
+    assert np.isnan(stats.min) and np.isnan(stats.max)
+    assert stats.unique.size == 0
+
+
+def test_stats_are_kept_until_the_array_changes(raster):
+    first = raster.stats
+    assert raster.stats is first
+
+    raster.clip_raster_values(100, 500)
+    clipped = raster.stats
+    assert clipped is not first
+    assert clipped.min == 100
+    assert clipped.max == 500
+    assert raster.stats is clipped
+
+    raster._RasterArray = np.ones((2, 2))
+    assert raster.stats.count == 4
+
+
+def test_copies_keep_their_own_stats(raster):
+    first = raster.stats
+    other = raster.copy()
+    other.replace_raster_values([raster.stats.max], [-1])
+
+    assert raster.stats is first
+    assert other.stats.min == -1
+
+
+#==============================================================================
+# The cache of colour mapped images
+#==============================================================================
+def test_get_rgba_does_not_change_the_norm(raster):
+    norm = colors.Normalize()
+    rgba, used_norm = raster.get_rgba(norm = norm)
+
+    assert norm.vmin is None and norm.vmax is None
+    assert used_norm.vmin == raster.stats.min
+    assert used_norm.vmax == raster.stats.max
+
+
+def test_equal_norms_share_the_cached_image(raster):
+    first, norm = raster.get_rgba(norm = colors.Normalize(vmin = 0, vmax = 500))
+    second, norm = raster.get_rgba(norm = colors.Normalize(vmin = 0, vmax = 500))
+    assert first is second
+
+
+@pytest.mark.parametrize("norm1, norm2", [
+    (colors.BoundaryNorm([0, 300, 1000], 256), colors.BoundaryNorm([0, 700, 1000], 256)),
+    (colors.TwoSlopeNorm(200, vmin = 0, vmax = 1000), colors.TwoSlopeNorm(800, vmin = 0, vmax = 1000)),
+    (colors.SymLogNorm(10, vmin = 0, vmax = 1000), colors.SymLogNorm(100, vmin = 0, vmax = 1000)),
+    (colors.PowerNorm(0.5, vmin = 0, vmax = 1000), colors.PowerNorm(2, vmin = 0, vmax = 1000))])
+def test_norms_with_the_same_limits_get_their_own_image(raster, norm1, norm2):
+    rgba1, used_norm1 = raster.get_rgba(norm = norm1)
+    rgba2, used_norm2 = raster.get_rgba(norm = norm2)
+
+    np.testing.assert_array_equal(rgba1, colour_map(raster, norm1))
+    np.testing.assert_array_equal(rgba2, colour_map(raster, norm2))
+    assert not np.array_equal(rgba1, rgba2)
+
+
+def test_web_tile_layers_are_keyed_by_the_whole_norm(raster):
+    from lsdviztools.lsdmapfigure import webtiles
+
+    layer1 = webtiles.TileLayer(raster, norm = colors.BoundaryNorm([0, 300, 1000], 256))
+    layer2 = webtiles.TileLayer(raster, norm = colors.BoundaryNorm([0, 700, 1000], 256))
+    layer3 = webtiles.TileLayer(raster, norm = colors.BoundaryNorm([0, 700, 1000], 256))
+
+    assert layer1.key != layer2.key
+    assert layer2.key == layer3.key
+
+
+#==============================================================================
+# Rendering batches of figures from one MapFigure
+#==============================================================================
+@pytest.fixture
+def map_figure(tmp_path):
+    rng = np.random.RandomState(29)
+    write_envi(str(tmp_path/"dem.bil"), (rng.rand(20, 30)*1000).astype(np.float32), 4)
+    write_envi(str(tmp_path/"slope.bil"), rng.rand(20, 30).astype(np.float32), 4)
+    MF = LSDMF_PR.MapFigure("dem.bil", str(tmp_path)+os.sep, coord_type = "UTM_km", colourbar_location = "None")
+    yield MF
+    plt.close(MF.fig)
+
+
+def figure_state(MF):
+    """The parts of a MapFigure that adding layers changes."""
+    map_ax = MF.ax_list[0]
+    return (len(MF.fig.axes), len(MF.ax_list), len(map_ax.get_children()), len(MF._RasterList),
+            len(MF._DrawnLayers), MF.title, MF.colourbar_location, map_ax.get_title(),
+            [MF._xmin, MF._xmax, MF._ymin, MF._ymax])
+
+
+def slope_drape(tmp_path):
+    return ["add_drape_image", {"RasterName": "slope.bil", "Directory": str(tmp_path)+os.sep,
+                                "colourmap": "viridis", "show_colourbar": True}]
+
+
+def test_render_figures_puts_the_base_layers_back(tmp_path, map_figure):
+    before = figure_state(map_figure)
+    FigFileName = str(tmp_path/"slope.png")
+
+    names = map_figure.render_figures([{"FigFileName": FigFileName, "layers": [slope_drape(tmp_path)],
+                                        "colourbar_location": "right", "plot_title": "Slope"}])
+
+    assert names == [FigFileName]
+    assert os.path.exists(FigFileName)
+    assert figure_state(map_figure) == before
+
+
+def test_figures_do_not_see_each_others_layers(tmp_path, map_figure):
+    spec = {"FigFileName": str(tmp_path/"base.png")}
+    map_figure.render_figures([spec])
+    alone = plt.imread(spec["FigFileName"])
+
+    map_figure.render_figures([{"FigFileName": str(tmp_path/"slope.png"), "layers": [slope_drape(tmp_path)],
+                                "colourbar_location": "right"}, spec])
+    after_a_drape = plt.imread(spec["FigFileName"])
+
+    np.testing.assert_array_equal(after_a_drape, alone)
+
+
+def test_figure_that_fails_is_removed_too(tmp_path, map_figure):
+    def fail(MF):
+        raise ValueError("no layer")
+
+    before = figure_state(map_figure)
+    with pytest.raises(ValueError):
+        map_figure.render_figures([{"FigFileName": str(tmp_path/"failed.png"),
+                                    "layers": [slope_drape(tmp_path), [fail, {}]]}])
+
+    assert figure_state(map_figure) == before
+    assert not os.path.exists(str(tmp_path/"failed.png"))
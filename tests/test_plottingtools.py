@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+'''
+Tests for some of the array routines in lsdplottingtools: remapping raster values,
+projecting point data, binning points onto a grid and the overlap search used to place labels.
+'''
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.transforms import Bbox
+import numpy as np
+import pandas
+import pytest
+from lsdviztools.lsdplottingtools import lsdmap_basicmanipulation as LSDMap_BM
+from lsdviztools.lsdplottingtools import lsdmap_pointtools as LSDMap_PD
+import lsdviztools.lsdplottingtools.adjust_text as AT
+
+
+#==============================================================================
+# RemapRasterValues
+#==============================================================================
+def remap_one_value_at_a_time(array, old_values, new_values):
+    """Replaces the values one at a time, comparing with the original array so nothing is replaced twice."""
+    result = array.copy()
+    done = set()
+    for old, new in zip(old_values, new_values):
+        if old in done:
+            continue
+        done.add(old)
+        result[array == old] = new
+    return result
+
+
+def test_remap_swaps_values():
+    array = np.array([[1, 2, 3], [2, 1, 3]], dtype = np.int32)
+    LSDMap_BM.RemapRasterValues(array, [1, 2], [2, 1])
+    np.testing.assert_array_equal(array, [[2, 1, 3], [1, 2, 3]])
+
+
+def test_remap_first_repeat_wins():
+    array = np.array([5, 6, 7], dtype = np.int64)
+    LSDMap_BM.RemapRasterValues(array, [6, 6], [60, 600])
+    np.testing.assert_array_equal(array, [5, 60, 7])
+
+
+@pytest.mark.parametrize("max_lut_size", [2**24, 0])
+def test_remap_lookup_table_and_search_agree(max_lut_size):
+    rng = np.random.RandomState(11)
+    array = rng.randint(-50, 200, size = (60, 70)).astype(np.int32)
+    old_values = rng.choice(np.arange(-100, 300), 80, replace = False)
+    new_values = rng.randint(-1000, 1000, size = 80)
+
+    expected = remap_one_value_at_a_time(array, old_values, new_values)
+    result = LSDMap_BM.RemapRasterValues(array.copy(), old_values, new_values, max_lut_size = max_lut_size)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_remap_float_raster_leaves_nan_alone():
+    array = np.array([1.5, np.nan, 2.5, -9999.0, 1.5])
+    LSDMap_BM.RemapRasterValues(array, [1.5, np.nan, -9999.0], [10.0, 20.0, 30.0])
+    np.testing.assert_array_equal(array, [10.0, np.nan, 2.5, 30.0, 10.0])
+
+
+def test_remap_needs_matching_lists():
+    with pytest.raises(Exception):
+        LSDMap_BM.RemapRasterValues(np.zeros(3), [1, 2], [1])
+
+
+#==============================================================================
+# The projected coordinates of point data
+#==============================================================================
+EPSG_string = "EPSG:32630"
+
+
+@pytest.fixture
+def point_data():
+    rng = np.random.RandomState(37)
+    n = 200
+    data = pandas.DataFrame({"latitude": 36 + rng.rand(n)*0.1,
+                             "longitude": -3.1 + rng.rand(n)*0.1,
+                             "basin_key": rng.randint(0, 5, n),
+                             "elevation": rng.rand(n)*1000})
+    return data, LSDMap_PD.LSDMap_PointData(data, data_type = "pandas")
+
+
+def project(data):
+    """The coordinates worked out from scratch."""
+    transformer = LSDMap_PD.GetTransformerFromWGS84(EPSG_string)
+    return transformer.transform(np.asarray(data["longitude"]), np.asarray(data["latitude"]))
+
+
+class NoTransform(object):
+    def transform(self, *args):
+        raise AssertionError("the points were projected again")
+
+
+def test_points_are_projected_once(point_data, monkeypatch):
+    data, points = point_data
+    easting, northing = points.GetUTMEastingNorthing(EPSG_string)
+    expected_easting, expected_northing = project(data)
+    np.testing.assert_array_equal(easting, expected_easting)
+    np.testing.assert_array_equal(northing, expected_northing)
+
+    # you get your own copy, so changing it doesn't change the next one
+    easting[:] = 0
+    monkeypatch.setattr(LSDMap_PD, "GetTransformerFromWGS84", lambda EPSG_string: NoTransform())
+    easting, northing = points.GetUTMEastingNorthing(EPSG_string)
+    np.testing.assert_array_equal(easting, expected_easting)
+
+
+@pytest.mark.parametrize("thin", [lambda points: points.ThinDataSelection("basin_key", [1, 3]),
+                                  lambda points: points.ThinData("elevation", 500),
+                                  lambda points: points.ThinDataFromKey("basin_key", [2])])
+def test_thinning_keeps_the_coordinates_of_the_points_that_are_left(point_data, monkeypatch, thin):
+    data, points = point_data
+    points.GetUTMEastingNorthing(EPSG_string)
+
+    thin(points)
+    expected_easting, expected_northing = project(points.PointData)
+    assert 0 < len(expected_easting) < len(data)
+
+    monkeypatch.setattr(LSDMap_PD, "GetTransformerFromWGS84", lambda EPSG_string: NoTransform())
+    easting, northing = points.GetUTMEastingNorthing(EPSG_string)
+    np.testing.assert_array_equal(easting, expected_easting)
+    np.testing.assert_array_equal(northing, expected_northing)
+
+
+def test_new_coordinates_are_projected_again(point_data):
+    data, points = point_data
+    points.GetUTMEastingNorthing(EPSG_string)
+
+    points.Latitude = points.Latitude + 0.01
+    easting, northing = points.GetUTMEastingNorthing(EPSG_string)
+
+    moved = data.assign(latitude = data["latitude"] + 0.01)
+    expected_easting, expected_northing = project(moved)
+    np.testing.assert_array_equal(northing, expected_northing)
+
+
+#==============================================================================
+# AggregatePointsToGrid
+#==============================================================================
+@pytest.fixture
+def points():
+    # a 2x2 grid of 10 m pixels, from (0,0) to (20,20)
+    easting = np.array([2.0, 4.0, 6.0, 15.0, 15.0, 5.0, 25.0])
+    northing = np.array([15.0, 16.0, 17.0, 15.0, 5.0, 5.0, 5.0])
+    values = np.array([1.0, 2.0, 6.0, 4.0, np.nan, 7.0, 100.0])
+    return easting, northing, values
+
+
+@pytest.mark.parametrize("reduction, expected", [("mean", [[3.0, 4.0], [7.0, np.nan]]),
+                                                 ("max", [[6.0, 4.0], [7.0, np.nan]]),
+                                                 ("min", [[1.0, 4.0], [7.0, np.nan]]),
+                                                 ("sum", [[9.0, 4.0], [7.0, np.nan]]),
+                                                 ("count", [[3.0, 1.0], [1.0, 1.0]])])
+def test_aggregate_points(points, reduction, expected):
+    easting, northing, values = points
+    grid = LSDMap_PD.AggregatePointsToGrid(easting, northing, values, [0, 20, 0, 20], 2, 2, reduction = reduction)
+    # the first row is the north, and the point outside the grid is ignored
+    np.testing.assert_array_equal(grid, expected)
+
+
+def test_aggregate_empty_grid():
+    grid = LSDMap_PD.AggregatePointsToGrid([], [], [], [0, 1, 0, 1], 3, 4, reduction = "max")
+    assert grid.shape == (3, 4)
+    assert np.all(np.isnan(grid))
+
+
+def test_aggregate_unknown_reduction(points):
+    easting, northing, values = points
+    with pytest.raises(Exception):
+        LSDMap_PD.AggregatePointsToGrid(easting, northing, values, [0, 20, 0, 20], 2, 2, reduction = "median")
+
+
+#==============================================================================
+# The overlap search in adjust_text
+#==============================================================================
+def random_extents(rng, n, size = 1.0, span = 20.0):
+    x0 = rng.rand(n)*span
+    y0 = rng.rand(n)*span
+    return np.column_stack([x0, y0, x0+rng.rand(n)*size*2, y0+rng.rand(n)*size])
+
+
+def overlapping_pairs(extents1, extents2):
+    """Every pair of boxes that intersect (touching counts), found by checking them all."""
+    pairs = set()
+    for i, e1 in enumerate(extents1):
+        for j, e2 in enumerate(extents2):
+            if min(e1[2], e2[2]) >= max(e1[0], e2[0]) and min(e1[3], e2[3]) >= max(e1[1], e2[1]):
+                pairs.add((i, j))
+    return pairs
+
+
+@pytest.mark.parametrize("n1, n2", [(50, 50), (200, 30), (1, 80)])
+def test_candidate_pairs_include_every_overlap(n1, n2):
+    rng = np.random.RandomState(n1+n2)
+    extents1 = random_extents(rng, n1)
+    extents2 = random_extents(rng, n2)
+
+    i, j = AT.get_candidate_pairs(extents1, extents2)
+    candidates = list(zip(i.tolist(), j.tolist()))
+
+    assert len(candidates) == len(set(candidates))
+    assert overlapping_pairs(extents1, extents2) <= set(candidates)
+
+
+def test_candidate_pairs_of_points_and_empty_sets():
+    extents = np.array([[0.0, 0.0, 2.0, 2.0], [5.0, 5.0, 6.0, 6.0]])
+    points = np.array([[1.0, 1.0, 1.0, 1.0], [9.0, 9.0, 9.0, 9.0]])
+    i, j = AT.get_candidate_pairs(extents, points)
+    assert (0, 0) in set(zip(i.tolist(), j.tolist()))
+
+    i, j = AT.get_candidate_pairs(extents, np.zeros((0, 4)))
+    assert len(i) == 0 and len(j) == 0
+
+
+def original_repel_text(bboxes):
+    """repel_text before the grid search: every box against the corners of every box."""
+    xmins = [bbox.xmin for bbox in bboxes]
+    xmaxs = [bbox.xmax for bbox in bboxes]
+    ymaxs = [bbox.ymax for bbox in bboxes]
+    ymins = [bbox.ymin for bbox in bboxes]
+    overlaps_x = np.zeros((len(bboxes), len(bboxes)))
+    overlaps_y = np.zeros_like(overlaps_x)
+    directions_x = np.zeros_like(overlaps_x)
+    directions_y = np.zeros_like(overlaps_x)
+    for i, bbox1 in enumerate(bboxes):
+        overlaps = AT.get_points_inside_bbox(np.array(xmins*2+xmaxs*2), np.array((ymins+ymaxs)*2), bbox1) % len(bboxes)
+        for j in np.unique(overlaps):
+            bbox2 = bboxes[j]
+            x, y = bbox1.intersection(bbox1, bbox2).size
+            overlaps_x[i, j] = x
+            overlaps_y[i, j] = y
+            direction = np.sign(bbox1.extents - bbox2.extents)[:2]
+            directions_x[i, j] = direction[0]
+            directions_y[i, j] = direction[1]
+    return (overlaps_x*directions_x).sum(axis=1), (overlaps_y*directions_y).sum(axis=1)
+
+
+def original_repel_text_from_bboxes(add_bboxes, bboxes):
+    """repel_text_from_bboxes before the grid search: every text box against every other box."""
+    overlaps_x = np.zeros((len(bboxes), len(add_bboxes)))
+    overlaps_y = np.zeros_like(overlaps_x)
+    directions_x = np.zeros_like(overlaps_x)
+    directions_y = np.zeros_like(overlaps_x)
+    for i, bbox1 in enumerate(bboxes):
+        for j, bbox2 in enumerate(add_bboxes):
+            intersection = bbox1.intersection(bbox1, bbox2)
+            if intersection is None:
+                continue
+            x, y = intersection.size
+            direction = np.sign(bbox1.extents - bbox2.extents)[:2]
+            overlaps_x[i, j] = x
+            overlaps_y[i, j] = y
+            directions_x[i, j] = direction[0]
+            directions_y[i, j] = direction[1]
+    return (overlaps_x*directions_x).sum(axis=1), (overlaps_y*directions_y).sum(axis=1)
+
+
+@pytest.fixture
+def labelled_axes():
+    rng = np.random.RandomState(5)
+    fig, ax = plt.subplots(figsize = (4, 4), dpi = 100)
+    ax.set_xlim(0, 10)
+    ax.set_ylim(0, 10)
+    texts = [ax.text(x, y, "label "+str(n)) for n, (x, y) in enumerate(rng.rand(60, 2)*9)]
+    renderer = AT.get_renderer(fig)
+    yield ax, texts, renderer
+    plt.close(fig)
+
+
+def test_repel_text_matches_original(labelled_axes):
+    ax, texts, renderer = labelled_axes
+    bboxes = AT.get_bboxes(texts, renderer, (1.2, 1.2), ax)
+
+    delta_x, delta_y, q = AT.repel_text(texts, renderer = renderer, ax = ax)
+    expected_x, expected_y = original_repel_text(bboxes)
+
+    np.testing.assert_allclose(delta_x, expected_x, rtol = 1e-12, atol = 1e-12)
+    np.testing.assert_allclose(delta_y, expected_y, rtol = 1e-12, atol = 1e-12)
+
+
+def test_repel_text_from_bboxes_matches_original(labelled_axes):
+    ax, texts, renderer = labelled_axes
+    rng = np.random.RandomState(9)
+    add_bboxes = [Bbox.from_extents(*extents) for extents in random_extents(rng, 40, size = 1.0, span = 9.0)]
+    bboxes = AT.get_bboxes(texts, renderer, (1.2, 1.2), ax)
+
+    delta_x, delta_y, q = AT.repel_text_from_bboxes(add_bboxes, texts, renderer = renderer, ax = ax)
+    expected_x, expected_y = original_repel_text_from_bboxes(add_bboxes, bboxes)
+
+    np.testing.assert_allclose(delta_x, expected_x, rtol = 1e-12, atol = 1e-12)
+    np.testing.assert_allclose(delta_y, expected_y, rtol = 1e-12, atol = 1e-12)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+'''
+Tests for the basin polygons in lsdmap_vectortools, and the GeoPackage they are saved in.
+The basin rasters are small synthetic ENVI rasters written to a temporary directory.
+'''
+
+import numpy as np
+import os
+import pytest
+
+pytest.importorskip("geopandas")
+pytest.importorskip("rasterio")
+
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+from lsdviztools.lsdplottingtools import lsdmap_vectortools as LSDMap_VT
+from tests.test_gdalio import write_envi
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    LSDMap_IO.ClearRasterCache()
+    LSDMap_VT._BasinPolygonCache.clear()
+    yield
+    LSDMap_IO.ClearRasterCache()
+    LSDMap_VT._BasinPolygonCache.clear()
+
+
+@pytest.fixture
+def polygonise_calls(monkeypatch):
+    calls = []
+    PolygoniseRaster = LSDMap_IO.PolygoniseRaster
+    def counting_polygonise(*args, **kwargs):
+        calls.append(args)
+        return PolygoniseRaster(*args, **kwargs)
+    monkeypatch.setattr(LSDMap_IO, "PolygoniseRaster", counting_polygonise)
+    return calls
+
+
+def write_basins(DataDirectory, split_column):
+    """Two basins, split at split_column, with a row of nodata at the bottom."""
+    basins = np.full((6, 8), 2, dtype = np.int32)
+    basins[:, :split_column] = 1
+    basins[-1, :] = -9999
+    return write_envi(DataDirectory+"basins.bil", basins, 3, resolution = 10.0)
+
+
+def polygonise_again(DataDirectory, use_sidecar = True):
+    """Gets the basins as a new process would: without the ones kept in memory."""
+    LSDMap_VT._BasinPolygonCache.clear()
+    return LSDMap_VT.GetBasinPolygons(DataDirectory, "basins.bil", use_sidecar = use_sidecar)
+
+
+def test_nothing_is_saved_by_default(tmp_path, polygonise_calls):
+    DataDirectory = str(tmp_path)+os.sep
+    write_basins(DataDirectory, 3)
+
+    polygonise_again(DataDirectory, use_sidecar = False)
+    these_basins = LSDMap_VT.GetBasinPolygons(DataDirectory, "basins.bil")
+
+    assert not os.path.exists(DataDirectory+"basins_BasinPolygons.gpkg")
+    assert len(polygonise_calls) == 1
+    assert these_basins.areas[1.0] == pytest.approx(3*5*100)
+
+
+def test_unchanged_raster_is_not_hashed(tmp_path, polygonise_calls, monkeypatch):
+    DataDirectory = str(tmp_path)+os.sep
+    write_basins(DataDirectory, 3)
+    first = polygonise_again(DataDirectory)
+    assert os.path.exists(DataDirectory+"basins_BasinPolygons.gpkg")
+
+    def fail(FileName):
+        raise AssertionError("the raster was hashed")
+    monkeypatch.setattr(LSDMap_VT, "GetRasterContentHash", fail)
+    second = polygonise_again(DataDirectory)
+
+    assert len(polygonise_calls) == 1
+    assert second.areas == first.areas
+
+
+def test_touched_raster_is_hashed_and_still_read(tmp_path, polygonise_calls):
+    DataDirectory = str(tmp_path)+os.sep
+    raster_file = write_basins(DataDirectory, 3)
+    first = polygonise_again(DataDirectory)
+
+    os.utime(raster_file, ns = (0, os.stat(raster_file).st_mtime_ns+10**9))
+    second = polygonise_again(DataDirectory)
+
+    assert len(polygonise_calls) == 1
+    assert second.areas == first.areas
+
+
+def test_changed_raster_is_polygonised_again(tmp_path, polygonise_calls):
+    DataDirectory = str(tmp_path)+os.sep
+    raster_file = write_basins(DataDirectory, 3)
+    polygonise_again(DataDirectory)
+
+    # the same size, so only the modification time and the contents give it away
+    write_basins(DataDirectory, 5)
+    os.utime(raster_file, ns = (0, os.stat(raster_file).st_mtime_ns+10**9))
+    these_basins = polygonise_again(DataDirectory)
+
+    assert len(polygonise_calls) == 2
+    assert these_basins.areas[1.0] == pytest.approx(5*5*100)
+
+    # and the new basins are the ones that were saved
+    polygonise_again(DataDirectory)
+    assert len(polygonise_calls) == 2
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+'''
+Tests for the web map tiles in webtiles: redrawing only the tiles that have changed
+and deleting the ones that are no longer covered. The rasters are small synthetic
+ENVI rasters written to a temporary directory.
+'''
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import colors
+import numpy as np
+import glob
+import json
+import os
+import pytest
+
+pytest.importorskip("pyproj")
+
+from lsdviztools.lsdmapfigure import plottingraster as LSDMF_PR
+from lsdviztools.lsdmapfigure import webtiles
+from lsdviztools.lsdplottingtools import lsdmap_gdalio as LSDMap_IO
+from tests.test_gdalio import write_envi
+
+# at this zoom a tile is a couple of hundred metres across, so the test rasters cover a few of them
+ZOOM = 17
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    LSDMap_IO.ClearRasterCache()
+    yield
+    LSDMap_IO.ClearRasterCache()
+
+
+@pytest.fixture
+def dem():
+    rng = np.random.RandomState(31)
+    return (rng.rand(20, 30)*1000).astype(np.float32)
+
+
+def write_raster(tmp_path, fname, array):
+    """Writes the raster, making sure its modification time changes if it is written again."""
+    raster_file = str(tmp_path/fname)
+    old_mtime = os.stat(raster_file).st_mtime_ns if os.path.exists(raster_file) else 0
+    write_envi(raster_file, array, 4)
+    os.utime(raster_file, ns = (0, max(os.stat(raster_file).st_mtime_ns, old_mtime+10**9)))
+    return LSDMF_PR.BaseRaster(fname, str(tmp_path)+os.sep)
+
+
+def export(raster, tile_directory, norm = None, min_zoom = ZOOM, max_zoom = ZOOM):
+    layer = webtiles.TileLayer(raster, norm = norm)
+    return webtiles.WriteWebTiles([layer], tile_directory, min_zoom = min_zoom, max_zoom = max_zoom, n_threads = 2)
+
+
+def tiles_on_disk(tile_directory):
+    """The zoom/x/y of every tile file, and of every tile with a stored hash (empty tiles have no file)."""
+    files = set()
+    for tile_file in glob.glob(os.path.join(tile_directory, "*", "*", "*.png")):
+        zoom, x, name = os.path.relpath(tile_file, tile_directory).split(os.sep)
+        files.add(zoom+"/"+x+"/"+os.path.splitext(name)[0])
+    with open(os.path.join(tile_directory, "tile_inputs.json")) as f:
+        hashes = set(json.load(f).keys())
+    return files, hashes
+
+
+def test_unchanged_layers_are_not_drawn_again(tmp_path, dem):
+    tile_directory = str(tmp_path/"tiles")
+    raster = write_raster(tmp_path, "dem.bil", dem)
+
+    n_tiles = export(raster, tile_directory)
+    assert n_tiles > 4
+    assert export(raster, tile_directory) == 0
+
+    # a new BaseRaster of the same file is the same layer
+    assert export(LSDMF_PR.BaseRaster("dem.bil", str(tmp_path)+os.sep), tile_directory) == 0
+
+
+def test_changed_pixel_only_redraws_the_tiles_that_show_it(tmp_path, dem):
+    tile_directory = str(tmp_path/"tiles")
+    n_tiles = export(write_raster(tmp_path, "dem.bil", dem), tile_directory)
+
+    dem[0, 0] = dem[0, 0] + 100
+    n_redrawn = export(write_raster(tmp_path, "dem.bil", dem), tile_directory)
+
+    assert 0 < n_redrawn < n_tiles
+
+
+def test_changed_colours_redraw_every_tile(tmp_path, dem):
+    tile_directory = str(tmp_path/"tiles")
+    raster = write_raster(tmp_path, "dem.bil", dem)
+    n_tiles = export(raster, tile_directory)
+
+    assert export(raster, tile_directory, norm = colors.Normalize(vmin = 0, vmax = 2000)) == n_tiles
+
+
+def test_tiles_that_are_no_longer_covered_are_deleted(tmp_path, dem):
+    tile_directory = str(tmp_path/"tiles")
+    export(write_raster(tmp_path, "dem.bil", dem), tile_directory)
+    files, hashes = tiles_on_disk(tile_directory)
+    assert files <= hashes
+
+    # the same raster cut down to its north west corner
+    export(write_raster(tmp_path, "dem.bil", np.ascontiguousarray(dem[:5, :5])), tile_directory)
+    fewer_files, fewer_hashes = tiles_on_disk(tile_directory)
+
+    assert fewer_files <= fewer_hashes
+    assert len(fewer_files) > 0
+    assert fewer_hashes < hashes
+
+
+def test_zoom_levels_that_are_not_made_any_more_are_deleted(tmp_path, dem):
+    tile_directory = str(tmp_path/"tiles")
+    raster = write_raster(tmp_path, "dem.bil", dem)
+    export(raster, tile_directory, min_zoom = ZOOM-1, max_zoom = ZOOM)
+
+    assert export(raster, tile_directory) == 0
+    files, hashes = tiles_on_disk(tile_directory)
+    assert files <= hashes
+    assert all(name.startswith(str(ZOOM)+"/") for name in hashes)